@@ -1,8 +1,11 @@
-from fastapi import FastAPI, Depends, HTTPException
-from pydantic import BaseModel
-from sqlmodel import Session, select
-from typing import Optional, List
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
+from sqlmodel import Session, select, update, delete, func, tuple_
+from typing import Any, Dict, Optional, List
+from datetime import datetime
 import uuid
+import base64
+import binascii
 import os
 import requests
 from dotenv import load_dotenv
@@ -10,14 +13,68 @@ from schemas_pantry import IngredientSearchRequest, RecipeSummary
 
 load_dotenv()
 
-from better_agent import workflow as recipe_workflow
-from database import get_session, create_db_and_tables
-from models import User, PantryItem
-from tools import search_youtube_videos
-import random
+from better_agent import invoke_with_deadline, run_extraction, Recipe as RecipeContent, with_parsed_amounts
+from deadline import DeadlineExceeded, deadline_after, time_left
+from database import get_session, get_async_session, create_db_and_tables
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models import User, PantryItem, Recipe as SavedRecipe
+from video_feed import build_video_feed
+from recipe_details import get_recipe_information, get_recipes_information, prefetch_recipes, to_app_recipe
+from tools import ingredient_image_url
+from warmup import start_warmup, warmup_status
+from single_flight import single_flight_stats
+from rate_limit import RateLimited, rate_limit_stats
+from resilience import gemini_request_options, guarded, resilience_stats
+from recipe_registry import SAVED_PREFIX, forget_saved_recipe
+from recipe_search import search_saved_recipes
+from shopping_list import build_shopping_list
+from nutrition import compute_nutrition
+from pantry_matcher import ensure_owner_loaded, find_recipes, index_saved_recipe, index_extracted_recipe, remove_recipe
+from quantities import merge_amounts, normalize_amount
+from ingredients import canonical_ingredient
+from user_cache import (
+    UserProfile, get_user_profile, put_user_profile,
+    publish_user_invalidation, start_invalidation_listener
+)
+from fastapi.concurrency import run_in_threadpool
 
 app = FastAPI()
 
+@app.on_event("startup")
+def start_background_jobs():
+    # Tables and pending migrations (every worker runs this; migrations hold a lock)
+    create_db_and_tables()
+    # Cross-worker invalidation for the user profile cache (no-op outside Postgres)
+    start_invalidation_listener()
+    # Preload popular topics/ingredients/recipes within the warm-up budget
+    start_warmup()
+
+# --- Health ---
+@app.get("/health")
+def health():
+    return {"status": "ok", "warmup": warmup_status()}
+
+@app.get("/metrics")
+def upstream_metrics():
+    """Upstream client state: circuit breakers and latency per host, rate-limit budgets, request coalescing."""
+    return {
+        "breakers": resilience_stats(),
+        "rate_limits": rate_limit_stats(),
+        "single_flight": single_flight_stats(),
+    }
+
+@app.get("/health/ready")
+def readiness(response: Response):
+    """503 while the cache warm-up is still running (for startup probes)."""
+    status = warmup_status()
+    if not status["ready"]:
+        response.status_code = 503
+    return {"ready": status["ready"], "warmup": status}
+
+@app.post("/warmup")
+def trigger_warmup():
+    return start_warmup()
+
 # Keys are loaded from environment variables (Cloud Run or .env file)
 # os.environ["GOOGLE_API_KEY"] and "GEMINI_API_KEY" should be set in the environment.
 
@@ -48,6 +105,36 @@ class PantryItemCreate(BaseModel):
     amount: Optional[str] = None
     image_url: Optional[str] = None
 
+class PantryBulkItem(BaseModel):
+    name: str
+    amount: Optional[str] = None
+    image_url: Optional[str] = None
+
+class PantryBulkAddRequest(BaseModel):
+    user_id: uuid.UUID
+    items: List[PantryBulkItem]
+
+class PantryBulkDeleteRequest(BaseModel):
+    user_id: uuid.UUID
+    item_ids: List[int]
+
+class ShoppingListRequest(BaseModel):
+    user_id: uuid.UUID
+    recipe_ids: List[int] = [] # Saved recipe ids
+    recipes: List[dict] = [] # Recipe payloads (e.g. straight from /extract_recipe)
+
+class NutritionRequest(BaseModel):
+    recipe: Optional[Dict[str, Any]] = None
+    recipe_ref: Optional[str] = None # From /chat/recipes or "saved:<id>", replaces 'recipe'
+    servings: int = Field(default=1, ge=1)
+    user_id: Optional[uuid.UUID] = None # Required for "saved:<id>" refs (must be the owner)
+
+class SaveRecipeRequest(BaseModel):
+    user_id: uuid.UUID
+    recipe: dict # Recipe as returned by /extract_recipe
+    source_url: Optional[str] = None # Defaults to recipe["source"]
+    image_url: Optional[str] = None # Defaults to recipe["source_image"]
+
 # --- Auth Endpoints ---
 @app.post("/signup", response_model=AuthResponse)
 def signup(request: SignupRequest, session: Session = Depends(get_session)):
@@ -90,25 +177,31 @@ def signin(request: SigninRequest, session: Session = Depends(get_session)):
     )
 
 @app.post("/users/preferences")
-def update_preferences(request: UpdatePreferencesRequest, session: Session = Depends(get_session)):
+async def update_preferences(request: UpdatePreferencesRequest, session: AsyncSession = Depends(get_async_session)):
     print(f"--- Update Preferences Request ---")
     print(f"User ID: {request.user_id}")
     print(f"Preferences: {request.preferences}")
     
     try:
-        user = session.get(User, request.user_id)
-        if not user:
+        # Single UPDATE ... RETURNING the cached projection (no full row load)
+        result = await session.exec(
+            update(User)
+            .where(User.id == request.user_id)
+            .values(preferences=request.preferences, updated_at=datetime.utcnow())
+            .returning(User.id, User.username, User.preferences)
+        )
+        row = result.first()
+        if not row:
             print(f"User not found: {request.user_id}")
             raise HTTPException(status_code=404, detail="User not found")
+
+        await publish_user_invalidation(session, request.user_id)
+        await session.commit()
+        profile = UserProfile(id=row[0], username=row[1], preferences=row[2] or [])
+        put_user_profile(profile)
         
-        print(f"Found user: {user.email}")
-        user.preferences = request.preferences
-        session.add(user)
-        session.commit()
-        session.refresh(user)
-        
-        print(f"Preferences updated successfully: {user.preferences}")
-        return {"message": "Preferences updated", "preferences": user.preferences}
+        print(f"Preferences updated successfully: {profile.preferences}")
+        return {"message": "Preferences updated", "preferences": profile.preferences}
     except HTTPException:
         raise
     except Exception as e:
@@ -119,57 +212,23 @@ def update_preferences(request: UpdatePreferencesRequest, session: Session = Dep
 
 
 @app.get("/users/preferences/{user_id}")
-def get_preferences(user_id: uuid.UUID, session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
-    if not user:
+async def get_preferences(user_id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
+    profile = await get_user_profile(session, user_id)
+    if not profile:
         raise HTTPException(status_code=404, detail="User not found")
         
-    return {"preferences": user.preferences}
+    return {"preferences": profile.preferences}
 
 
 # --- Video Recommendation Endpoint ---
 @app.get("/recommendations/videos/{user_id}")
-def get_video_recommendations(user_id: uuid.UUID, session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
-    if not user:
+async def get_video_recommendations(user_id: uuid.UUID, session: AsyncSession = Depends(get_async_session)):
+    profile = await get_user_profile(session, user_id)
+    if not profile:
         raise HTTPException(status_code=404, detail="User not found")
     
-    preferences = user.preferences if user.preferences else []
-    all_videos = []
-    seen_links = set()
-
-    # Strategy: diverse sampling
-    # If user has > 3 preferences, pick 3 random ones to mix.
-    # If <= 3, use all of them.
-    if len(preferences) > 3:
-        target_prefs = random.sample(preferences, 3)
-    else:
-        target_prefs = preferences
-
-    # Prepare queries
-    queries = []
-    if not target_prefs:
-        queries.append("chicken recipes")
-    else:
-        for p in target_prefs:
-            queries.append(f"{p} recipes")
-
-    print(f"Fetching videos for topics: {queries}")
-
-    # Fetch and Aggregate
-    for q in queries:
-        # We fetch ~5 videos per topic
-        videos = search_youtube_videos(q, limit=5)
-        
-        # Check if output is a list (tool returns list on success)
-        if isinstance(videos, list):
-            for v in videos:
-                if v.get('link') and v['link'] not in seen_links:
-                    all_videos.append(v)
-                    seen_links.add(v['link'])
-    
-    # Shuffle results to mix "Italian" and "Dessert" videos together
-    random.shuffle(all_videos)
+    # Per-topic results come from the shared topic cache; blocking SerpAPI calls stay off the event loop
+    all_videos = await run_in_threadpool(build_video_feed, user_id, profile.preferences)
 
     return {"videos": all_videos} # Added missing return statement
 
@@ -178,52 +237,366 @@ def get_video_recommendations(user_id: uuid.UUID, session: Session = Depends(get
 
 
 # --- Pantry Endpoints ---
+def _encode_cursor(created_at: datetime, item_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{item_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, item_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/pantry/{user_id}")
-def get_pantry_items(user_id: uuid.UUID, session: Session = Depends(get_session)):
-    items = session.exec(select(PantryItem).where(PantryItem.user_id == user_id).order_by(PantryItem.created_at.desc())).all()
+async def get_pantry_items(
+    user_id: uuid.UUID,
+    http_request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Lists a user's pantry, newest first.
+    - ETag / If-None-Match: 304 when nothing changed since the client's copy.
+    - limit + cursor: keyset pagination on (created_at, id); the next page's cursor is in X-Next-Cursor.
+    - since: delta mode, only items added/updated after that watermark (X-Pantry-Watermark).
+      Deletes don't show up in a delta; a changed X-Pantry-Count tells the client to reload fully.
+    """
+    # Pantry version: one aggregate over the (user_id, ...) covering index
+    version = await session.exec(
+        select(func.count(PantryItem.id), func.max(PantryItem.updated_at), func.max(PantryItem.id))
+        .where(PantryItem.user_id == user_id)
+    )
+    count, watermark, max_id = version.one()
+    etag = f'W/"{count}-{watermark.timestamp() if watermark else 0}-{max_id or 0}"'
+
+    headers = {"ETag": etag, "X-Pantry-Count": str(count)}
+    if watermark:
+        headers["X-Pantry-Watermark"] = watermark.isoformat()
+    if http_request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    statement = select(PantryItem).where(PantryItem.user_id == user_id)
+    if since is not None:
+        statement = statement.where(PantryItem.updated_at > since)
+    if cursor:
+        cursor_created, cursor_id = _decode_cursor(cursor)
+        statement = statement.where(tuple_(PantryItem.created_at, PantryItem.id) < tuple_(cursor_created, cursor_id))
+    statement = statement.order_by(PantryItem.created_at.desc(), PantryItem.id.desc())
+    if limit:
+        # Fetch one extra row to know whether there is a next page
+        statement = statement.limit(limit + 1)
+
+    result = await session.exec(statement)
+    items = result.all()
+    if limit and len(items) > limit:
+        items = items[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(items[-1].created_at, items[-1].id)
     return items
 
 @app.post("/pantry/add")
-def add_pantry_item(item: PantryItemCreate, session: Session = Depends(get_session)):
+async def add_pantry_item(item: PantryItemCreate, session: AsyncSession = Depends(get_async_session)):
+    parsed = normalize_amount(item.amount)
     new_item = PantryItem(
         user_id=item.user_id,
         name=item.name,
         amount=item.amount,
+        amount_value=parsed[0] if parsed else None,
+        amount_unit=parsed[1] if parsed else None,
         image_url=item.image_url
     )
     session.add(new_item)
-    session.commit()
-    session.refresh(new_item)
+    await session.commit()
+    await session.refresh(new_item)
     return new_item
 
 @app.delete("/pantry/{item_id}")
-def delete_pantry_item(item_id: int, session: Session = Depends(get_session)):
-    item = session.get(PantryItem, item_id)
+async def delete_pantry_item(item_id: int, session: AsyncSession = Depends(get_async_session)):
+    item = await session.get(PantryItem, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
-    session.delete(item)
-    session.commit()
+    await session.delete(item)
+    await session.commit()
     return {"message": "Item deleted"}
 
+@app.post("/pantry/bulk_add")
+async def bulk_add_pantry_items(request: PantryBulkAddRequest, session: AsyncSession = Depends(get_async_session)):
+    """
+    Inserts or merges a whole list of items (e.g. a pantry scan) in one transaction.
+    Items matching an existing pantry entry by normalized name have their amounts combined.
+    Returns the resulting rows.
+    """
+    result = await session.exec(select(PantryItem).where(PantryItem.user_id == request.user_id))
+    by_key = {canonical_ingredient(row.name): row for row in result.all()}
+
+    touched = {}
+    now = datetime.utcnow()
+    for item in request.items:
+        key = canonical_ingredient(item.name)
+        if not key:
+            continue
+        row = by_key.get(key)
+        if row:
+            row.amount = merge_amounts(row.amount, item.amount, key)
+            row.image_url = row.image_url or item.image_url
+            row.updated_at = now
+        else:
+            row = PantryItem(
+                user_id=request.user_id,
+                name=item.name.strip(),
+                amount=item.amount,
+                image_url=item.image_url
+            )
+            by_key[key] = row
+        parsed = normalize_amount(row.amount)
+        row.amount_value, row.amount_unit = parsed if parsed else (None, None)
+        session.add(row)
+        touched[key] = row
+
+    # expire_on_commit=False keeps the rows (and their new ids) usable after commit
+    await session.commit()
+    return list(touched.values())
+
+@app.post("/pantry/bulk_delete")
+async def bulk_delete_pantry_items(request: PantryBulkDeleteRequest, session: AsyncSession = Depends(get_async_session)):
+    """Deletes several of a user's pantry items in one statement."""
+    if not request.item_ids:
+        return {"message": "Items deleted", "deleted": 0}
+    result = await session.exec(
+        delete(PantryItem).where(PantryItem.user_id == request.user_id, PantryItem.id.in_(request.item_ids))
+    )
+    await session.commit()
+    return {"message": "Items deleted", "deleted": result.rowcount}
+
+# --- Saved Recipe Library ---
+# Reopening a saved recipe is one indexed read instead of a new extraction run.
+# Recipes are deduped per user by source_url (ux_recipe_user_source).
+
+@app.post("/recipes/saved")
+async def save_recipe(request: SaveRecipeRequest, session: AsyncSession = Depends(get_async_session)):
+    """Saves an extracted recipe. Saving the same source_url again updates the existing copy."""
+    try:
+        content = with_parsed_amounts(RecipeContent(**request.recipe))
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Invalid recipe: {e}")
+
+    source_url = request.source_url or content.source
+    image_url = request.image_url or content.source_image
+
+    existing = None
+    if source_url:
+        result = await session.exec(
+            select(SavedRecipe).where(SavedRecipe.user_id == request.user_id, SavedRecipe.source_url == source_url)
+        )
+        existing = result.first()
+
+    if existing:
+        existing.title = content.name
+        existing.content_json = content.model_dump()
+        existing.image_url = image_url or existing.image_url
+        saved, created = existing, False
+    else:
+        saved = SavedRecipe(
+            user_id=request.user_id,
+            title=content.name,
+            content_json=content.model_dump(),
+            source_url=source_url,
+            image_url=image_url
+        )
+        created = True
+    session.add(saved)
+    await session.commit()
+    await session.refresh(saved)
+    forget_saved_recipe(saved.id)
+    index_saved_recipe(saved.id, saved.user_id, saved.title, saved.content_json, saved.image_url, saved.source_url)
+
+    return {"id": saved.id, "created": created, "recipe_ref": f"{SAVED_PREFIX}{saved.id}"}
+
+@app.get("/recipes/saved/{user_id}")
+async def list_saved_recipes(
+    user_id: uuid.UUID,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Lists a user's saved recipes, newest first, without content_json
+    (served from the ix_recipe_user_created covering index). Next page cursor in X-Next-Cursor.
+    """
+    statement = select(
+        SavedRecipe.id, SavedRecipe.title, SavedRecipe.image_url, SavedRecipe.source_url, SavedRecipe.created_at
+    ).where(SavedRecipe.user_id == user_id)
+    if cursor:
+        cursor_created, cursor_id = _decode_cursor(cursor)
+        statement = statement.where(tuple_(SavedRecipe.created_at, SavedRecipe.id) < tuple_(cursor_created, cursor_id))
+    statement = statement.order_by(SavedRecipe.created_at.desc(), SavedRecipe.id.desc()).limit(limit + 1)
+
+    result = await session.exec(statement)
+    rows = result.all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [
+        {"id": r.id, "title": r.title, "image_url": r.image_url, "source_url": r.source_url, "created_at": r.created_at}
+        for r in rows
+    ]
+
+@app.get("/recipes/saved/{user_id}/search")
+def search_saved_recipes_endpoint(
+    user_id: uuid.UUID,
+    q: str = "",
+    ingredient: List[str] = Query([]),
+    limit: int = Query(10, ge=1, le=50),
+    session: Session = Depends(get_session)
+):
+    """
+    Ranked full-text search over the user's saved recipes (titles, ingredients, steps).
+    Terms are prefix-matched; each 'ingredient' filter must match an ingredient name.
+    """
+    if not q.strip() and not ingredient:
+        raise HTTPException(status_code=400, detail="Provide 'q' and/or 'ingredient'")
+    return search_saved_recipes(session, user_id, q, ingredient, limit)
+
+@app.get("/recipes/saved/{user_id}/{recipe_id}")
+async def get_saved_recipe(user_id: uuid.UUID, recipe_id: int, session: AsyncSession = Depends(get_async_session)):
+    """Full saved recipe, plus a 'recipe_ref' to start a cooking chat without re-sending it."""
+    saved = await session.get(SavedRecipe, recipe_id)
+    if not saved or saved.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    return {
+        "id": saved.id,
+        "title": saved.title,
+        "source_url": saved.source_url,
+        "image_url": saved.image_url,
+        "created_at": saved.created_at,
+        "recipe": saved.content_json,
+        "recipe_ref": f"{SAVED_PREFIX}{saved.id}"
+    }
+
+@app.delete("/recipes/saved/{user_id}/{recipe_id}")
+async def delete_saved_recipe(user_id: uuid.UUID, recipe_id: int, session: AsyncSession = Depends(get_async_session)):
+    result = await session.exec(
+        delete(SavedRecipe).where(SavedRecipe.id == recipe_id, SavedRecipe.user_id == user_id)
+    )
+    await session.commit()
+    if not result.rowcount:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    forget_saved_recipe(recipe_id)
+    remove_recipe(f"{SAVED_PREFIX}{recipe_id}")
+    return {"message": "Recipe deleted"}
+
+# --- Shopping List ---
+@app.post("/shopping_list")
+def get_shopping_list(request: ShoppingListRequest, session: Session = Depends(get_session)):
+    """
+    Diffs one or more recipes (saved ids and/or payloads) against the user's pantry.
+    Returns missing items with shortfall amounts, covered items, and items whose
+    amounts can't be compared. Computed locally, no model call.
+    """
+    recipes = []
+    for payload in request.recipes:
+        try:
+            content = RecipeContent(**payload)
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Invalid recipe: {e}")
+        recipes.append((content.name, content.ingredients))
+
+    if request.recipe_ids:
+        rows = session.exec(
+            select(SavedRecipe.id, SavedRecipe.title, SavedRecipe.content_json)
+            .where(SavedRecipe.user_id == request.user_id, SavedRecipe.id.in_(request.recipe_ids))
+        ).all()
+        unknown = set(request.recipe_ids) - {row.id for row in rows}
+        if unknown:
+            raise HTTPException(status_code=404, detail=f"Saved recipes not found: {sorted(unknown)}")
+        recipes += [(row.title, (row.content_json or {}).get("ingredients", [])) for row in rows]
+
+    if not recipes:
+        raise HTTPException(status_code=400, detail="Provide 'recipe_ids' and/or 'recipes'")
+
+    pantry = session.exec(
+        select(PantryItem.name, PantryItem.amount, PantryItem.amount_value, PantryItem.amount_unit)
+        .where(PantryItem.user_id == request.user_id)
+    ).all()
+
+    result = build_shopping_list(recipes, pantry)
+    result["recipes"] = [title for title, _ in recipes]
+    return result
+
+# --- Nutrition ---
+@app.post("/nutrition")
+def get_nutrition(request: NutritionRequest):
+    """
+    Per-serving nutrition for a recipe, computed from the bundled nutrient table
+    and the parsed ingredient amounts. No Spoonacular or model call.
+    """
+    if not request.recipe_ref and not request.recipe:
+        raise HTTPException(status_code=400, detail="Provide 'recipe' or 'recipe_ref'")
+    recipe_obj = _resolve_chat_recipe(request.recipe_ref, request.recipe, request.user_id)
+    if recipe_obj is None:
+        raise HTTPException(status_code=422, detail="Invalid recipe")
+    return {"name": recipe_obj.name, **compute_nutrition(recipe_obj.ingredients, request.servings)}
+
 # --- Existing Recipe Extraction ---
+def _index_extracted(recipe, user_id=None) -> None:
+    """Makes a freshly extracted recipe available to its user's pantry matches (and /chat by recipe_ref)."""
+    if recipe is None or user_id is None:
+        return
+    try:
+        data = recipe.model_dump() if hasattr(recipe, "model_dump") else recipe
+        ref, recipe_obj = register_recipe(data)
+        index_extracted_recipe(ref, recipe_obj, user_id)
+    except Exception as e:
+        print(f"Warning: Could not index extracted recipe: {e}")
+
 class VideoRequest(BaseModel):
     video_url: str
+    user_id: Optional[uuid.UUID] = None # If set, a recipe the user already saved from this URL is returned as-is
+    timeout_seconds: Optional[float] = Field(None, gt=0) # Time budget; defaults to EXTRACTION_DEADLINE, capped at EXTRACTION_MAX_DEADLINE
+
+def _extraction_result(final_state: dict, deadline: float, user_id=None):
+    """The extracted recipe (possibly with skipped_enrichments); 504 if time ran out before there was one."""
+    recipe = final_state.get('recipe')
+    if recipe is None and time_left(deadline) <= 0:
+        raise HTTPException(status_code=504, detail="Recipe extraction ran out of time")
+    _index_extracted(recipe, user_id)
+    return recipe or {}
 
 @app.post("/extract_recipe")
-def extract_recipe(request: VideoRequest):
-    initial_state = {"url": request.video_url}
+def extract_recipe(request: VideoRequest, session: Session = Depends(get_session)):
+    if request.user_id:
+        saved = session.exec(
+            select(SavedRecipe.content_json)
+            .where(SavedRecipe.user_id == request.user_id, SavedRecipe.source_url == request.video_url)
+        ).first()
+        if saved:
+            print(f"--- Returning saved recipe for {request.video_url} ---")
+            return saved
+
+    deadline = deadline_after(request.timeout_seconds)
     try:
-        final_state = recipe_workflow.invoke(initial_state)
-        return final_state.get('recipe',{})
+        final_state = run_extraction(request.video_url, deadline)
+        return _extraction_result(final_state, deadline, request.user_id)
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         print(f"Error executing workflow: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-from fastapi import File, UploadFile
+from fastapi import File, Form, UploadFile
 import shutil
 
 @app.post("/extract_recipe_image")
-def extract_recipe_image(file: UploadFile = File(...)):
+def extract_recipe_image(file: UploadFile = File(...), user_id: Optional[uuid.UUID] = Form(None)):
+    deadline = deadline_after()
     try:
         # Save the uploaded file temporarily
         temp_filename = f"temp_upload_{file.filename}"
@@ -236,17 +609,24 @@ def extract_recipe_image(file: UploadFile = File(...)):
         initial_state = {"url": abs_path}
         
         # Invoke agent
-        final_state = recipe_workflow.invoke(initial_state)
+        final_state = invoke_with_deadline(initial_state, deadline)
         
         # Clean up is done by agent usually, but we can verify later
-        
-        return final_state.get('recipe', {})
+        return _extraction_result(final_state, deadline, user_id)
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
          print(f"Error processing image: {e}")
          raise HTTPException(status_code=500, detail=str(e))
 
 # --- New Cooking Chat ---
 from chef_agent import graph as chef_workflow
+from fast_path import try_fast_path
+from recipe_registry import InvalidSavedRecipe, register_recipe, get_recipe as get_registered_recipe
+from image_cache import store_image, get_image_url
+from fastapi import Form
 from langchain_core.messages import HumanMessage
 from typing import Dict, Any
 
@@ -255,37 +635,71 @@ class ChatRequest(BaseModel):
     message: str
     thread_id: str
     recipe: Optional[Dict[str, Any]] = None # Full recipe object, optional for general chat
+    recipe_ref: Optional[str] = None # Reference from /chat/recipes (or "saved:<id>"), replaces 'recipe'
     current_step: int # 0-indexed step
-    image_data: Optional[str] = None # Base64 encoded image
+    image_data: Optional[str] = None # Base64 encoded image (prefer /chat/multipart)
+    image_ref: Optional[str] = None # Image sent earlier in this thread
+    user_id: Optional[uuid.UUID] = None # Lets the chef search the user's saved recipes; required for "saved:<id>" refs
 
-@app.post("/chat")
-def chat_endpoint(request: ChatRequest):
-    print(f"--- Chat Request: {request.message} (Step {request.current_step}) ---")
-    
-    # 1. Construct State
-    # Convert dict back to Recipe object logic is handled by Pydantic inside the node usually,
-    # but since our AgentState expects a 'Recipe' object (Pydantic model) and we get a Dict,
-    # we might need to rely on the node to handle it or convert it here.
-    # The chef_node currently does: recipe = state.get("recipe")
-    # We should pass the dict, and let's ensure chef_node handles dict access OR convert it here.
-    # For simplicity, we pass the dict and if our chef_agent expects a Pydantic object, we convert it there 
-    # OR we convert it here.
-    # Let's convert it here for type safety if better_agent is available.
-    
-    from better_agent import Recipe
-    recipe_obj = None
-    if request.recipe:
+@app.post("/chat/recipes")
+def register_chat_recipe(recipe: Dict[str, Any]):
+    """
+    Registers a recipe for a cooking session and returns its 'recipe_ref'.
+    Later /chat turns send the ref instead of the full recipe.
+    """
+    try:
+        ref, _ = register_recipe(recipe)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Invalid recipe: {e}")
+    return {"recipe_ref": ref}
+
+def _resolve_chat_recipe(
+    recipe_ref: Optional[str], recipe: Optional[Dict[str, Any]] = None, user_id: Optional[uuid.UUID] = None
+):
+    """
+    Recipes are parsed once and cached: either referenced by 'recipe_ref'
+    (see /chat/recipes; "saved:<id>" only for its owner 'user_id') or registered
+    on the fly from the full 'recipe' dict.
+    """
+    if recipe_ref:
+        try:
+            recipe_obj = get_registered_recipe(recipe_ref, user_id)
+        except InvalidSavedRecipe as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if recipe_obj is None:
+            raise HTTPException(status_code=404, detail="Unknown recipe_ref, register the recipe again")
+        return recipe_obj
+    if recipe:
         try:
-            recipe_obj = Recipe(**request.recipe)
+            _, recipe_obj = register_recipe(recipe)
+            return recipe_obj
         except Exception as e:
             print(f"Warning: Could not parse recipe object: {e}")
-            recipe_obj = None
+    return None
+
+def _run_chat(
+    message: str, thread_id: str, current_step: int, recipe_obj,
+    image_ref: Optional[str] = None, user_id: Optional[uuid.UUID] = None
+):
+    """Runs one chat turn (fast path or chef graph) and returns the response dict."""
+    if image_ref and get_image_url(thread_id, image_ref) is None:
+        raise HTTPException(status_code=404, detail="Unknown image_ref, send the image again")
+
+    # Timers, unit conversions and scaling are answered locally (no LLM call).
+    # Photos always go to the chef since they need vision.
+    if not image_ref:
+        fast_response = try_fast_path(message, recipe_obj)
+        if fast_response:
+            print("--- Chat answered by fast path ---")
+            return fast_response.model_dump()
 
     initial_state = {
-        "messages": [HumanMessage(content=request.message)],
+        "messages": [HumanMessage(content=message)],
         "recipe": recipe_obj,
-        "current_step": request.current_step,
-        "image_data": request.image_data
+        "current_step": current_step,
+        "thread_id": thread_id,
+        "image_ref": image_ref,
+        "user_id": str(user_id) if user_id else None
     }
     
     # 2. Invoke Chef Agent
@@ -301,6 +715,9 @@ def chat_endpoint(request: ChatRequest):
         import json
         response_data = json.loads(response_json_str)
         
+        # Let the client reference the stored image on later turns
+        if image_ref:
+            response_data["image_ref"] = image_ref
         return response_data
         
     except Exception as e:
@@ -309,71 +726,85 @@ def chat_endpoint(request: ChatRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat")
+def chat_endpoint(request: ChatRequest):
+    print(f"--- Chat Request: {request.message} (Step {request.current_step}) ---")
+    
+    # 1. Construct State
+    recipe_obj = _resolve_chat_recipe(request.recipe_ref, request.recipe, request.user_id)
+
+    image_ref = request.image_ref
+    if request.image_data:
+        # Legacy base64 upload: decode once and store downscaled for this thread
+        try:
+            image_ref = store_image(request.thread_id, base64.b64decode(request.image_data))
+        except (binascii.Error, ValueError):
+            raise HTTPException(status_code=400, detail="image_data is not valid base64")
+
+    return _run_chat(request.message, request.thread_id, request.current_step, recipe_obj, image_ref, request.user_id)
+
+@app.post("/chat/multipart")
+async def chat_multipart_endpoint(
+    message: str = Form(...),
+    thread_id: str = Form(...),
+    current_step: int = Form(0),
+    recipe_ref: Optional[str] = Form(None),
+    image_ref: Optional[str] = Form(None),
+    user_id: Optional[uuid.UUID] = Form(None),
+    file: Optional[UploadFile] = File(None),
+):
+    """
+    Same as /chat, but takes the photo as a raw binary part (no base64 overhead).
+    The image is stored per thread; send the returned 'image_ref' on later turns.
+    """
+    print(f"--- Chat Request (multipart): {message} (Step {current_step}) ---")
+    # Saved refs read the database and images are decoded/downscaled: both block, so off the loop
+    recipe_obj = await run_in_threadpool(_resolve_chat_recipe, recipe_ref, None, user_id)
+
+    if file is not None:
+        image_ref = await run_in_threadpool(store_image, thread_id, await file.read())
+
+    return await run_in_threadpool(_run_chat, message, thread_id, current_step, recipe_obj, image_ref, user_id)
+
+def _busy_response(e: RateLimited) -> HTTPException:
+    """503 with Retry-After when an upstream call was skipped by the rate limiter."""
+    headers = {"Retry-After": str(max(1, round(e.retry_after)))} if e.retry_after is not None else None
+    return HTTPException(status_code=503, detail=str(e), headers=headers)
+
 # --- Recipe Details Endpoint ---
 @app.get("/recipes/{recipe_id}/full")
 def get_full_recipe_details(recipe_id: int):
     """
-    Fetches full recipe details from Spoonacular and maps to App's RecipeResponse format.
+    Fetches full recipe details from Spoonacular (cached per recipe) and maps to App's RecipeResponse format.
     """
-    import os
-    import requests
-    
-    api_key = os.getenv("SPOONACULAR_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="API Key missing")
-        
-    url = f"https://api.spoonacular.com/recipes/{recipe_id}/information"
-    params = {"apiKey": api_key}
-    
     try:
-        resp = requests.get(url, params=params)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        # Map to App Format
-        # 1. Ingredients
-        ingredients = []
-        for ing in data.get("extendedIngredients", []):
-            amount = f"{ing.get('amount', '')} {ing.get('unit', '')}".strip()
-            ingredients.append({
-                "name": ing.get("original", ing.get("name")),
-                "amount": amount,
-                "imageUrl": f"https://img.spoonacular.com/ingredients_100x100/{ing.get('image', '')}"
-            })
-            
-        # 2. Steps
-        steps = []
-        if data.get("analyzedInstructions"):
-            for step in data["analyzedInstructions"][0].get("steps", []):
-                steps.append({
-                    "instruction": step.get("step"),
-                    "visual_query": None,
-                    "imageUrl": None
-                })
-        else:
-            # Fallback to splitting instructions string
-            instr = data.get("instructions", "")
-            if instr:
-                # Remove HTML tags if any
-                import re
-                clean_instr = re.sub('<[^<]+?>', '', instr)
-                steps = [{
-                    "instruction": s.strip(),
-                    "visual_query": None,
-                    "imageUrl": None
-                } for s in clean_instr.split('.') if s.strip()]
-                
-        return {
-            "name": data.get("title"),
-            "total_time": str(data.get("readyInMinutes", 0)) + " mins",
-            "ingredients": ingredients,
-            "steps": steps
-        }
-        
+        return to_app_recipe(get_recipe_information(recipe_id))
+    except RateLimited as e:
+        raise _busy_response(e)
     except Exception as e:
          print(f"Error fetching recipe {recipe_id}: {e}")
          raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/recipes/bulk")
+def get_bulk_recipe_details(ids: str = Query(..., description="Comma-separated Spoonacular recipe ids")):
+    """
+    Full details for a list of recipes (e.g. every card on a results screen) in
+    RecipeResponse format. Cached recipes are served locally; the rest cost one
+    Spoonacular informationBulk call.
+    """
+    try:
+        recipe_ids = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="'ids' must be comma-separated integers")
+    if not recipe_ids or len(recipe_ids) > 100:
+        raise HTTPException(status_code=400, detail="Provide between 1 and 100 ids")
+
+    data = get_recipes_information(recipe_ids)
+    return {
+        "recipes": [{"id": recipe_id, **to_app_recipe(data[recipe_id])} for recipe_id in recipe_ids if recipe_id in data],
+        "missing": [recipe_id for recipe_id in recipe_ids if recipe_id not in data]
+    }
+
 # --- Pantry Extraction Endpoint ---
 # --- Pantry Extraction Endpoint (Image) ---
 @app.post("/pantry/scan_image")
@@ -417,7 +848,7 @@ async def scan_pantry_image(file: UploadFile = File(...)):
         """
         
         print("Generating content...")
-        response = model.generate_content([sample_file, prompt])
+        response = guarded("gemini", model.generate_content, [sample_file, prompt], request_options=gemini_request_options())
         
         # 5. Cleanup
         try:
@@ -491,7 +922,7 @@ async def identify_dish_from_image(file: UploadFile = File(...)):
         """
         
         print("Generating content...")
-        response = model.generate_content([sample_file, prompt])
+        response = guarded("gemini", model.generate_content, [sample_file, prompt], request_options=gemini_request_options())
         
         # 5. Cleanup
         try:
@@ -519,85 +950,48 @@ async def identify_dish_from_image(file: UploadFile = File(...)):
 
 # --- Pantry Recipe Search ---
 @app.post("/recipes/findByIngredients", response_model=List[RecipeSummary])
-def find_recipes_by_ingredients(request: IngredientSearchRequest):
+def find_recipes_by_ingredients(
+    request: IngredientSearchRequest, background_tasks: BackgroundTasks, session: Session = Depends(get_session)
+):
     """
     Find recipes that use the given ingredients.
+    Served from the local matcher (recipes we've already seen); Spoonacular is only
+    called when that yields fewer than 'number' strong matches. Only Spoonacular
+    recipes (openable by id) are returned unless 'include_local' is set, which adds
+    the user's saved and extracted recipes (opened by recipe_ref).
+    Details of the top Spoonacular results are prefetched after the response is sent.
     """
-    api_key = os.getenv("SPOONACULAR_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="SPOONACULAR_API_KEY not configured")
-
     if not request.ingredients:
         return []
 
     print(f"--- Recipe Search Request: {request.ingredients} ---")
-    url = "https://api.spoonacular.com/recipes/findByIngredients"
-    params = {
-        "ingredients": ",".join(request.ingredients),
-        "number": request.number,
-        "ranking": 2, # Minimize missing ingredients
-        "ignorePantry": True,
-        "apiKey": api_key
-    }
-    print(f"Calling Spoonacular: {url} with params: {params}")
+    sources = None if request.include_local else ("spoonacular",)
+    if request.user_id and request.include_local:
+        ensure_owner_loaded(request.user_id, lambda: session.exec(
+            select(SavedRecipe).where(SavedRecipe.user_id == request.user_id)
+        ).all())
 
     try:
-        resp = requests.get(url, params=params)
-        print(f"Spoonacular Status: {resp.status_code}")
-        print(f"Spoonacular Body: {resp.text}")
-        
-        resp.raise_for_status()
-        data = resp.json()
-
-        # Map to our model
-        results = []
-        for item in data:
-            results.append(RecipeSummary(
-                id=item.get("id"),
-                title=item.get("title"),
-                image=item.get("image"),
-                usedIngredientCount=item.get("usedIngredientCount", 0),
-                missedIngredientCount=item.get("missedIngredientCount", 0),
-                likes=item.get("likes", 0)
-            ))
-        
-        return results
-
+        results = [RecipeSummary(**r) for r in find_recipes(request.ingredients, request.number, request.user_id, sources)]
+    except RateLimited as e:
+        raise _busy_response(e)
     except Exception as e:
         print(f"Error finding recipes: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    background_tasks.add_task(
+        prefetch_recipes,
+        [r.id for r in results if r.source == "spoonacular"],
+        str(request.user_id) if request.user_id else None
+    )
+    return results
+
 def _get_image_for_item(item_name: str) -> str:
     """
-    Tries to find an image URL for the given item name.
-    1. Spoonacular
-    2. Google Images
+    Tries to find an image URL for the given item name (Spoonacular, cached per ingredient).
     """
-    import requests
-    import os
-    
     if not item_name: return ""
-
-    # 1. Spoonacular First (High precision for ingredients)
-    spoon_key = os.getenv("SPOONACULAR_API_KEY")
-    if spoon_key:
-        try:
-            url = f"https://api.spoonacular.com/food/ingredients/search"
-            params = {
-                "query": item_name,
-                "apiKey": spoon_key,
-                "number": 1
-            }
-            resp = requests.get(url, params=params)
-            if resp.status_code == 200:
-                data = resp.json()
-                if data.get("results"):
-                    image_file = data["results"][0]["image"]
-                    return f"https://img.spoonacular.com/ingredients_250x250/{image_file}"
-        except Exception as e:
-            print(f"Spoonacular image fetch error: {e}")
-
-    return ""
+    return ingredient_image_url(item_name, size="250x250") or ""
 
 @app.get("/get_ingredient_image")
 def get_ingredient_image_endpoint(query: str):
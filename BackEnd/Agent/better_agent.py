@@ -1,19 +1,27 @@
 import json
+import operator
 import os
 import time
 import requests
 from typing import Annotated, Literal
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
 import typing_extensions
 TypedDict = typing_extensions.TypedDict
 from langgraph.graph import StateGraph, START, END
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from pydantic import BaseModel, Field
+from pydantic.json_schema import SkipJsonSchema
 from dotenv import load_dotenv
 import google.generativeai as genai
 from langchain_core.tools import tool
 
 # --- Import Reusable Tools ---
+from deadline import check_deadline, deadline_scope, time_left
+from quantities import normalize_amounts
+from rate_limit import Priority, with_priority
+from resilience import GEMINI_CLIENT_OPTIONS, gemini_request_options, guarded, resilient_get
+from single_flight import single_flight
 from tools import (
     download_video_file,
     extract_video_id,
@@ -39,6 +47,9 @@ class Ingredient(BaseModel):
     name: str = Field(description="Name of the ingredient, e.g. 'onions'")
     amount: str = Field(description="Quantity and unit, e.g. '1 cup'")
     imageUrl: str | None = Field(default=None, description="URL of the ingredient image")
+    # Parsed from 'amount' at ingest (see with_parsed_amounts); hidden from the LLM schema
+    amount_value: SkipJsonSchema[float | None] = None # In amount_unit
+    amount_unit: SkipJsonSchema[str | None] = None # Base unit: g, ml or count
 
 class RecipeStep(BaseModel):
     instruction: str = Field(description="The cooking instruction text")
@@ -52,6 +63,20 @@ class Recipe(BaseModel):
     ingredients: list[Ingredient] = Field(description="List of ingredients")
     source: str | None = Field(default=None, description="URL of the original recipe source (e.g. YouTube video, Blog URL)")
     source_image: str | None = Field(default=None, description="URL of the source image/thumbnail")
+    # Enrichments cut short by the request deadline (None when everything ran)
+    skipped_enrichments: SkipJsonSchema[list[str] | None] = None
+
+def with_parsed_amounts(recipe: "Recipe") -> "Recipe":
+    """Fills amount_value/amount_unit for every ingredient in one pass."""
+    parsed = normalize_amounts(i.amount for i in recipe.ingredients)
+    ingredients = [
+        ing.model_copy(update={
+            "amount_value": p[0] if p else None,
+            "amount_unit": p[1] if p else None,
+        })
+        for ing, p in zip(recipe.ingredients, parsed)
+    ]
+    return recipe.model_copy(update={"ingredients": ingredients})
 
 # --- State Definition ---
 
@@ -75,12 +100,16 @@ class AgentState(TypedDict):
     enriched_ingredients: list[Ingredient]
     enriched_steps: list[RecipeStep]
 
+    # Request deadline (epoch seconds) and the enrichments it cut short
+    deadline: float | None
+    skipped_enrichments: Annotated[list[str], operator.add]
+
 # Ensure API Key is available to LangChain
 if not os.environ.get("GOOGLE_API_KEY") and os.environ.get("GEMINI_API_KEY"):
     os.environ["GOOGLE_API_KEY"] = os.environ["GEMINI_API_KEY"]
 
 # Initialize LLM
-llm = ChatGoogleGenerativeAI(model="gemini-3-flash-preview")
+llm = ChatGoogleGenerativeAI(model="gemini-3-flash-preview", **GEMINI_CLIENT_OPTIONS)
 recipe_llm = llm.with_structured_output(Recipe)
 
 # --- Router Logic ---
@@ -122,7 +151,7 @@ def node_process_image_file(state: AgentState):
 
     try:
         filename = "temp_agent_image.jpg"
-        with requests.get(url, stream=True) as r:
+        with resilient_get(url, stream=True, retries=1) as r:
             r.raise_for_status()
             with open(filename, 'wb') as f:
                 for chunk in r.iter_content(chunk_size=8192):
@@ -233,6 +262,7 @@ def node_extract_text_from_video(state: AgentState):
         print(f"DEBUG: Uploaded. Name: {video_file.name}")
         
         while video_file.state.name == "PROCESSING":
+            check_deadline("video processing finished")
             print(f"DEBUG: State is {video_file.state.name}, waiting...")
             time.sleep(2)
             video_file = genai.get_file(video_file.name)
@@ -248,7 +278,7 @@ def node_extract_text_from_video(state: AgentState):
         prompt = """
         You are an expert chef. Watch this video and write down the full recipe.
         """
-        result = model.generate_content([video_file, prompt])
+        result = guarded("gemini", model.generate_content, [video_file, prompt], request_options=gemini_request_options())
         print(f"DEBUG: Generation finished. Text length: {len(result.text) if result.text else 0}")
         print(f"DEBUG: Preview: {result.text[:100] if result.text else 'None'}")
         
@@ -276,7 +306,7 @@ def node_format_recipe(state: AgentState):
     print("--- 📝 Formatting Recipe ---")
     try:
         # We wrap in messages to ensure the system instruction (from declaration) applies effectively
-        response = recipe_llm.invoke([
+        response = guarded("gemini", recipe_llm.invoke, [
              SystemMessage(content="You are a data extractor. Convert the following recipe text into the required JSON schema."),
              HumanMessage(content=text_to_format)
         ])
@@ -313,7 +343,7 @@ def node_analyze_image_type(state: AgentState):
           "content": "list of ingredients comma separated" OR "description of the dish"
         }
         """
-        result = model.generate_content([image_file, prompt])
+        result = guarded("gemini", model.generate_content, [image_file, prompt], request_options=gemini_request_options())
         
         genai.delete_file(image_file.name)
         
@@ -366,7 +396,7 @@ def node_recipe_from_ingredients(state: AgentState):
         prompt = "Create a creative and delicious recipe using ONLY these ingredients (and basic pantry items)."
         
     # Generate text
-    result = llm.invoke([
+    result = guarded("gemini", llm.invoke, [
         SystemMessage(content="You are an expert chef."),
         HumanMessage(content=f"{context}\n\n{prompt}")
     ])
@@ -383,7 +413,7 @@ def node_recipe_from_dish_image(state: AgentState):
     
     prompt = f"The user provided an image of: {description}. Provide a complete, authentic recipe for this dish."
     
-    result = llm.invoke([
+    result = guarded("gemini", llm.invoke, [
         SystemMessage(content="You are an expert chef."),
         HumanMessage(content=prompt)
     ])
@@ -403,7 +433,7 @@ def node_extract_from_text(state: AgentState):
     
     print("--- 📄 Processing Text Content ---")
     
-    result = llm.invoke([
+    result = guarded("gemini", llm.invoke, [
         SystemMessage(content="You are an expert chef."),
         HumanMessage(content=f"Based on: {content}. Create a detailed recipe.")
     ])
@@ -420,7 +450,7 @@ def node_format_recipe(state: AgentState):
     print("--- ✨ Formatting Recipe ---")
     
     try:
-        response = recipe_llm.invoke([
+        response = guarded("gemini", recipe_llm.invoke, [
             SystemMessage(content="Extract the recipe data into the specific JSON format required."),
             HumanMessage(content=raw_text)
         ])
@@ -440,6 +470,14 @@ def node_format_recipe(state: AgentState):
         print(f"Formatting error: {e}")
         return {}
         
+# Seconds kept free for merging and responding when the deadline is near
+ENRICHMENT_RESERVE = 2.0
+
+def _enrichment_budget_left(state: AgentState) -> bool:
+    left = time_left(state.get("deadline"))
+    return left is None or left > ENRICHMENT_RESERVE
+
+@with_priority(Priority.BACKGROUND)
 def enrich_ingredients(state: AgentState):
     """Enriches ingredients with images."""
     recipe = state.get('recipe')
@@ -447,6 +485,7 @@ def enrich_ingredients(state: AgentState):
     
     print("--- 🎨 Enriching Ingredients ---")
     updated = []
+    skipped = 0
     for ing in recipe.ingredients:
         # Check if we already have a valid image (and it's not a generic placeholder/filename)
         # Spoonacular sometimes returns just filenames like "apple.jpg" which need base path, 
@@ -456,6 +495,12 @@ def enrich_ingredients(state: AgentState):
         
         # If no image, or if it looks like a relative filename (no http), fetch a new one
         if not current_img or "http" not in current_img:
+             # Out of time: keep the ingredient as it is and return what we have
+             if not _enrichment_budget_left(state):
+                 skipped += 1
+                 updated.append(ing)
+                 continue
+
              print(f" -> Fetching image for: {ing.name}")
              url = get_ingredient_image_url.invoke(ing.name)
              
@@ -463,9 +508,9 @@ def enrich_ingredients(state: AgentState):
              if not url:
                  print(f"    -> Spoonacular failed. Trying Google Images for: {ing.name}")
                  try:
-                     # google_image_search returns a URL string on success, or error string
+                     # google_image_search returns a URL string on success, or an error/busy message
                      g_url = google_image_search.invoke(ing.name)
-                     if g_url and "Error" not in g_url and "No image found" not in g_url:
+                     if g_url and g_url.startswith("http"):
                          url = g_url
                  except Exception as e:
                      print(f"    -> Google fallback failed: {e}")
@@ -475,9 +520,13 @@ def enrich_ingredients(state: AgentState):
              # Keep existing
              updated.append(ing)
         
+    if skipped:
+        print(f" -> Deadline near, skipped images for {skipped} ingredients")
+        return {"enriched_ingredients": updated, "skipped_enrichments": ["ingredient_images"]}
     return {"enriched_ingredients": updated}
 
 
+@with_priority(Priority.BACKGROUND)
 def node_enrich_steps(state: AgentState):
     """
     Enriches recipe steps with images.
@@ -490,12 +539,17 @@ def node_enrich_steps(state: AgentState):
     print("--- 📸 Enriching Steps with Images (SerpApi Only) ---")
     
     updated_steps = []
+    skipped = 0
     
     for step in recipe.steps:
         new_step = step.model_copy()
         
         # Only process if we don't have an image yet
         if not new_step.imageUrl:
+            if not _enrichment_budget_left(state):
+                skipped += 1
+                updated_steps.append(new_step)
+                continue
             
             # Use the pre-generated query, or fallback to the instruction itself
             query_to_use = new_step.visual_query if new_step.visual_query else new_step.instruction
@@ -509,7 +563,7 @@ def node_enrich_steps(state: AgentState):
                     print(f"   Searching for: {query_to_use}")
                     image_url = google_image_search.invoke(query_to_use)
                     
-                    if image_url and "Error" not in image_url and "No image found" not in image_url:
+                    if image_url and image_url.startswith("http"):
                         new_step.imageUrl = image_url
                     else:
                          print("     -> No image found.")
@@ -519,6 +573,9 @@ def node_enrich_steps(state: AgentState):
                 
         updated_steps.append(new_step)
         
+    if skipped:
+        print(f" -> Deadline near, skipped images for {skipped} steps")
+        return {"enriched_steps": updated_steps, "skipped_enrichments": ["step_images"]}
     return {"enriched_steps": updated_steps}
 
 def node_pre_enrichment(state: AgentState):
@@ -526,7 +583,7 @@ def node_pre_enrichment(state: AgentState):
     return {}
 
 def node_merge_enrichment(state: AgentState):
-    """Merges enriched ingredients and steps back into the recipe."""
+    """Merges enriched ingredients and steps back into the recipe and parses amounts."""
     recipe = state.get('recipe')
     if not recipe: return {}
     
@@ -539,10 +596,13 @@ def node_merge_enrichment(state: AgentState):
     enriched_steps = state.get('enriched_steps')
     if enriched_steps:
         updates['steps'] = enriched_steps
+
+    skipped = state.get('skipped_enrichments')
+    if skipped:
+        updates['skipped_enrichments'] = sorted(set(skipped))
         
-    if updates:
-        return {"recipe": recipe.model_copy(update=updates)}
-    return {}
+    # Structured amounts are parsed once here, at the end of every extraction path
+    return {"recipe": with_parsed_amounts(recipe.model_copy(update=updates))}
 
 
 # --- Graph Construction ---
@@ -630,6 +690,48 @@ graph.add_edge("merge_enrichment", END)
 
 workflow = graph.compile()
 
+# Tracking parameters that don't change which page/video is extracted
+_TRACKING_PARAMS = {"fbclid", "gclid", "si", "igshid", "feature"}
+
+def extraction_key(url: str) -> str:
+    """Normalized identity of an extraction request: YouTube video id, or the URL without tracking noise."""
+    url = (url or "").strip()
+    if determine_source_type({"url": url}) == "youtube":
+        video_id = extract_video_id.invoke({"url": url})
+        if video_id:
+            return f"youtube:{video_id}"
+    parsed = urlparse(url)
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parsed.query) if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+    ))
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path.rstrip("/"), "", query, ""))
+
+def invoke_with_deadline(state: dict, deadline: float | None = None) -> dict:
+    """
+    Runs the workflow with a request deadline: nodes read it from the state,
+    outbound calls from the deadline scope (None means no deadline).
+    """
+    with deadline_scope(deadline):
+        return workflow.invoke({**state, "deadline": deadline})
+
+def _complete_extraction(state: dict) -> bool:
+    """False for a recipe cut short by the leader's deadline (see single_flight for who still takes it)."""
+    recipe = state.get("recipe")
+    return recipe is not None and not recipe.skipped_enrichments
+
+def run_extraction(url: str, deadline: float | None = None) -> dict:
+    """
+    Runs the extraction workflow for a URL. Concurrent requests for the same
+    recipe (see extraction_key) share one run and its final state. A run that
+    failed, or was cut short by its deadline, is redone under a follower's own
+    deadline only when that leaves more time than the first run had; otherwise
+    the follower gets the partial recipe. Followers wait until their deadline.
+    """
+    with deadline_scope(deadline):
+        return single_flight("extraction").do(
+            extraction_key(url), invoke_with_deadline, {"url": url}, deadline, shareable=_complete_extraction
+        )
+
 if __name__ == "__main__":
     print("\n=== PlateIt Recipe Agent (Modular) ===")
     while True:
@@ -2,6 +2,7 @@ import os
 from typing import Annotated, Literal, TypedDict
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import SystemMessage, HumanMessage, BaseMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
@@ -9,11 +10,20 @@ from langgraph.prebuilt import ToolNode, tools_condition
 from better_agent import Recipe
 from tools import (
     search_recipes, search_by_nutrients, find_by_ingredients,
-    get_recipe_information, find_similar_recipes, get_random_recipes,
+    get_recipe_information, get_recipes_information_bulk, find_similar_recipes, get_random_recipes,
     extract_recipe_from_url, search_ingredients, get_ingredient_information,
     create_recipe_card, google_search, google_image_search, search_youtube
 )
 from schemas import AgentResponse
+from tool_output import expand_tool_output, shape_tool_message
+from recipe_search import search_my_recipes
+from resilience import GEMINI_CLIENT_OPTIONS, guarded
+from nutrition import calculate_nutrition
+from image_cache import get_image_url
+from context_cache import (
+    CONTEXT_CACHE_MODE, GeminiContextProvider, describe_step, get_chef_context, set_context_provider
+)
+from functools import lru_cache
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -26,23 +36,48 @@ class AgentState(TypedDict):
     # Context injected from the App
     recipe: Recipe | None
     current_step: int
-    image_data: str | None # Base64 encoded image
+    thread_id: str | None
+    image_ref: str | None # Reference into image_cache (downscaled once per thread)
+    user_id: str | None # Injected into tools that read the user's own data
     
 # --- 2. Setup Tools & Model ---
 tools = [
      search_recipes, search_by_nutrients, find_by_ingredients,
-     get_recipe_information, find_similar_recipes, get_random_recipes,
+     get_recipe_information, get_recipes_information_bulk, find_similar_recipes, get_random_recipes,
      extract_recipe_from_url, search_ingredients, get_ingredient_information,
-     create_recipe_card, google_search, google_image_search, search_youtube
+     create_recipe_card, google_search, google_image_search, search_youtube,
+     search_my_recipes, calculate_nutrition, expand_tool_output
 ]
 
 # The "Chef" model
-llm = ChatGoogleGenerativeAI(model="gemini-3-flash-preview", temperature=0)
+CHEF_MODEL = "gemini-3-flash-preview"
+llm = ChatGoogleGenerativeAI(model=CHEF_MODEL, temperature=0, **GEMINI_CLIENT_OPTIONS)
 llm_with_tools = llm.bind_tools(tools)
 
 # The "Waiter" model (Structural output)
 response_generator = llm.with_structured_output(AgentResponse)
 
+# Stable prompt prefix, cached per recipe by context_cache (the recipe is appended there)
+CHEF_INSTRUCTIONS = """
+    You are an expert Chef Assistant guiding a user through a recipe.
+    
+    CURRENT SITUATION:
+    Each user message starts with the step they are working on, e.g. "[Currently on: Step 2 of 6: ...]".
+    
+    YOUR JOB:
+    1. Answer the user's question based on this step context and the recipe below.
+    2. If the user sends an IMAGE, analyze it carefully (doneness, texture, mistakes).
+    3. KEEP ANSWERS SHORT (1-2 sentences) and conversational. The user is cooking and listening to you via voice.
+    """
+
+if CONTEXT_CACHE_MODE == "gemini":
+    set_context_provider(GeminiContextProvider(CHEF_MODEL))
+
+@lru_cache(maxsize=32)
+def _cached_chef_llm(cached_content: str):
+    """Chef model reading its system prompt and tools from a provider context cache."""
+    return ChatGoogleGenerativeAI(model=CHEF_MODEL, temperature=0, cached_content=cached_content, **GEMINI_CLIENT_OPTIONS)
+
 # --- 3. Nodes ---
 
 from better_agent import Recipe # Import Recipe model
@@ -50,73 +85,58 @@ from better_agent import Recipe # Import Recipe model
 def chef_node(state: AgentState):
     """
     The 'Reasoning' node.
-    Injects context about the current cooking step using the Recipe object.
+    Reuses the cached prompt prefix (instructions + full recipe) and only adds
+    the per-turn delta: the current step and the user's message.
     Handles Multimodal Input (Text + Image).
     """
     
     # 1. Try to get context from the structured Recipe object
     recipe = state.get("recipe")
     idx = state.get("current_step", 0)
-    step_context = "General Cooking Support"
-    
-    if recipe and recipe.steps:
-        # Check bounds
-        if isinstance(idx, int) and 0 <= idx < len(recipe.steps):
-            current_text = recipe.steps[idx]
-            step_context = f"Step {idx + 1} of {len(recipe.steps)}: {current_text}"
-        else:
-             step_context = "Unknown step index."
+    step_context = describe_step(recipe, idx)
     
     # 2. Fallback to string if provided (legacy/direct injection)
-    elif isinstance(state.get("current_step"), str):
-        step_context = state.get("current_step")
+    if not (recipe and recipe.steps) and isinstance(idx, str):
+        step_context = idx
 
-    # System Prompt for Context
-    system_msg = SystemMessage(content=f"""
-    You are an expert Chef Assistant guiding a user through a recipe.
+    context = get_chef_context(CHEF_INSTRUCTIONS, recipe, tools)
     
-    CURRENT SITUATION:
-    The user is working on: "{step_context}"
+    # --- Per-turn Delta (step context + optional image on the latest user message) ---
+    input_messages = list(state["messages"])
+    last_user_idx = next(
+        (i for i in range(len(input_messages) - 1, -1, -1) if isinstance(input_messages[i], HumanMessage)),
+        None
+    )
     
-    YOUR JOB:
-    1. Answer the user's question based on this step context.
-    2. If the user sends an IMAGE, analyze it carefully (doneness, texture, mistakes).
-    3. KEEP ANSWERS SHORT (1-2 sentences) and conversational. The user is cooking and listening to you via voice.
-    """)
-    
-    # --- Multimodal Message Construction ---
-    input_messages = state["messages"]
-    last_user_msg = input_messages[-1]
-    
-    # Check if we have image data in the state (injected by server)
-    image_b64 = state.get("image_data")
-    
-    if image_b64:
-        print("--- Chef Node: Attaching Image to Prompt ---")
-        # Structure the message content as a list for LangChain Google integration
-        # text + image_url (data scheme)
-        
-        # We replace the last text-only message with a multimodal one
-        content_parts = [
-            {"type": "text", "text": last_user_msg.content},
-            {
-                "type": "image_url", 
-                "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"}
-            }
-        ]
+    if last_user_idx is not None:
+        last_user_msg = input_messages[last_user_idx]
+        text = f"[Currently on: {step_context}]\n{last_user_msg.content}"
         
-        multimodal_msg = HumanMessage(content=content_parts)
+        # Check if we have an image reference in the state (injected by server)
+        image_url = get_image_url(state.get("thread_id"), state.get("image_ref"))
         
-        # Replace the last message in history with our new multimodal one
-        # Note: In LangGraph, we can't easily 'replace' inside the list passed to invoke(messages) 
-        # unless we reconstruct it.
-        history = [system_msg] + input_messages[:-1] + [multimodal_msg]
+        if image_url:
+            print("--- Chef Node: Attaching Image to Prompt ---")
+            # Structure the message content as a list for LangChain Google integration
+            # text + image_url (data scheme, already downscaled by image_cache)
+            content = [
+                {"type": "text", "text": text},
+                {
+                    "type": "image_url", 
+                    "image_url": {"url": image_url}
+                }
+            ]
+        else:
+            content = text
         
-    else:
-        # Text only
-        history = [system_msg] + input_messages
+        input_messages[last_user_idx] = HumanMessage(content=content)
+    
+    if context.cached_content:
+        # Provider cache holds the instructions, recipe and tool schemas
+        return {"messages": [guarded("gemini", _cached_chef_llm(context.cached_content).invoke, input_messages)]}
     
-    return {"messages": [llm_with_tools.invoke(history)]}
+    history = [context.system_message] + input_messages
+    return {"messages": [guarded("gemini", llm_with_tools.invoke, history)]}
 
 def waiter_node(state: AgentState):
     """
@@ -132,18 +152,29 @@ def waiter_node(state: AgentState):
     """)
     
     messages = [system_prompt] + state["messages"]
-    response = response_generator.invoke(messages)
+    response = guarded("gemini", response_generator.invoke, messages)
     
     # Return the raw JSON string as the final message content for the server to parse
     return {"messages": [HumanMessage(content=response.model_dump_json())]} 
 
 
+tool_node = ToolNode(tools)
+
+def tools_node(state: AgentState, config: RunnableConfig):
+    """
+    Runs the requested tools, then compacts their results before they join the history.
+    Long outputs are capped and can be expanded later via 'expand_tool_output'.
+    """
+    result = tool_node.invoke(state, config)
+    return {"messages": [shape_tool_message(m) for m in result["messages"]]}
+
+
 # --- 4. The Graph ---
 
 builder = StateGraph(AgentState)
 
 builder.add_node("chef", chef_node)
-builder.add_node("tools", ToolNode(tools))
+builder.add_node("tools", tools_node)
 # We invoke the waiter manually at the end of the chef's run if no tools are called.
 
 builder.add_edge(START, "chef")
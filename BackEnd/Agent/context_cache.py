@@ -0,0 +1,142 @@
+import datetime
+import hashlib
+import logging
+import os
+from typing import NamedTuple, Optional
+from langchain_core.messages import SystemMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from cache import TTLCache
+
+# --- Chef Context Cache ---
+# The stable part of every chef prompt (instructions, tool schemas, full recipe)
+# is built once per recipe and reused for the whole cooking session. Each turn
+# only sends the delta (current step + the user's message).
+#   CHEF_CONTEXT_CACHE=gemini -> Gemini cached content with a TTL (falls back to local)
+#   CHEF_CONTEXT_CACHE=local  -> locally precomputed SystemMessage (default)
+
+CONTEXT_CACHE_MODE = os.getenv("CHEF_CONTEXT_CACHE", "local")
+CONTEXT_CACHE_TTL = int(os.getenv("CHEF_CONTEXT_CACHE_TTL", 3600))
+
+logger = logging.getLogger(__name__)
+
+# Drop our reference a minute before the provider expires the cache
+_contexts = TTLCache(maxsize=200, ttl=max(CONTEXT_CACHE_TTL - 60, 60))
+
+
+class ChefContext(NamedTuple):
+    system_message: SystemMessage  # always available as the local fallback
+    cached_content: Optional[str] = None  # provider cache name, if one was created
+
+
+class GeminiContextProvider:
+    """Creates Gemini cached content holding the system instruction and tool schemas."""
+
+    def __init__(self, model: str):
+        self.model = model if model.startswith("models/") else f"models/{model}"
+
+    def create(self, display_name: str, system_instruction: str, tools: list, ttl_seconds: int) -> str:
+        import google.generativeai as genai
+        from google.generativeai import caching
+
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        cache = caching.CachedContent.create(
+            model=self.model,
+            display_name=display_name,
+            system_instruction=system_instruction,
+            tools=[{"function_declarations": [_function_declaration(t) for t in tools]}],
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+        )
+        return cache.name
+
+
+_provider = None
+
+
+def set_context_provider(provider) -> None:
+    """
+    Sets the provider cache backend. Anything with
+    create(display_name, system_instruction, tools, ttl_seconds) -> name works,
+    so a local stand-in can replace Gemini.
+    """
+    global _provider
+    _provider = provider
+
+
+def _function_declaration(tool) -> dict:
+    """Converts a LangChain tool into a Gemini function declaration."""
+    function = convert_to_openai_tool(tool)["function"]
+    return {
+        "name": function["name"],
+        "description": function.get("description", ""),
+        "parameters": _clean_schema(function.get("parameters", {"type": "object", "properties": {}})),
+    }
+
+
+def _clean_schema(schema):
+    """
+    Gemini accepts an OpenAPI subset: drop JSON-schema keys it rejects, and turn
+    Optional[T] (anyOf [T, null]) into T with nullable: true.
+    """
+    if isinstance(schema, dict):
+        schema = dict(schema)
+        options = schema.pop("anyOf", None)
+        if options is not None:
+            non_null = [o for o in options if o.get("type") != "null"]
+            if len(non_null) > 1:
+                raise ValueError(f"Union schemas can't be cached: {options}")
+            if non_null:
+                schema = {**non_null[0], **schema}
+            if len(non_null) < len(options):
+                schema["nullable"] = True
+        return {
+            k: _clean_schema(v) for k, v in schema.items()
+            if k not in ("title", "default", "additionalProperties", "$schema")
+        }
+    if isinstance(schema, list):
+        return [_clean_schema(v) for v in schema]
+    return schema
+
+
+def render_recipe(recipe) -> str:
+    """Full recipe text for the prompt prefix."""
+    if not recipe:
+        return "No recipe selected. Provide general cooking support."
+    ingredients = "\n".join(f"- {i.amount} {i.name}".strip() for i in recipe.ingredients)
+    steps = "\n".join(f"{n}. {s.instruction}" for n, s in enumerate(recipe.steps, start=1))
+    return f"RECIPE: {recipe.name}\nIngredients:\n{ingredients}\nSteps:\n{steps}"
+
+
+def describe_step(recipe, idx) -> str:
+    """Per-turn delta: which step the user is on."""
+    if not recipe or not recipe.steps:
+        return "General Cooking Support"
+    if isinstance(idx, int) and 0 <= idx < len(recipe.steps):
+        return f"Step {idx + 1} of {len(recipe.steps)}: {recipe.steps[idx].instruction}"
+    return "Unknown step index."
+
+
+def get_chef_context(instructions: str, recipe, tools: list) -> ChefContext:
+    """
+    Returns the cached prompt prefix for this recipe, building it on first use.
+    The provider cache is tried when configured; any failure (e.g. prompt below the
+    provider's minimum cacheable size) keeps the local prefix.
+    """
+    prefix = f"{instructions}\n\n{render_recipe(recipe)}"
+    key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+
+    context = _contexts.get(key)
+    if context is not None:
+        return context
+
+    cached_content = None
+    if _provider is not None:
+        try:
+            cached_content = _provider.create(f"chef-{key}", prefix, tools, CONTEXT_CACHE_TTL)
+            print(f"--- Created provider context cache: {cached_content} ---")
+        except Exception as e:
+            logger.warning("Context cache unavailable, using local prefix: %s", e)
+
+    context = ChefContext(system_message=SystemMessage(content=prefix), cached_content=cached_content)
+    _contexts.set(key, context)
+    return context
@@ -1,4 +1,3 @@
-
 from sqlmodel import SQLModel, create_engine, Session
 from dotenv import load_dotenv
 import os
@@ -14,17 +13,110 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+def _env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+# --- Engine Profile ---
+# Tuned for Supabase's pooler; every setting can be overridden from the environment.
+# DB_ECHO=true prints every SQL statement (debugging only, it's expensive under load).
+DB_ECHO = _env_flag("DB_ECHO", False)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 10))
+# Recycle before the pooler/Postgres drops idle connections
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 300))
+DB_POOL_PRE_PING = _env_flag("DB_POOL_PRE_PING", True)
+
+def _engine_options() -> dict:
+    if DATABASE_URL and DATABASE_URL.startswith("sqlite"):
+        # SQLite (local dev/tests) doesn't use a QueuePool
+        return {"echo": DB_ECHO, "connect_args": {"check_same_thread": False}}
+    return {
+        "echo": DB_ECHO,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
 # Create Engine
-# echo=True means it prints SQL to console (good for debugging)
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_engine(DATABASE_URL, **_engine_options())
 
 def get_session():
     """Dependency for FastAPI to get DB session"""
     with Session(engine) as session:
         yield session
 
+# --- Async Engine ---
+# Used by async endpoints so simple CRUD doesn't hop to the threadpool.
+# Created lazily so the sync app still starts without asyncpg/aiosqlite installed.
+_async_engine = None
+
+# libpq query parameters asyncpg doesn't accept; the ones with an asyncpg
+# equivalent are translated in _async_database_config
+_LIBPQ_ONLY_PARAMS = {
+    "sslmode", "sslcert", "sslkey", "sslrootcert", "sslcrl", "sslpassword", "channel_binding",
+    "gssencmode", "target_session_attrs", "application_name", "connect_timeout", "options",
+    "keepalives", "keepalives_idle", "keepalives_interval", "keepalives_count",
+}
+
+def _async_database_config():
+    """
+    Async URL and asyncpg connect_args for DATABASE_URL. Any postgresql[+driver]
+    URL becomes postgresql+asyncpg; libpq parameters like ?sslmode=require (the
+    standard Supabase URL) are translated or dropped, since asyncpg rejects them.
+    """
+    from sqlalchemy.engine import make_url
+
+    url = make_url(DATABASE_URL)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite"), {}
+    if url.get_backend_name() != "postgresql":
+        return url, {}
+
+    query = dict(url.query)
+    # Supabase's pooler (PgBouncer) doesn't support asyncpg's prepared statement cache
+    connect_args = {"statement_cache_size": 0}
+    if "sslmode" in query:
+        connect_args["ssl"] = query["sslmode"] # asyncpg takes libpq's mode names
+    if "connect_timeout" in query:
+        connect_args["timeout"] = float(query["connect_timeout"])
+    if "application_name" in query:
+        connect_args["server_settings"] = {"application_name": query["application_name"]}
+    dropped = sorted(k for k in query if k in _LIBPQ_ONLY_PARAMS - {"sslmode", "connect_timeout", "application_name"})
+    if dropped:
+        print(f"Async engine: ignoring DATABASE_URL parameters asyncpg doesn't support: {dropped}")
+
+    url = url.set(
+        drivername="postgresql+asyncpg",
+        query={k: v for k, v in query.items() if k not in _LIBPQ_ONLY_PARAMS}
+    )
+    return url, connect_args
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        url, connect_args = _async_database_config()
+        options = _engine_options()
+        if connect_args:
+            options["connect_args"] = connect_args
+        _async_engine = create_async_engine(url, **options)
+    return _async_engine
+
+async def get_async_session():
+    """Async dependency for FastAPI to get DB session"""
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
 def create_db_and_tables():
-    """Creates the tables in Supabase if they don't exist"""
+    """Creates the tables in Supabase if they don't exist, then applies pending migrations"""
     # Import models here so SQLModel knows about them
     from models import User, PantryItem, Recipe, ChatSession, Message
+    from migrations import run_migrations
     SQLModel.metadata.create_all(engine)
+    run_migrations()
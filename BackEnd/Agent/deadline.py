@@ -0,0 +1,59 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# --- Request Deadlines ---
+# An extraction request gets a deadline (epoch seconds) that travels in the graph
+# state, so nodes can check their remaining budget and enrichment can stop early
+# with partial results. The same deadline is kept in a context variable (LangGraph
+# copies the context into node threads), so outbound calls deep inside tools cap
+# their timeouts, retries and rate-limit waits to it.
+
+EXTRACTION_DEADLINE = float(os.getenv("EXTRACTION_DEADLINE", 90))
+EXTRACTION_MAX_DEADLINE = float(os.getenv("EXTRACTION_MAX_DEADLINE", 300))
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out before this call could be made."""
+
+
+def deadline_after(seconds: Optional[float] = None) -> float:
+    """Deadline for a request starting now; 'seconds' defaults to EXTRACTION_DEADLINE."""
+    seconds = EXTRACTION_DEADLINE if seconds is None else min(seconds, EXTRACTION_MAX_DEADLINE)
+    return time.time() + seconds
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]):
+    """Outbound calls inside the block respect 'deadline' (the earlier one wins if nested)."""
+    current = _deadline.get()
+    if current is not None and deadline is not None:
+        deadline = min(current, deadline)
+    token = _deadline.set(deadline if deadline is not None else current)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_left(deadline: Optional[float] = None) -> Optional[float]:
+    """Seconds left until 'deadline' (or the current request's deadline); None if there is none."""
+    deadline = _deadline.get() if deadline is None else deadline
+    return None if deadline is None else deadline - time.time()
+
+
+def check_deadline(what: str) -> None:
+    """Raises DeadlineExceeded if the current request has no time left."""
+    left = time_left()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Request deadline exceeded before {what}")
+
+
+def cap_wait(seconds: float) -> float:
+    """'seconds' shortened to the time left in the current request."""
+    left = time_left()
+    return seconds if left is None else max(min(seconds, left), 0.0)
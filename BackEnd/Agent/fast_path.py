@@ -0,0 +1,246 @@
+import re
+from typing import Optional
+
+from better_agent import Recipe
+from quantities import (
+    NUMBER_PATTERN, UNIT_PATTERN, UNITS,
+    convert, format_number, format_quantity, normalize_unit, parse_number, scale_amount
+)
+from schemas import AgentResponse, IngredientItem, IngredientListPayload, TimerPayload
+
+# --- Deterministic Fast Path ---
+# Mechanical chat turns (timers, unit conversions, recipe scaling) are answered
+# locally with no LLM call. Patterns are anchored to the whole message, so anything
+# that isn't clearly one of these requests falls through to the chef graph.
+
+_FILLER_PREFIX = re.compile(
+    r"^(?:(?:hey|hi|ok|okay|so|um),?\s+)*(?:chef,?\s+)?"
+    r"(?:(?:please|can you|could you|would you|will you|can u|pls)\s+)*"
+)
+_FILLER_SUFFIX = re.compile(r"\s+(?:please|pls|thanks|thank you)$")
+
+_WORD_NUMBERS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "fifteen": 15,
+    "twenty": 20, "thirty": 30, "forty": 40, "forty five": 45, "sixty": 60,
+    "half a": 0.5, "half an": 0.5,
+}
+_WORD_NUMBER_PATTERN = "|".join(sorted(_WORD_NUMBERS, key=len, reverse=True))
+
+_DURATION_NUMBER = rf"(?:{NUMBER_PATTERN}|{_WORD_NUMBER_PATTERN})"
+_DURATION_UNIT = r"(?:hours?|hrs?|h|minutes?|mins?|m|seconds?|secs?|s)"
+_DURATION_PART_RE = re.compile(rf"(?P<num>{_DURATION_NUMBER})\s*-?\s*(?P<unit>{_DURATION_UNIT})\b")
+_DURATION_RE = re.compile(
+    rf"^{_DURATION_NUMBER}\s*-?\s*{_DURATION_UNIT}"
+    rf"(?:\s*(?:and|,)?\s*{_DURATION_NUMBER}\s*-?\s*{_DURATION_UNIT})*$"
+)
+
+_TIMER_RES = [
+    re.compile(r"^(?:set|start)\s+(?:a|the|an)?\s*(?P<dur>.+?)\s+timer(?:\s+for\s+(?:the\s+)?(?P<label>.+))?$"),
+    re.compile(r"^(?:set|start)\s+(?:a|the)?\s*timer\s+(?:for\s+)?(?P<dur>.+?)(?:\s+for\s+(?:the\s+)?(?P<label>.+))?$"),
+    re.compile(r"^timer\s+(?:for\s+)?(?P<dur>.+?)(?:\s+for\s+(?:the\s+)?(?P<label>.+))?$"),
+    re.compile(r"^(?:remind me|tell me)\s+in\s+(?P<dur>.+?)(?:\s+to\s+(?P<action>.+))?$"),
+]
+
+# "for the pasta" / "to flip the steak" -> "pasta" / "steak" (the bubble adds "for the")
+_LABEL_ARTICLE_RE = re.compile(r"^(?:(?:the|a|an|my|our|your)\s+)+")
+
+_SECONDS_PER_UNIT = {"h": 3600, "m": 60, "s": 1}
+
+_CONVERSION_RES = [
+    # "how many grams is 2 cups of flour"
+    re.compile(
+        rf"^how (?:many|much)\s+(?P<to>{UNIT_PATTERN})\s+(?:is|are|in|make|makes|equals?|equal to)\s+"
+        rf"(?P<qty>{NUMBER_PATTERN}|{_WORD_NUMBER_PATTERN})\s*(?P<from>{UNIT_PATTERN})"
+        r"(?:\s+of\s+(?P<ing>[a-z][a-z \-]*?))?$"
+    ),
+    # "convert 2 cups of flour to grams", "what is 200g of sugar in cups"
+    re.compile(
+        r"^(?:convert\s+|what(?:'s| is)\s+)?"
+        rf"(?P<qty>{NUMBER_PATTERN}|{_WORD_NUMBER_PATTERN})\s*(?P<from>{UNIT_PATTERN})"
+        r"(?:\s+of\s+(?P<ing>[a-z][a-z \-]*?))?"
+        rf"\s+(?:to|in|into|in to)\s+(?P<to>{UNIT_PATTERN})$"
+    ),
+]
+
+_TEMPERATURE_UNIT = r"(?:°\s*)?(?:degrees?\s+)?(?:f|c|fahrenheit|celsius|centigrade)"
+_TEMPERATURE_RE = re.compile(
+    r"^(?:convert\s+|what(?:'s| is)\s+)?"
+    rf"(?P<qty>-?{NUMBER_PATTERN})\s*(?P<from>{_TEMPERATURE_UNIT})"
+    rf"\s+(?:to|in|into)\s+(?P<to>{_TEMPERATURE_UNIT})$"
+)
+
+_SCALE_WORDS = {"double": 2.0, "triple": 3.0, "quadruple": 4.0, "halve": 0.5}
+_RECIPE_REF = r"(?:it|this|the recipe|this recipe|the ingredients|everything)"
+_SCALE_RES = [
+    re.compile(rf"^(?P<word>double|triple|quadruple|halve)\s+{_RECIPE_REF}$"),
+    re.compile(rf"^(?:cut|make)\s+{_RECIPE_REF}\s+(?:in|by)\s+half$"),
+    re.compile(rf"^(?:scale|multiply)\s+{_RECIPE_REF}\s+(?:up\s+|down\s+)?(?:by\s+)?(?P<factor>{NUMBER_PATTERN})\s*(?:x|times)?$"),
+    re.compile(rf"^make\s+{_RECIPE_REF}\s+(?P<factor>{NUMBER_PATTERN})\s*(?:x|times)(?:\s+bigger)?$"),
+]
+
+
+def _normalize(message: str) -> str:
+    text = message.strip().lower()
+    text = re.sub(r"[?!.]+$", "", text)
+    text = re.sub(r"\s+", " ", text)
+    text = _FILLER_PREFIX.sub("", text)
+    return _FILLER_SUFFIX.sub("", text).strip()
+
+
+def _to_number(text: str) -> Optional[float]:
+    text = text.strip()
+    if text in _WORD_NUMBERS:
+        return float(_WORD_NUMBERS[text])
+    return parse_number(text)
+
+
+def _parse_duration(text: str) -> Optional[int]:
+    """'1 hour and 30 minutes' -> 5400. Returns None unless the whole text is a duration."""
+    text = text.strip()
+    if not _DURATION_RE.match(text):
+        return None
+    total = 0.0
+    for match in _DURATION_PART_RE.finditer(text):
+        value = _to_number(match.group("num"))
+        if value is None:
+            return None
+        total += value * _SECONDS_PER_UNIT[match.group("unit")[0]]
+    return int(round(total)) if total > 0 else None
+
+
+def _describe_duration(seconds: int) -> str:
+    hours, rem = divmod(seconds, 3600)
+    minutes, secs = divmod(rem, 60)
+    parts = []
+    if hours:
+        parts.append(f"{hours} hour{'s' if hours != 1 else ''}")
+    if minutes:
+        parts.append(f"{minutes} minute{'s' if minutes != 1 else ''}")
+    if secs:
+        parts.append(f"{secs} second{'s' if secs != 1 else ''}")
+    return " and ".join(parts)
+
+
+def _timer_label(groups: dict) -> Optional[str]:
+    """What the timer is for: the label, or the object of a reminder's action (its verb dropped)."""
+    label = (groups.get("label") or "").strip()
+    action = (groups.get("action") or "").strip()
+    if action:
+        label = action.split(" ", 1)[1] if " " in action else ""
+    return _LABEL_ARTICLE_RE.sub("", label).strip() or None
+
+
+def _try_timer(text: str) -> Optional[AgentResponse]:
+    for pattern in _TIMER_RES:
+        match = pattern.match(text)
+        if not match:
+            continue
+        seconds = _parse_duration(match.group("dur"))
+        if not seconds:
+            continue
+        label = _timer_label(match.groupdict())
+        bubble = f"⏱️ Timer set for {_describe_duration(seconds)}"
+        bubble += f" for the {label}." if label else "."
+        return AgentResponse(
+            chat_bubble=bubble,
+            ui_type="timer",
+            timer_data=TimerPayload(seconds=seconds, label=label),
+        )
+    return None
+
+
+def _try_conversion(text: str) -> Optional[AgentResponse]:
+    match = _TEMPERATURE_RE.match(text)
+    if match:
+        value = parse_number(match.group("qty").lstrip("-"))
+        if value is None:
+            return None
+        if match.group("qty").startswith("-"):
+            value = -value
+        from_unit = match.group("from").replace("°", "").split()[-1][0]
+        to_unit = match.group("to").replace("°", "").split()[-1][0]
+        if from_unit == to_unit:
+            return None
+        result = (value - 32) * 5 / 9 if from_unit == "f" else value * 9 / 5 + 32
+        return AgentResponse(
+            chat_bubble=f"🌡️ {value:g}°{from_unit.upper()} is about {round(result):g}°{to_unit.upper()}."
+        )
+
+    for pattern in _CONVERSION_RES:
+        match = pattern.match(text)
+        if not match:
+            continue
+        value = _to_number(match.group("qty"))
+        from_unit = normalize_unit(match.group("from"))
+        to_unit = normalize_unit(match.group("to"))
+        ingredient = (match.group("ing") or "").strip()
+        if value is None or not from_unit or not to_unit or from_unit == to_unit:
+            return None
+
+        # Mass <-> volume needs a density; convert() returns None if we don't know it
+        result = convert(value, from_unit, to_unit, ingredient)
+        if result is None:
+            return None
+
+        of_part = f" of {ingredient}" if ingredient else ""
+        approx = "about " if UNITS[from_unit][0] != UNITS[to_unit][0] else ""
+        return AgentResponse(
+            chat_bubble=f"⚖️ {format_quantity(value, from_unit)}{of_part} is {approx}{format_quantity(result, to_unit)}."
+        )
+    return None
+
+
+def _try_scaling(text: str, recipe: Optional[Recipe]) -> Optional[AgentResponse]:
+    if not recipe or not recipe.ingredients:
+        return None
+
+    factor = None
+    for pattern in _SCALE_RES:
+        match = pattern.match(text)
+        if not match:
+            continue
+        groups = match.groupdict()
+        if groups.get("word"):
+            factor = _SCALE_WORDS[groups["word"]]
+        elif groups.get("factor"):
+            factor = parse_number(groups["factor"])
+        else:
+            factor = 0.5
+        break
+
+    if not factor or factor <= 0:
+        return None
+
+    items = []
+    unchanged = []
+    for idx, ing in enumerate(recipe.ingredients):
+        scaled = scale_amount(ing.amount, factor)
+        if scaled is None:
+            unchanged.append(ing.name)
+            scaled = ing.amount
+        items.append(IngredientItem(id=idx, name=ing.name, image=ing.imageUrl, amount=scaled))
+
+    bubble = f"🧮 Here's {recipe.name} scaled by {format_number(factor)}x."
+    if unchanged:
+        bubble += f" I left {', '.join(unchanged)} as written, adjust to taste."
+    return AgentResponse(
+        chat_bubble=bubble,
+        ui_type="ingredient_list",
+        ingredient_data=IngredientListPayload(items=items),
+    )
+
+
+def try_fast_path(message: str, recipe: Optional[Recipe] = None) -> Optional[AgentResponse]:
+    """
+    Answers timers, unit conversions and recipe scaling without calling the LLM.
+    Returns None when the message isn't confidently one of those requests.
+    """
+    if not message or len(message) > 200:
+        return None
+
+    text = _normalize(message)
+    if not text:
+        return None
+
+    return _try_timer(text) or _try_conversion(text) or _try_scaling(text, recipe)
@@ -0,0 +1,66 @@
+import base64
+import hashlib
+import io
+import os
+from typing import Optional
+
+from cache import TTLCache
+
+# --- Chat Image Cache ---
+# Photos sent to the chef ("check my pan") are downscaled once, stored per thread
+# by content hash, and referenced by 'image_ref' on later turns instead of
+# re-uploading pixels.
+
+MAX_IMAGE_SIDE = int(os.getenv("CHAT_IMAGE_MAX_SIDE", 1024))
+JPEG_QUALITY = int(os.getenv("CHAT_IMAGE_JPEG_QUALITY", 85))
+
+# (thread_id, image_ref) -> data URL ready for the model
+_images = TTLCache(maxsize=200, ttl=2 * 3600)
+
+
+def _mime_type(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def _downscale(data: bytes) -> bytes:
+    """Resizes to MAX_IMAGE_SIDE and re-encodes as JPEG. Returns the input if Pillow is unavailable."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        print("Pillow not installed, sending chat image at full size.")
+        return data
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if img.format == "JPEG" and max(img.size) <= MAX_IMAGE_SIDE:
+                return data
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+            out = io.BytesIO()
+            img.convert("RGB").save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+            return out.getvalue()
+    except Exception as e:
+        print(f"Image downscale failed, using original: {e}")
+        return data
+
+
+def store_image(thread_id: str, data: bytes) -> str:
+    """Downscales and caches an image for a chat thread. Returns its 'image_ref'."""
+    ref = hashlib.sha256(data).hexdigest()[:16]
+    key = (thread_id, ref)
+    if key not in _images:
+        small = _downscale(data)
+        encoded = base64.b64encode(small).decode("ascii")
+        _images.set(key, f"data:{_mime_type(small)};base64,{encoded}")
+    return ref
+
+
+def get_image_url(thread_id: str, ref: str) -> Optional[str]:
+    """Returns the cached data URL for an image_ref, or None if it expired."""
+    if not ref:
+        return None
+    return _images.get((thread_id, ref))
@@ -0,0 +1,202 @@
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List
+
+from quantities import UNIT_ALIASES, parse_quantity
+
+# --- Ingredient Canonicalization ---
+# Names arrive as "2 Large Eggs, beaten", "egg", "scallions" or "green onions"
+# (pantry scans, extracted recipes, Spoonacular, user input). canonical_ingredient()
+# maps them all to one stable key ("egg", "green onion") so caches, pantry dedupe
+# and recipe matching agree. The lexicon is precomputed at import and results are
+# memoized, so running it on every item of a bulk request is cheap.
+
+# Variant -> canonical name (singular forms; plurals are derived)
+SYNONYMS = {
+    "scallion": "green onion",
+    "spring onion": "green onion",
+    "garbanzo bean": "chickpea",
+    "garbanzo": "chickpea",
+    "coriander leaf": "cilantro",
+    "fresh coriander": "cilantro",
+    "aubergine": "eggplant",
+    "courgette": "zucchini",
+    "capsicum": "bell pepper",
+    "red bell pepper": "bell pepper",
+    "green bell pepper": "bell pepper",
+    "yellow bell pepper": "bell pepper",
+    "red pepper": "bell pepper",
+    "green pepper": "bell pepper",
+    "yellow pepper": "bell pepper",
+    "orange pepper": "bell pepper",
+    "rocket": "arugula",
+    "all purpose flour": "flour",
+    "plain flour": "flour",
+    "white flour": "flour",
+    "granulated sugar": "sugar",
+    "white sugar": "sugar",
+    "caster sugar": "sugar",
+    "icing sugar": "powdered sugar",
+    "confectioners sugar": "powdered sugar",
+    "bicarbonate of soda": "baking soda",
+    "bicarb": "baking soda",
+    "double cream": "heavy cream",
+    "heavy whipping cream": "heavy cream",
+    "whipping cream": "heavy cream",
+    "single cream": "light cream",
+    "minced beef": "ground beef",
+    "beef mince": "ground beef",
+    "minced pork": "ground pork",
+    "prawn": "shrimp",
+    "king prawn": "shrimp",
+    "sea salt": "salt",
+    "kosher salt": "salt",
+    "table salt": "salt",
+    "black pepper": "pepper",
+    "ground black pepper": "pepper",
+    "black peppercorn": "peppercorn",
+    "extra virgin olive oil": "olive oil",
+    "virgin olive oil": "olive oil",
+    "evoo": "olive oil",
+    "vegetable stock": "vegetable broth",
+    "chicken stock": "chicken broth",
+    "beef stock": "beef broth",
+    "unsalted butter": "butter",
+    "salted butter": "butter",
+    "whole milk": "milk",
+    "semi skimmed milk": "milk",
+    "skim milk": "milk",
+    "hen egg": "egg",
+    "chicken egg": "egg",
+    "tomatoe": "tomato",
+    "garlic clove": "garlic",
+    "cloves garlic": "garlic",
+    "cilantro leaf": "cilantro",
+    "basil leaf": "basil",
+    "mint leaf": "mint",
+    "parsley leaf": "parsley",
+    "chili": "chili pepper",
+    "chilli": "chili pepper",
+    "chile": "chili pepper",
+    "corn flour": "cornstarch",
+    "cornflour": "cornstarch",
+    "maize": "corn",
+    "sweetcorn": "corn",
+    "sweet corn": "corn",
+    "swede": "rutabaga",
+    "beetroot": "beet",
+    "mangetout": "snow pea",
+    "soya sauce": "soy sauce",
+    "soy": "soy sauce",
+}
+
+# Plurals that name a different ingredient than their singular: "peppers" are
+# bell peppers, "pepper" alone is the black pepper spice. Checked before
+# singularizing, so they never collapse into the singular's key.
+PLURAL_SYNONYMS = {
+    "peppers": "bell pepper",
+    "sweet peppers": "bell pepper",
+}
+
+# Words that describe preparation/size/quality, not the ingredient itself
+DESCRIPTORS = {
+    "large", "small", "medium", "big", "extra", "jumbo", "fresh", "freshly", "raw", "ripe",
+    "chopped", "diced", "minced", "sliced", "grated", "shredded", "crushed", "beaten", "whisked",
+    "peeled", "cubed", "halved", "quartered", "julienned", "melted", "softened", "cooked",
+    "finely", "roughly", "coarsely", "thinly", "thickly", "lightly", "very",
+    "organic", "free", "range", "frozen", "thawed", "canned", "tinned", "packed", "loosely",
+    "boneless", "skinless", "trimmed", "rinsed", "drained", "washed", "deseeded", "seeded",
+    "room", "temperature", "cold", "warm", "optional", "about", "approximately", "plus",
+    "handful", "pinch", "dash", "splash", "sprig", "sprigs", "bunch", "can", "cans", "jar", "jars",
+    "package", "packages", "pack", "packet", "bag", "box", "stick", "sticks", "slice", "slices",
+    "piece", "pieces", "head", "heads", "of", "a", "an", "the", "some", "and", "or",
+}
+
+# Trailing phrases dropped before matching ("salt to taste", "parsley for garnish")
+_TRAILING = re.compile(r"\b(to taste|as needed|for (garnish|serving|frying|greasing|dusting)|divided|at room temperature)\b.*$")
+
+# Plural -> singular exceptions; words listed with themselves never change
+IRREGULAR_PLURALS = {
+    "leaves": "leaf", "loaves": "loaf", "halves": "half", "knives": "knife",
+    "potatoes": "potato", "tomatoes": "tomato", "mangoes": "mango", "avocados": "avocado",
+    "cloves": "clove", "olives": "olive", "chives": "chives", "anchovies": "anchovy",
+    "radishes": "radish", "peaches": "peach", "sandwiches": "sandwich", "dishes": "dish",
+    "molasses": "molasses", "hummus": "hummus", "asparagus": "asparagus", "couscous": "couscous",
+    "citrus": "citrus", "swiss": "swiss", "grits": "grits", "oats": "oats", "greens": "greens",
+    "brussels": "brussels", "lentils": "lentil", "series": "series", "species": "species",
+    # Singular words ending in -is (other -is words are plurals of -i: kiwis, salamis)
+    "pastis": "pastis", "chablis": "chablis", "iris": "iris", "tennis": "tennis",
+}
+
+_NON_WORD = re.compile(r"[^a-z ]+")
+_SPACES = re.compile(r"\s+")
+_PARENS = re.compile(r"\([^)]*\)")
+
+
+def singularize(word: str) -> str:
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if len(word) <= 3 or word.endswith(("ss", "us")):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "xes", "sses", "zes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def _singular_phrase(phrase: str) -> str:
+    """Only the head noun (last word) is singularized: 'cherry tomatoes' -> 'cherry tomato'."""
+    words = phrase.split()
+    if words:
+        words[-1] = singularize(words[-1])
+    return " ".join(words)
+
+
+def _build_lexicon() -> Dict[str, str]:
+    lexicon = {}
+    for variant, canonical in SYNONYMS.items():
+        lexicon[variant] = canonical
+        lexicon[_singular_phrase(variant)] = canonical
+    return lexicon
+
+
+_LEXICON = _build_lexicon()
+_UNIT_WORDS = set(UNIT_ALIASES)
+
+
+def _clean(name: str) -> str:
+    text = (name or "").lower()
+    # "2 eggs, beaten" -> "eggs"; "1 (14 oz) can tomatoes" -> "can tomatoes"
+    quantity = parse_quantity(text)
+    if quantity is not None:
+        text = quantity.rest
+    text = _PARENS.sub(" ", text).split(",")[0]
+    text = _TRAILING.sub("", text.replace("-", " "))
+    text = _SPACES.sub(" ", _NON_WORD.sub(" ", text)).strip()
+    words = [w for w in text.split() if w not in DESCRIPTORS and w not in _UNIT_WORDS]
+    return " ".join(words)
+
+
+@lru_cache(maxsize=50000)
+def canonical_ingredient(name: str) -> str:
+    """
+    Stable ingredient key for any spelling of an ingredient name:
+    'Large Eggs' / '2 eggs, beaten' -> 'egg', 'scallions' -> 'green onion'.
+    Returns '' if nothing is left (e.g. 'to taste').
+    """
+    cleaned = _clean(name)
+    if not cleaned:
+        return ""
+    if cleaned in PLURAL_SYNONYMS:
+        return PLURAL_SYNONYMS[cleaned]
+    if cleaned in _LEXICON:
+        return _LEXICON[cleaned]
+    singular = _singular_phrase(cleaned)
+    return _LEXICON.get(singular, singular)
+
+
+def canonicalize_many(names: Iterable[str]) -> List[str]:
+    return [canonical_ingredient(n) for n in names]
@@ -0,0 +1,404 @@
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import inspect
+from sqlmodel import text
+
+from database import engine
+
+# --- Versioned Migrations ---
+# Each migration runs once, in its own transaction, and is recorded in
+# 'schema_migrations'. Statements are per dialect ("postgresql" in production,
+# "sqlite" for local runs); a dialect without an entry is a no-op. A statement
+# can also be a function taking the connection, for data backfills.
+# Tables themselves come from SQLModel.metadata.create_all; indexes and column
+# type changes live here.
+#
+# The API server's startup hook runs this (database.create_db_and_tables) in every
+# worker/replica, so a run holds a lock: a Postgres
+# advisory lock (needs a session-mode connection, Supabase pooler port 5432), or
+# one BEGIN EXCLUSIVE transaction for all pending migrations on SQLite.
+# Postgres indexes are built with CREATE/DROP INDEX CONCURRENTLY (Concurrent
+# statements, run outside the migration's transaction) so they don't block
+# writes on live tables. Column type changes still rewrite the table under an
+# exclusive lock; those set a lock_timeout so they fail fast instead of queueing
+# every query behind them.
+#
+#   python migrations.py          -> apply pending migrations
+#   python migrations.py status   -> list applied/pending versions
+#   python migrations.py explain  -> show query plans for the hot queries
+
+MIGRATION_LOCK_ID = 58_220_417 # pg_advisory_lock key, any constant unique to this app
+
+
+class Concurrent(str):
+    """A Postgres statement that can't run in a transaction (CREATE/DROP INDEX CONCURRENTLY)."""
+
+
+def _concurrent_index(name: str, ddl: str) -> list:
+    """
+    Builds an index without blocking writes. A build interrupted half way leaves
+    an INVALID index behind, which is dropped first when the migration is retried.
+    """
+    return [Concurrent(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"), Concurrent(ddl)]
+
+
+def _add_column(table: str, column: str, ddl: str):
+    """ALTER TABLE ADD COLUMN unless create_all already made it (SQLite has no IF NOT EXISTS here)."""
+    def step(connection):
+        if column not in {c["name"] for c in inspect(connection).get_columns(table)}:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return step
+
+
+def _backfill_pantry_amounts(connection, batch_size: int = 1000):
+    """Parses existing pantry amounts into amount_value/amount_unit."""
+    from quantities import normalize_amount
+
+    rows = connection.execute(text(
+        "SELECT id, amount FROM pantry_items_v2 WHERE amount IS NOT NULL AND amount_value IS NULL"
+    )).fetchall()
+    updates = []
+    for item_id, amount in rows:
+        parsed = normalize_amount(amount)
+        if parsed:
+            updates.append({"id": item_id, "value": parsed[0], "unit": parsed[1]})
+    for start in range(0, len(updates), batch_size):
+        connection.execute(
+            text("UPDATE pantry_items_v2 SET amount_value = :value, amount_unit = :unit WHERE id = :id"),
+            updates[start:start + batch_size]
+        )
+    print(f"Parsed {len(updates)} of {len(rows)} pantry amounts")
+
+
+def _clear_pantry_measure_counts(connection, batch_size: int = 1000):
+    """Unsets amounts 0008 stored as plain counts for measure words ('1 head', '2 cans')."""
+    from quantities import normalize_amount
+
+    rows = connection.execute(text(
+        "SELECT id, amount FROM pantry_items_v2 WHERE amount_unit = 'count' AND amount IS NOT NULL"
+    )).fetchall()
+    updates = [{"id": item_id} for item_id, amount in rows if normalize_amount(amount) is None]
+    for start in range(0, len(updates), batch_size):
+        connection.execute(
+            text("UPDATE pantry_items_v2 SET amount_value = NULL, amount_unit = NULL WHERE id = :id"),
+            updates[start:start + batch_size]
+        )
+    print(f"Cleared {len(updates)} of {len(rows)} counted pantry amounts")
+
+
+def _keep_duplicate_saved_recipes(connection):
+    """
+    Makes (user, source_url) unique without losing data: later copies of a recipe
+    saved from the same URL keep their row, with '#saved-<id>' appended to their
+    source_url (strip it to undo). Each one is reported.
+    """
+    rows = connection.execute(text(
+        "SELECT r.id, r.user_id, r.source_url FROM recipe r WHERE r.source_url IS NOT NULL AND EXISTS ("
+        "SELECT 1 FROM recipe o WHERE o.user_id = r.user_id AND o.source_url = r.source_url AND o.id < r.id)"
+    )).fetchall()
+    for recipe_id, user_id, source_url in rows:
+        print(f"Duplicate saved recipe {recipe_id} (user {user_id}, {source_url}): source_url suffixed with #saved-{recipe_id}")
+    if rows:
+        connection.execute(
+            text("UPDATE recipe SET source_url = :url WHERE id = :id"),
+            [{"id": recipe_id, "url": f"{source_url}#saved-{recipe_id}"} for recipe_id, _, source_url in rows]
+        )
+
+
+# FTS5 row for a recipe, used by the SQLite search triggers (migration 0007)
+_SQLITE_FTS_ROW = (
+    "INSERT INTO recipe_fts (rowid, title, ingredients, steps) VALUES ({row}.id, {row}.title, "
+    "(SELECT group_concat(json_extract(value, '$.name'), ' ') FROM json_each({row}.content_json, '$.ingredients')), "
+    "(SELECT group_concat(json_extract(value, '$.instruction'), ' ') FROM json_each({row}.content_json, '$.steps')))"
+)
+
+MIGRATIONS = [
+    {
+        "version": "0001",
+        "description": "Add user.preferences",
+        "postgresql": [
+            'ALTER TABLE "user" ADD COLUMN IF NOT EXISTS preferences JSON DEFAULT \'[]\'::json',
+        ],
+    },
+    {
+        "version": "0002",
+        "description": "Pantry: composite covering index for per-user listing by created_at",
+        "postgresql": [
+            *_concurrent_index(
+                "ix_pantry_items_v2_user_created",
+                "CREATE INDEX CONCURRENTLY ix_pantry_items_v2_user_created "
+                "ON pantry_items_v2 (user_id, created_at DESC, id DESC) "
+                "INCLUDE (name, amount, image_url, updated_at)",
+            ),
+            Concurrent("DROP INDEX CONCURRENTLY IF EXISTS ix_pantry_items_v2_user_id"),
+        ],
+        "sqlite": [
+            "CREATE INDEX IF NOT EXISTS ix_pantry_items_v2_user_created "
+            "ON pantry_items_v2 (user_id, created_at DESC, id DESC)",
+            "DROP INDEX IF EXISTS ix_pantry_items_v2_user_id",
+        ],
+    },
+    {
+        "version": "0003",
+        "description": "User: drop index on password (never queried, slows signups)",
+        "postgresql": [Concurrent("DROP INDEX CONCURRENTLY IF EXISTS ix_user_password")],
+        "sqlite": ["DROP INDEX IF EXISTS ix_user_password"],
+    },
+    {
+        "version": "0004",
+        "description": "Convert user.preferences and recipe.content_json to JSONB",
+        # Rewrites both tables under an ACCESS EXCLUSIVE lock (reads and writes wait
+        # for the rewrite, roughly a full copy of the table). Run it off-peak on
+        # large tables; the lock_timeout only bounds the wait for the lock itself.
+        "postgresql": [
+            "SET LOCAL lock_timeout = '10s'",
+            'ALTER TABLE "user" ALTER COLUMN preferences DROP DEFAULT',
+            'ALTER TABLE "user" ALTER COLUMN preferences TYPE JSONB USING preferences::jsonb',
+            'ALTER TABLE "user" ALTER COLUMN preferences SET DEFAULT \'[]\'::jsonb',
+            "ALTER TABLE recipe ALTER COLUMN content_json TYPE JSONB USING content_json::jsonb",
+        ],
+    },
+    {
+        "version": "0005",
+        "description": "Recipe: composite covering index for per-user listing by created_at",
+        "postgresql": [
+            *_concurrent_index(
+                "ix_recipe_user_created",
+                "CREATE INDEX CONCURRENTLY ix_recipe_user_created "
+                "ON recipe (user_id, created_at DESC, id DESC) "
+                "INCLUDE (title, image_url, source_url)",
+            ),
+            Concurrent("DROP INDEX CONCURRENTLY IF EXISTS ix_recipe_user_id"),
+        ],
+        "sqlite": [
+            "CREATE INDEX IF NOT EXISTS ix_recipe_user_created "
+            "ON recipe (user_id, created_at DESC, id DESC)",
+            "DROP INDEX IF EXISTS ix_recipe_user_id",
+        ],
+    },
+    {
+        "version": "0006",
+        "description": "Recipe: one saved copy per (user, source_url)",
+        "postgresql": [
+            _keep_duplicate_saved_recipes,
+            *_concurrent_index(
+                "ux_recipe_user_source",
+                "CREATE UNIQUE INDEX CONCURRENTLY ux_recipe_user_source "
+                "ON recipe (user_id, source_url) WHERE source_url IS NOT NULL",
+            ),
+        ],
+        "sqlite": [
+            _keep_duplicate_saved_recipes,
+            "CREATE UNIQUE INDEX IF NOT EXISTS ux_recipe_user_source "
+            "ON recipe (user_id, source_url) WHERE source_url IS NOT NULL",
+        ],
+    },
+    {
+        "version": "0007",
+        "description": "Recipe: full-text search over title, ingredients and steps",
+        # The stored generated column rewrites the recipe table (see 0004)
+        "postgresql": [
+            "SET LOCAL lock_timeout = '10s'",
+            "ALTER TABLE recipe ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(jsonb_path_query_array(content_json, '$.ingredients[*].name')::text, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(jsonb_path_query_array(content_json, '$.steps[*].instruction')::text, '')), 'C')"
+            ") STORED",
+            *_concurrent_index(
+                "ix_recipe_search", "CREATE INDEX CONCURRENTLY ix_recipe_search ON recipe USING GIN (search_vector)"
+            ),
+        ],
+        "sqlite": [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS recipe_fts USING fts5(title, ingredients, steps, tokenize='porter unicode61')",
+            "CREATE TRIGGER IF NOT EXISTS recipe_fts_insert AFTER INSERT ON recipe BEGIN "
+            + _SQLITE_FTS_ROW.format(row="new") + "; END",
+            "CREATE TRIGGER IF NOT EXISTS recipe_fts_update AFTER UPDATE ON recipe BEGIN "
+            "DELETE FROM recipe_fts WHERE rowid = old.id; "
+            + _SQLITE_FTS_ROW.format(row="new") + "; END",
+            "CREATE TRIGGER IF NOT EXISTS recipe_fts_delete AFTER DELETE ON recipe BEGIN "
+            "DELETE FROM recipe_fts WHERE rowid = old.id; END",
+            "DELETE FROM recipe_fts",
+            "INSERT INTO recipe_fts (rowid, title, ingredients, steps) "
+            "SELECT id, title, "
+            "(SELECT group_concat(json_extract(value, '$.name'), ' ') FROM json_each(recipe.content_json, '$.ingredients')), "
+            "(SELECT group_concat(json_extract(value, '$.instruction'), ' ') FROM json_each(recipe.content_json, '$.steps')) "
+            "FROM recipe",
+        ],
+    },
+    {
+        "version": "0008",
+        "description": "Pantry: structured amount_value/amount_unit parsed from amount",
+        "postgresql": [
+            _add_column("pantry_items_v2", "amount_value", "DOUBLE PRECISION"),
+            _add_column("pantry_items_v2", "amount_unit", "VARCHAR"),
+            _backfill_pantry_amounts,
+        ],
+        "sqlite": [
+            _add_column("pantry_items_v2", "amount_value", "FLOAT"),
+            _add_column("pantry_items_v2", "amount_unit", "VARCHAR"),
+            _backfill_pantry_amounts,
+        ],
+    },
+    {
+        "version": "0009",
+        "description": "Pantry: no counted amount for measure words ('1 head', '2 cans')",
+        "postgresql": [_clear_pantry_measure_counts],
+        "sqlite": [_clear_pantry_measure_counts],
+    },
+]
+
+# Hot queries checked by `python migrations.py explain`
+HOT_QUERIES = {
+    "pantry list": (
+        "SELECT * FROM pantry_items_v2 WHERE user_id = :user_id "
+        "ORDER BY created_at DESC, id DESC LIMIT 50"
+    ),
+    "recipe list": (
+        "SELECT id, title, image_url, source_url, created_at FROM recipe WHERE user_id = :user_id "
+        "ORDER BY created_at DESC, id DESC LIMIT 20"
+    ),
+    "saved recipe by source": (
+        "SELECT id, content_json FROM recipe WHERE user_id = :user_id AND source_url = 'x'"
+    ),
+}
+
+
+def _ensure_migrations_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version VARCHAR(32) PRIMARY KEY, "
+        "description VARCHAR(255) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def _applied_versions(connection) -> set:
+    _ensure_migrations_table(connection)
+    rows = connection.execute(text("SELECT version FROM schema_migrations")).fetchall()
+    return {row[0] for row in rows}
+
+
+def applied_versions() -> set:
+    with engine.begin() as connection:
+        return _applied_versions(connection)
+
+
+@contextmanager
+def _migration_lock():
+    """
+    Only one process migrates at a time. Yields the connection every migration
+    must run on (SQLite's exclusive transaction), or None to use fresh ones.
+    """
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_connection:
+            lock_connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            try:
+                yield None
+            finally:
+                lock_connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+    elif dialect == "sqlite":
+        # The driver's own BEGIN is deferred; take the write lock up front instead
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql("BEGIN EXCLUSIVE")
+            try:
+                yield connection
+            except BaseException:
+                connection.exec_driver_sql("ROLLBACK")
+                raise
+            connection.exec_driver_sql("COMMIT")
+    else:
+        yield None
+
+
+def _execute(connection, statement) -> None:
+    if callable(statement):
+        statement(connection)
+    else:
+        connection.execute(text(statement))
+
+
+def _record(connection, migration: dict) -> None:
+    connection.execute(
+        text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+        {"v": migration["version"], "d": migration["description"], "t": datetime.utcnow()}
+    )
+
+
+def _apply(migration: dict, statements: list) -> None:
+    """
+    Runs one migration on fresh connections: Concurrent statements on their own
+    in autocommit, consecutive others together in one transaction, which also
+    records the version.
+    """
+    batch = []
+    for statement in statements + [None]:
+        if statement is not None and not isinstance(statement, Concurrent):
+            batch.append(statement)
+            continue
+        if batch or statement is None:
+            with engine.begin() as connection:
+                for step in batch:
+                    _execute(connection, step)
+                if statement is None:
+                    _record(connection, migration)
+            batch = []
+        if statement is not None:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                connection.execute(text(statement))
+
+
+def run_migrations() -> list:
+    """Applies pending migrations in order, holding the migration lock. Returns the versions applied."""
+    dialect = engine.dialect.name
+    applied = []
+
+    with _migration_lock() as shared:
+        # Read under the lock: another worker may have just finished migrating
+        if shared is not None:
+            done = _applied_versions(shared)
+        else:
+            done = applied_versions()
+
+        for migration in MIGRATIONS:
+            if migration["version"] in done:
+                continue
+            print(f"Applying migration {migration['version']}: {migration['description']}")
+            statements = migration.get(dialect, [])
+            if shared is not None:
+                for statement in statements:
+                    _execute(shared, statement)
+                _record(shared, migration)
+            else:
+                _apply(migration, statements)
+            applied.append(migration["version"])
+
+    if not applied:
+        print("Schema is up to date.")
+    return applied
+
+
+def explain_hot_queries(user_id: str = "00000000-0000-0000-0000-000000000000") -> dict:
+    """Returns the query plan of each hot query, to check they use the indexes above."""
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    plans = {}
+    with engine.connect() as connection:
+        for name, query in HOT_QUERIES.items():
+            rows = connection.execute(text(prefix + query), {"user_id": user_id}).fetchall()
+            plans[name] = "\n".join(str(row[-1]) for row in rows)
+    return plans
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "up"
+    if command == "status":
+        done = applied_versions()
+        for migration in MIGRATIONS:
+            state = "applied" if migration["version"] in done else "pending"
+            print(f"{migration['version']} [{state}] {migration['description']}")
+    elif command == "explain":
+        for name, plan in explain_hot_queries().items():
+            print(f"--- {name} ---\n{plan}")
+    else:
+        run_migrations()
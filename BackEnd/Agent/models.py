@@ -3,27 +3,37 @@ import uuid
 from datetime import datetime
 from typing import Optional, Dict, List
 from sqlmodel import SQLModel, Field, Column, JSON
+from sqlalchemy.dialects.postgresql import JSONB
+
+# JSONB on Postgres (indexable, no re-parsing on read), plain JSON elsewhere
+JSONVariant = JSON().with_variant(JSONB(), "postgresql")
+
+# Indexes beyond primary/unique keys are managed by migrations.py
 
 # 1. Users
 class User(SQLModel, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     email: str = Field(index=True, unique=True)
     full_name: Optional[str] = None
-    password: str = Field(index=True)
+    password: str
     username: str = Field(index=True, unique=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     dp_url: Optional[str] = None
-    preferences: List[str] = Field(default=[], sa_column=Column(JSON))
+    preferences: List[str] = Field(default=[], sa_column=Column(JSONVariant))
 
 
 # 2. PantryItems
 class PantryItem(SQLModel, table=True):
     __tablename__ = "pantry_items_v2"
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: uuid.UUID = Field(foreign_key="user.id", index=True)
+    user_id: uuid.UUID = Field(foreign_key="user.id") # ix_pantry_items_v2_user_created
     name: str
     amount: Optional[str] = None
+    # Parsed from 'amount' on write (quantities.normalize_amount): value in g, ml or count;
+    # NULL when there is no plain amount ("to taste", "1 head", "2 cans")
+    amount_value: Optional[float] = None
+    amount_unit: Optional[str] = None
     image_url: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -31,11 +41,11 @@ class PantryItem(SQLModel, table=True):
 # 3. Recipes
 class Recipe(SQLModel, table=True):
     id: int = Field(default=None, primary_key=True)
-    user_id: uuid.UUID = Field(foreign_key="user.id", index=True)
+    user_id: uuid.UUID = Field(foreign_key="user.id") # ix_recipe_user_created
     title: str
     # Detailed data (Ingredients/Steps) stored as JSON for flexibility
-    content_json: Dict = Field(default={}, sa_column=Column(JSON)) 
-    source_url: Optional[str] = None # Youtube link if applicable
+    content_json: Dict = Field(default={}, sa_column=Column(JSONVariant)) 
+    source_url: Optional[str] = None # Youtube link if applicable (unique per user: ux_recipe_user_source)
     image_url: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
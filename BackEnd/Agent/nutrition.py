@@ -0,0 +1,176 @@
+import csv
+import os
+import re
+from array import array
+from typing import Annotated, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from langchain_core.tools import tool
+from langgraph.prebuilt import InjectedState
+
+from better_agent import Ingredient, Recipe
+from ingredients import canonical_ingredient
+from quantities import density_for, parse_quantity, stored_amount
+
+# --- Local Nutrition ---
+# Nutrition estimates from a bundled per-100 g table (nutrients.csv, approximate
+# USDA values) instead of one Spoonacular call per ingredient. The table is loaded
+# once into a (foods x nutrients) matrix; a recipe resolves each ingredient to a
+# row and its grams, then totals are one product: (grams / 100) @ table[rows].
+
+NUTRIENTS = ("calories", "protein_g", "fat_g", "carbs_g", "fiber_g", "sugar_g", "sodium_mg")
+NUTRIENTS_PATH = os.getenv(
+    "NUTRIENTS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "nutrients.csv")
+)
+
+# Leading words that don't change which food it is: "cherry tomato" counts as
+# tomato. Other compound names ("almond milk", "coconut water", "rice vinegar")
+# only match an explicit row in nutrients.csv; a shorter tail is an approximate
+# match and isn't counted.
+TAIL_MODIFIERS = {
+    "cherry", "grape", "roma", "plum", "heirloom", "baby", "red", "yellow", "white", "purple",
+    "russet", "yukon", "gold", "jasmine", "basmati", "long", "short", "grain", "brown",
+    "cheddar", "swiss", "monterey", "jack", "colby", "provolone", "gouda",
+    "dark", "semisweet", "bittersweet", "apple", "cider", "wine",
+}
+
+_WIDTH = len(NUTRIENTS)
+_rows: Dict[str, int] = {} # Canonical ingredient key (and aliases) -> row
+_table = np.zeros((0, _WIDTH)) # One row per food, values per 100 g
+_piece_grams = array("d") # Grams per piece for count amounts ("2 eggs"), 0 = unknown
+_densities = array("d") # g/ml for volume amounts, 0 = fall back to quantities.DENSITIES
+
+
+def _load(path: str) -> None:
+    global _table
+    values = array("d")
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            for record in csv.DictReader(f):
+                row = len(_piece_grams)
+                values.extend(float(record[n] or 0) for n in NUTRIENTS)
+                _piece_grams.append(float(record["grams_per_piece"] or 0))
+                _densities.append(float(record["density"] or 0))
+                for name in record["names"].split("|"):
+                    key = canonical_ingredient(name)
+                    if key:
+                        _rows.setdefault(key, row)
+        _table = np.frombuffer(values, dtype=np.float64).reshape(-1, _WIDTH)
+        print(f"Loaded nutrient table: {len(_piece_grams)} foods, {len(_rows)} names")
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Warning: Could not load nutrient table {path}: {e}")
+
+
+_load(NUTRIENTS_PATH)
+
+
+def _row_for(key: str) -> Tuple[Optional[int], Optional[str]]:
+    """
+    (row, None) for the exact key or a tail past TAIL_MODIFIERS ('cherry tomato' ->
+    'tomato'); (None, tail) when only a tail past other words is in the table
+    ('almond milk' -> 'milk'); (None, None) otherwise.
+    """
+    words = key.split()
+    for i in range(len(words)):
+        tail = " ".join(words[i:])
+        row = _rows.get(tail)
+        if row is not None:
+            if all(word in TAIL_MODIFIERS for word in words[:i]):
+                return row, None
+            return None, tail
+    return None, None
+
+
+def _grams(key: str, row: int, value: float, unit: str) -> Optional[float]:
+    if unit == "g":
+        return value
+    if unit == "ml":
+        density = _densities[row] or density_for(key)
+        return value * density if density else None
+    if unit == "count":
+        return value * _piece_grams[row] if _piece_grams[row] else None
+    return None
+
+
+def compute_nutrition(ingredients: Iterable[Ingredient], servings: int = 1) -> dict:
+    """
+    Total and per-serving nutrition for a list of Ingredients. Uses the stored
+    amount_value/amount_unit when present, otherwise parses 'amount'.
+    Ingredients that can't be counted are listed under 'skipped' with a reason.
+    """
+    servings = max(int(servings or 1), 1)
+    rows, grams_list = [], []
+    counted, skipped = [], []
+
+    for ing in ingredients:
+        key = canonical_ingredient(ing.name)
+        row, approximate = _row_for(key) if key else (None, None)
+        if approximate:
+            skipped.append({"name": ing.name, "reason": f"approximate match ({approximate})"})
+            continue
+        if row is None:
+            skipped.append({"name": ing.name, "reason": "not in nutrient table"})
+            continue
+
+        parsed = stored_amount(ing.amount_value, ing.amount_unit, ing.amount)
+        if parsed is None:
+            quantity = parse_quantity(ing.amount)
+            reason = f"can't convert {quantity.measure} to grams" if quantity and quantity.measure else "no amount"
+            skipped.append({"name": ing.name, "reason": reason})
+            continue
+
+        grams = _grams(key, row, parsed[0], parsed[1])
+        if grams is None:
+            skipped.append({"name": ing.name, "reason": f"can't convert {parsed[1]} to grams"})
+            continue
+
+        rows.append(row)
+        grams_list.append(grams)
+        counted.append({"name": ing.name, "key": key, "grams": round(grams, 1)})
+
+    totals = (np.array(grams_list) / 100) @ _table[rows] if rows else np.zeros(_WIDTH)
+    total_count = len(counted) + len(skipped)
+    return {
+        "servings": servings,
+        "per_serving": {n: round(float(v) / servings, 1) for n, v in zip(NUTRIENTS, totals)},
+        "total": {n: round(float(v), 1) for n, v in zip(NUTRIENTS, totals)},
+        "counted": counted,
+        "skipped": skipped,
+        "coverage": round(len(counted) / total_count, 2) if total_count else 0.0,
+    }
+
+
+def _parse_ingredient_lines(text: str) -> list:
+    """'200 g chicken breast; 1 cup rice' -> Ingredients (the name keeps the amount, it's stripped when matching)."""
+    return [Ingredient(name=line.strip(), amount=line.strip()) for line in re.split(r"[;\n]", text) if line.strip()]
+
+
+@tool
+def calculate_nutrition(
+    ingredients: Optional[str] = None,
+    servings: int = 1,
+    recipe: Annotated[Optional[Recipe], InjectedState("recipe")] = None
+):
+    """
+    Estimates calories, protein, fat, carbs, fiber, sugar and sodium per serving
+    from a local nutrient table (instant, no API call).
+    Leave 'ingredients' empty to use the recipe being cooked, or pass amounts and
+    names separated by ';' or newlines (e.g. "200 g chicken breast; 1 cup rice").
+    """
+    if ingredients:
+        items = _parse_ingredient_lines(ingredients)
+    elif recipe is not None:
+        items = recipe.ingredients
+    else:
+        return "No recipe in context. Pass the ingredients with their amounts."
+
+    result = compute_nutrition(items, servings)
+    per_serving = result["per_serving"]
+    lines = [
+        f"Per serving (recipe makes {result['servings']}): {per_serving['calories']:.0f} kcal | "
+        f"Protein {per_serving['protein_g']}g | Fat {per_serving['fat_g']}g | Carbs {per_serving['carbs_g']}g | "
+        f"Fiber {per_serving['fiber_g']}g | Sugar {per_serving['sugar_g']}g | Sodium {per_serving['sodium_mg']:.0f}mg"
+    ]
+    if result["skipped"]:
+        lines.append("Not counted: " + ", ".join(f"{s['name']} ({s['reason']})" for s in result["skipped"]))
+    return "\n".join(lines)
@@ -0,0 +1,302 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from ingredients import canonical_ingredient
+from rate_limit import RateLimited
+from recipe_registry import is_registered
+from tools import _spoonacular_get
+
+# --- Local Pantry Matcher ---
+# "What can I cook with my pantry?" is answered from recipes we've already seen
+# (Spoonacular details and search results, saved recipes, extracted recipes)
+# before spending Spoonacular quota.
+#   - every ingredient key gets a bit position; a recipe is an int bitmask
+#   - an inverted index (ingredient key -> recipe keys) finds candidates
+#   - used = popcount(recipe & pantry), missed = ingredient count - used
+# Ranking matches Spoonacular's ranking=2: fewest missed, then most used, then likes.
+# Spoonacular is only skipped when enough local matches are strong ones: few
+# missing ingredients and most of the recipe covered by something other than
+# staples (a shared "salt" or "oil" alone doesn't make a match).
+# Saved and extracted recipes belong to the user who saved/extracted them and are
+# only matched for that user. Extracted recipes are opened through the recipe
+# registry; entries whose registry ref has expired are dropped when they come up.
+
+MAX_INDEXED_RECIPES = 20000
+LOCAL_MATCH_MAX_MISSED = int(os.getenv("LOCAL_MATCH_MAX_MISSED", 3))
+LOCAL_MATCH_MIN_COVERAGE = float(os.getenv("LOCAL_MATCH_MIN_COVERAGE", 0.6)) # Share of the recipe's ingredients
+# Too common to count towards a strong match
+STAPLES = {"salt", "pepper", "water", "oil", "olive oil", "vegetable oil", "sugar", "flour", "ice"}
+# Rebuild bit positions once this many ingredient keys are no longer used by any recipe
+_MAX_DEAD_BITS = 5000
+
+
+class IndexedRecipe(NamedTuple):
+    key: str # "spoonacular:<id>", "saved:<id>" or "extracted:<owner>:<registry hash>"
+    id: int # Spoonacular/saved id, 0 for extracted recipes
+    source: str # spoonacular | saved | extracted
+    title: str
+    image: Optional[str]
+    likes: int
+    owner: Optional[str] # Saved and extracted recipes are only matched for their owner
+    recipe_ref: Optional[str]
+    source_url: Optional[str]
+    ingredients: Dict[str, str] # ingredient key -> display name
+    mask: int
+
+
+_bits: Dict[str, int] = {}
+_postings: Dict[str, set] = {}
+_recipes: "OrderedDict[str, IndexedRecipe]" = OrderedDict()
+_loaded_owners = set()
+_lock = threading.Lock()
+
+
+def _compact_bits_locked() -> None:
+    """Renumbers bit positions to the ingredient keys still in use and rebuilds the masks."""
+    _bits.clear()
+    for position, key in enumerate(_postings):
+        _bits[key] = position
+    for key, recipe in list(_recipes.items()):
+        mask = 0
+        for ingredient in recipe.ingredients:
+            mask |= 1 << _bits[ingredient]
+        _recipes[key] = recipe._replace(mask=mask)
+
+
+def _bit(key: str) -> int:
+    position = _bits.get(key)
+    if position is None:
+        position = _bits[key] = len(_bits)
+    return 1 << position
+
+
+def _remove_locked(key: str) -> None:
+    old = _recipes.pop(key, None)
+    if old is None:
+        return
+    for ingredient in old.ingredients:
+        keys = _postings.get(ingredient)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del _postings[ingredient]
+
+
+def index_recipe(
+    key: str, recipe_id: int, source: str, title: str, ingredient_names: Iterable[str],
+    image: Optional[str] = None, likes: int = 0, owner: Optional[str] = None,
+    recipe_ref: Optional[str] = None, source_url: Optional[str] = None
+) -> None:
+    """Adds or replaces a recipe in the index."""
+    ingredients = {}
+    for name in ingredient_names:
+        k = canonical_ingredient(name)
+        if k and k not in ingredients:
+            ingredients[k] = name
+    if not ingredients:
+        return
+
+    with _lock:
+        _remove_locked(key)
+        mask = 0
+        for k in ingredients:
+            mask |= _bit(k)
+            _postings.setdefault(k, set()).add(key)
+        _recipes[key] = IndexedRecipe(
+            key=key, id=recipe_id, source=source, title=title or "", image=image, likes=likes or 0,
+            owner=owner, recipe_ref=recipe_ref, source_url=source_url, ingredients=ingredients, mask=mask
+        )
+        while len(_recipes) > MAX_INDEXED_RECIPES:
+            evicted = _recipes[next(iter(_recipes))]
+            _remove_locked(evicted.key)
+            if evicted.source == "saved":
+                # The owner's saved recipes are no longer all indexed; reload on their next search
+                _loaded_owners.discard(evicted.owner)
+        if len(_bits) - len(_postings) > _MAX_DEAD_BITS:
+            _compact_bits_locked()
+
+
+def remove_recipe(key: str) -> None:
+    with _lock:
+        _remove_locked(key)
+
+
+def _is_indexed(key: str) -> bool:
+    with _lock:
+        return key in _recipes
+
+
+# --- Feeders ---
+
+def index_spoonacular_details(data: dict) -> None:
+    """From a /recipes/{id}/information payload."""
+    if not data.get("id"):
+        return
+    index_recipe(
+        f"spoonacular:{data['id']}", data["id"], "spoonacular", data.get("title"),
+        [i.get("name") or i.get("original", "") for i in data.get("extendedIngredients", [])],
+        image=data.get("image"), likes=data.get("aggregateLikes", 0), source_url=data.get("sourceUrl")
+    )
+
+
+def index_spoonacular_match(item: dict) -> None:
+    """
+    From a /recipes/findByIngredients result (used + missed is the full ingredient
+    list). An entry already indexed from the recipe details is richer and is kept.
+    """
+    if not item.get("id") or _is_indexed(f"spoonacular:{item['id']}"):
+        return
+    names = [i.get("name", "") for i in item.get("usedIngredients", []) + item.get("missedIngredients", [])]
+    index_recipe(
+        f"spoonacular:{item['id']}", item["id"], "spoonacular", item.get("title"), names,
+        image=item.get("image"), likes=item.get("likes", 0)
+    )
+
+
+def index_extracted_recipe(recipe_ref: str, recipe, owner) -> None:
+    """From an extracted (better_agent) Recipe registered under 'recipe_ref' for 'owner'."""
+    index_recipe(
+        f"extracted:{owner}:{recipe_ref}", 0, "extracted", recipe.name, [i.name for i in recipe.ingredients],
+        image=recipe.source_image, owner=str(owner), recipe_ref=recipe_ref, source_url=recipe.source
+    )
+
+
+def index_saved_recipe(recipe_id: int, owner, title: str, content: dict,
+                       image_url: Optional[str] = None, source_url: Optional[str] = None) -> None:
+    index_recipe(
+        f"saved:{recipe_id}", recipe_id, "saved", title,
+        [i.get("name", "") for i in (content or {}).get("ingredients", [])],
+        image=image_url, owner=str(owner), recipe_ref=f"saved:{recipe_id}", source_url=source_url
+    )
+
+
+def ensure_owner_loaded(owner, load) -> None:
+    """Indexes a user's saved recipes the first time they search. 'load' returns SavedRecipe rows."""
+    owner = str(owner)
+    with _lock:
+        if owner in _loaded_owners:
+            return
+    for row in load():
+        index_saved_recipe(row.id, owner, row.title, row.content_json, row.image_url, row.source_url)
+    with _lock:
+        _loaded_owners.add(owner)
+
+
+# --- Matching ---
+
+def match(
+    ingredient_names: List[str], number: int = 10, owner=None,
+    sources: Optional[Iterable[str]] = None, strong_only: bool = False
+) -> List[dict]:
+    """
+    Ranked local matches in the findByIngredients result shape (plus source/recipe_ref).
+    'sources' limits the recipe sources returned; 'strong_only' keeps only matches
+    good enough to answer without Spoonacular (see LOCAL_MATCH_*).
+    """
+    pantry_keys = {k for k in map(canonical_ingredient, ingredient_names) if k}
+    owner = str(owner) if owner else None
+    sources = set(sources) if sources is not None else None
+
+    with _lock:
+        pantry_mask = 0
+        staple_mask = 0
+        candidates = set()
+        for k in pantry_keys:
+            if k in _bits:
+                pantry_mask |= 1 << _bits[k]
+                if k in STAPLES:
+                    staple_mask |= 1 << _bits[k]
+                candidates |= _postings.get(k, set())
+
+        scored = []
+        for key in candidates:
+            recipe = _recipes[key]
+            if recipe.owner and recipe.owner != owner:
+                continue
+            if sources is not None and recipe.source not in sources:
+                continue
+            used_mask = recipe.mask & pantry_mask
+            used = used_mask.bit_count()
+            missed = len(recipe.ingredients) - used
+            if strong_only:
+                if not used_mask & ~staple_mask or missed > LOCAL_MATCH_MAX_MISSED:
+                    continue
+                if used < LOCAL_MATCH_MIN_COVERAGE * len(recipe.ingredients):
+                    continue
+            scored.append((missed, -used, -recipe.likes, recipe.title, recipe))
+
+    scored.sort(key=lambda s: s[:4])
+    results = []
+    for missed, neg_used, _, _, recipe in scored:
+        if len(results) >= number:
+            break
+        if recipe.source == "extracted" and not is_registered(recipe.recipe_ref):
+            remove_recipe(recipe.key) # Its ref expired from the registry: nothing could open it
+            continue
+        results.append({
+            "id": recipe.id,
+            "title": recipe.title,
+            "image": recipe.image,
+            "usedIngredientCount": -neg_used,
+            "missedIngredientCount": missed,
+            "missedIngredients": [name for k, name in recipe.ingredients.items() if k not in pantry_keys],
+            "likes": recipe.likes,
+            "source": recipe.source,
+            "recipe_ref": recipe.recipe_ref,
+            "source_url": recipe.source_url,
+        })
+    return results
+
+
+def find_recipes(
+    ingredient_names: List[str], number: int = 10, owner=None, sources: Optional[Iterable[str]] = None
+) -> List[dict]:
+    """
+    Local matches first; Spoonacular findByIngredients only when fewer than 'number'
+    of them are strong matches. Spoonacular results are indexed for next time.
+    'sources' limits which local recipes can be returned (None: all of them).
+    Raises RuntimeError (RateLimited if it was skipped by the rate limiter) if
+    Spoonacular is needed but fails and nothing matched locally.
+    """
+    strong = match(ingredient_names, number, owner, sources, strong_only=True)
+    if len(strong) >= number:
+        print(f"--- Pantry match served locally ({len(strong)} recipes) ---")
+        return strong
+
+    local = match(ingredient_names, number, owner, sources)
+
+    data = _spoonacular_get("/recipes/findByIngredients", {
+        "ingredients": ",".join(ingredient_names),
+        "number": number,
+        "ranking": 2, # Minimize missing ingredients
+        "ignorePantry": True
+    })
+    if isinstance(data, dict) and "error" in data:
+        if local:
+            print(f"Spoonacular unavailable, returning local matches: {data['error']}")
+            return local
+        if data.get("status") == "busy":
+            raise RateLimited.from_result(data)
+        raise RuntimeError(data["error"])
+
+    print(f"Spoonacular findByIngredients returned {len(data)} recipes")
+    results = {(r["source"], r["id"], r["recipe_ref"]): r for r in local}
+    for item in data:
+        index_spoonacular_match(item)
+        # Spoonacular's own used/missed counts (its ingredient matching is fuzzier than ours)
+        results.setdefault(("spoonacular", item.get("id"), None), {
+            "id": item.get("id"),
+            "title": item.get("title"),
+            "image": item.get("image"),
+            "usedIngredientCount": item.get("usedIngredientCount", 0),
+            "missedIngredientCount": item.get("missedIngredientCount", 0),
+            "missedIngredients": [i.get("name") for i in item.get("missedIngredients", [])],
+            "likes": item.get("likes", 0),
+            "source": "spoonacular",
+            "recipe_ref": None,
+            "source_url": None,
+        })
+    merged = sorted(results.values(), key=lambda r: (r["missedIngredientCount"], -r["usedIngredientCount"], -r["likes"]))
+    return merged[:number]
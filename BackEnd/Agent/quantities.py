@@ -0,0 +1,391 @@
+import re
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+# --- Unit Table ---
+# canonical unit -> (dimension, factor to the dimension's base unit)
+# Base units: grams (mass), millilitres (volume), pieces (count)
+UNITS = {
+    "mg": ("mass", 0.001),
+    "g": ("mass", 1.0),
+    "kg": ("mass", 1000.0),
+    "oz": ("mass", 28.3495),
+    "lb": ("mass", 453.592),
+    "ml": ("volume", 1.0),
+    "l": ("volume", 1000.0),
+    "tsp": ("volume", 4.92892),
+    "tbsp": ("volume", 14.7868),
+    "fl oz": ("volume", 29.5735),
+    "cup": ("volume", 236.588),
+    "pint": ("volume", 473.176),
+    "quart": ("volume", 946.353),
+    "gallon": ("volume", 3785.41),
+    "count": ("count", 1.0),
+    "dozen": ("count", 12.0),
+}
+
+UNIT_ALIASES = {
+    "mg": "mg", "milligram": "mg", "milligrams": "mg",
+    "g": "g", "gr": "g", "gram": "g", "grams": "g", "gramme": "g", "grammes": "g",
+    "kg": "kg", "kgs": "kg", "kilo": "kg", "kilos": "kg", "kilogram": "kg", "kilograms": "kg",
+    "oz": "oz", "ounce": "oz", "ounces": "oz",
+    "lb": "lb", "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "ml": "ml", "millilitre": "ml", "millilitres": "ml", "milliliter": "ml", "milliliters": "ml",
+    "l": "l", "litre": "l", "litres": "l", "liter": "l", "liters": "l",
+    "tsp": "tsp", "tsps": "tsp", "teaspoon": "tsp", "teaspoons": "tsp",
+    "tbsp": "tbsp", "tbsps": "tbsp", "tbs": "tbsp", "tablespoon": "tbsp", "tablespoons": "tbsp",
+    "fl oz": "fl oz", "fluid ounce": "fl oz", "fluid ounces": "fl oz",
+    "cup": "cup", "cups": "cup",
+    "pint": "pint", "pints": "pint", "pt": "pint",
+    "quart": "quart", "quarts": "quart", "qt": "quart",
+    "gallon": "gallon", "gallons": "gallon", "gal": "gallon",
+    "count": "count", "ct": "count", "piece": "count", "pieces": "count", "pcs": "count",
+    "dozen": "dozen",
+}
+
+# Count words that aren't interchangeable pieces: "2 cloves" and "1 head" of garlic
+# don't add up to 3 of anything. Counted amounts using them are only summed with
+# the same measure, and have no normalized amount.
+MEASURE_WORDS = {
+    "clove": "clove", "cloves": "clove", "head": "head", "heads": "head",
+    "can": "can", "cans": "can", "tin": "tin", "tins": "tin", "jar": "jar", "jars": "jar",
+    "bunch": "bunch", "bunches": "bunch", "sprig": "sprig", "sprigs": "sprig",
+    "stalk": "stalk", "stalks": "stalk", "slice": "slice", "slices": "slice",
+    "stick": "stick", "sticks": "stick", "loaf": "loaf", "loaves": "loaf",
+    "package": "package", "packages": "package", "pkg": "package", "pkgs": "package",
+    "packet": "packet", "packets": "packet", "bag": "bag", "bags": "bag",
+    "bottle": "bottle", "bottles": "bottle", "box": "box", "boxes": "box",
+    "carton": "carton", "cartons": "carton", "container": "container", "containers": "container",
+    "block": "block", "blocks": "block", "sheet": "sheet", "sheets": "sheet",
+    "envelope": "envelope", "envelopes": "envelope", "handful": "handful", "handfuls": "handful",
+    "pinch": "pinch", "pinches": "pinch", "dash": "dash", "dashes": "dash",
+}
+
+UNIT_DISPLAY = {
+    "mg": ("mg", "mg"),
+    "g": ("g", "g"),
+    "kg": ("kg", "kg"),
+    "oz": ("oz", "oz"),
+    "lb": ("lb", "lbs"),
+    "ml": ("ml", "ml"),
+    "l": ("l", "l"),
+    "tsp": ("tsp", "tsp"),
+    "tbsp": ("tbsp", "tbsp"),
+    "fl oz": ("fl oz", "fl oz"),
+    "cup": ("cup", "cups"),
+    "pint": ("pint", "pints"),
+    "quart": ("quart", "quarts"),
+    "gallon": ("gallon", "gallons"),
+    "count": ("", ""),
+    "dozen": ("dozen", "dozen"),
+}
+
+# Approximate densities (grams per millilitre) for volume <-> mass conversions.
+# Looked up by exact canonical ingredient key (ingredients.canonical_ingredient),
+# so modifiers it already drops ("granulated sugar", "unsalted butter") match,
+# while other foods that only contain a listed word ("sugar snap peas", "rice
+# vinegar", "peanut butter") don't: they have no density and aren't converted.
+DENSITIES = {
+    "sugar": 0.85,
+    "powdered sugar": 0.51,
+    "brown sugar": 0.93,
+    "light brown sugar": 0.93,
+    "dark brown sugar": 0.93,
+    "flour": 0.51,
+    "bread flour": 0.54,
+    "cake flour": 0.48,
+    "whole wheat flour": 0.51,
+    "cocoa": 0.42,
+    "cocoa powder": 0.42,
+    "unsweetened cocoa": 0.42,
+    "oats": 0.38,
+    "rolled oats": 0.38,
+    "quick oats": 0.38,
+    "rice": 0.78,
+    "white rice": 0.78,
+    "long grain rice": 0.78,
+    "butter": 0.96,
+    "honey": 1.42,
+    "maple syrup": 1.32,
+    "syrup": 1.37,
+    "corn syrup": 1.37,
+    "golden syrup": 1.37,
+    "olive oil": 0.91,
+    "oil": 0.92,
+    "vegetable oil": 0.92,
+    "canola oil": 0.92,
+    "milk": 1.03,
+    "buttermilk": 1.03,
+    "cream": 1.01,
+    "heavy cream": 1.01,
+    "yogurt": 1.03,
+    "plain yogurt": 1.03,
+    "greek yogurt": 1.03,
+    "water": 1.0,
+    "broth": 1.0,
+    "stock": 1.0,
+    "chicken broth": 1.0,
+    "beef broth": 1.0,
+    "vegetable broth": 1.0,
+    "salt": 1.22,
+    "baking soda": 0.92,
+    "baking powder": 0.9,
+    "cornstarch": 0.54,
+    "parmesan": 0.42,
+    "parmesan cheese": 0.42,
+    "cheese": 0.45,
+}
+
+UNICODE_FRACTIONS = {
+    "½": 0.5, "⅓": 1 / 3, "⅔": 2 / 3, "¼": 0.25, "¾": 0.75,
+    "⅛": 0.125, "⅜": 0.375, "⅝": 0.625, "⅞": 0.875,
+}
+
+_FRACTION_CHARS = "".join(UNICODE_FRACTIONS)
+
+NUMBER_PATTERN = (
+    rf"(?:\d+\s+\d+/\d+|\d+/\d+|\d+\s*[{_FRACTION_CHARS}]|[{_FRACTION_CHARS}]"
+    r"|\d*\.\d+|\d+)"
+)
+
+# Longest aliases first so "fl oz" wins over "oz"
+UNIT_PATTERN = "|".join(
+    re.escape(alias) for alias in sorted(UNIT_ALIASES, key=len, reverse=True)
+)
+
+_QUANTITY_RE = re.compile(
+    rf"^\s*(?P<num>{NUMBER_PATTERN})"
+    rf"(?:\s*(?:-|to)\s*(?P<num2>{NUMBER_PATTERN}))?"
+    rf"\s*(?:(?P<unit>{UNIT_PATTERN})\b\.?)?"
+    r"\s*(?P<rest>.*)$",
+    re.IGNORECASE,
+)
+
+
+# Leading measure word of a count, after an optional size note: "(14 oz) can tomatoes"
+_MEASURE_RE = re.compile(r"^(?:\([^)]*\)\s*)?(?P<word>[a-z]+)\b\.?", re.IGNORECASE)
+
+
+class Quantity(NamedTuple):
+    value: float
+    unit: str  # canonical unit key from UNITS
+    rest: str = ""  # trailing text after the unit, e.g. "flour, sifted"
+    measure: str = ""  # MEASURE_WORDS entry starting 'rest' of a count, e.g. "clove"
+
+    @property
+    def dimension(self) -> str:
+        return UNITS[self.unit][0]
+
+    @property
+    def item(self) -> str:
+        """'rest' without the measure word: '2 cloves garlic' -> 'garlic'."""
+        return _MEASURE_RE.sub("", self.rest, count=1).strip() if self.measure else self.rest
+
+
+def parse_number(text: str) -> Optional[float]:
+    """Parses '2', '1.5', '1/2', '1 1/2', '½' or '1½' into a float."""
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        if text[-1] in UNICODE_FRACTIONS:
+            whole = text[:-1].strip()
+            return (float(whole) if whole else 0.0) + UNICODE_FRACTIONS[text[-1]]
+        if "/" in text:
+            parts = text.split()
+            whole = float(parts[0]) if len(parts) == 2 else 0.0
+            num, den = parts[-1].split("/")
+            return whole + float(num) / float(den)
+        return float(text)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def normalize_unit(unit: str) -> Optional[str]:
+    """Maps a unit alias ('Tablespoons', 'lbs') to its canonical key."""
+    if not unit:
+        return None
+    return UNIT_ALIASES.get(re.sub(r"\s+", " ", unit.strip().lower()).rstrip("."))
+
+
+def parse_quantity(text: str) -> Optional[Quantity]:
+    """
+    Parses a free-text amount like '1 1/2 cups flour' or '2-3 tbsp'.
+    Ranges use their midpoint. Amounts without a unit are counted ('2 eggs').
+    Returns None if the text doesn't start with a number.
+    """
+    if not text:
+        return None
+    match = _QUANTITY_RE.match(text)
+    if not match:
+        return None
+
+    value = parse_number(match.group("num"))
+    if value is None:
+        return None
+    if match.group("num2"):
+        upper = parse_number(match.group("num2"))
+        if upper is not None:
+            value = (value + upper) / 2
+
+    unit = normalize_unit(match.group("unit") or "") or "count"
+    rest = match.group("rest").strip()
+    measure = ""
+    if unit == "count":
+        word = _MEASURE_RE.match(rest)
+        measure = MEASURE_WORDS.get(word.group("word").lower(), "") if word else ""
+    return Quantity(value=value, unit=unit, rest=rest, measure=measure)
+
+
+@lru_cache(maxsize=1)
+def _density_table() -> dict:
+    from ingredients import canonical_ingredient # ingredients imports this module
+    return {canonical_ingredient(name): density for name, density in DENSITIES.items()}
+
+
+def density_for(ingredient: str) -> Optional[float]:
+    """Returns grams per millilitre for a known ingredient, else None (no guessing from part of the name)."""
+    if not ingredient:
+        return None
+    from ingredients import canonical_ingredient
+    return _density_table().get(canonical_ingredient(ingredient))
+
+
+def convert(value: float, from_unit: str, to_unit: str, ingredient: str = None) -> Optional[float]:
+    """
+    Converts between canonical units. Mass <-> volume needs a known ingredient density.
+    Returns None when the conversion isn't possible.
+    """
+    if from_unit not in UNITS or to_unit not in UNITS:
+        return None
+    from_dim, from_factor = UNITS[from_unit]
+    to_dim, to_factor = UNITS[to_unit]
+    base = value * from_factor
+
+    if from_dim == to_dim:
+        return base / to_factor
+
+    density = density_for(ingredient)
+    if density is None:
+        return None
+    if from_dim == "volume" and to_dim == "mass":
+        return base * density / to_factor
+    if from_dim == "mass" and to_dim == "volume":
+        return base / density / to_factor
+    return None
+
+
+def format_number(value: float, unit: str = None) -> str:
+    """Formats a value for display, using kitchen fractions for spoon/cup measures."""
+    if unit in ("cup", "tsp", "tbsp", "count", "dozen", "pint", "quart", "gallon", "lb"):
+        eighths = round(value * 8)
+        if eighths == 0:
+            return f"{value:.2g}"
+        whole, rem = divmod(eighths, 8)
+        fraction = {0: "", 1: "1/8", 2: "1/4", 3: "3/8", 4: "1/2", 5: "5/8", 6: "3/4", 7: "7/8"}[rem]
+        if whole and fraction:
+            return f"{whole} {fraction}"
+        return str(whole) if whole else fraction
+    if value >= 100:
+        return str(int(round(value)))
+    if value >= 1:
+        return f"{value:.1f}".rstrip("0").rstrip(".")
+    return f"{value:.2g}"
+
+
+def format_quantity(value: float, unit: str) -> str:
+    """'1.5, cup' -> '1 1/2 cups'."""
+    singular, plural = UNIT_DISPLAY.get(unit, (unit, unit))
+    label = singular if value <= 1 else plural
+    number = format_number(value, unit)
+    return f"{number} {label}".strip()
+
+
+def scale_amount(amount: str, factor: float) -> Optional[str]:
+    """
+    Scales a free-text amount ('1 cup', '2 large eggs') by a factor.
+    Returns None if the amount has no leading number (e.g. 'to taste').
+    """
+    quantity = parse_quantity(amount)
+    if quantity is None:
+        return None
+    scaled = format_quantity(quantity.value * factor, quantity.unit)
+    return f"{scaled} {quantity.rest}".strip()
+
+
+# Joins amounts that couldn't be summed ("1 kg + 2 cups")
+MIXED_SEPARATOR = " + "
+
+
+def merge_amounts(current: Optional[str], added: Optional[str], ingredient: str = None) -> Optional[str]:
+    """
+    Combines two free-text amounts for the same item ('1 cup' + '250 ml').
+    Sums in the current amount's unit when the added one converts to it (mass <->
+    volume through the ingredient's density), otherwise keeps both texts joined
+    with ' + '. Counts are summed only with the same measure word and item
+    ('2 cloves garlic' + '1 head garlic' stays as written).
+    """
+    if not current:
+        return added
+    if not added:
+        return current
+
+    a = parse_quantity(current)
+    b = parse_quantity(added)
+    if a and b and MIXED_SEPARATOR not in current and _same_kind(a, b):
+        added_value = convert(b.value, b.unit, a.unit, ingredient)
+        if added_value is not None:
+            return f"{format_quantity(a.value + added_value, a.unit)} {a.rest}".strip()
+    return f"{current}{MIXED_SEPARATOR}{added}"
+
+
+def _same_kind(a: Quantity, b: Quantity) -> bool:
+    """Counts of the same thing: same measure word, and the same item where both name one."""
+    if a.unit != "count" and b.unit != "count":
+        return True
+    return a.measure == b.measure and (a.item == b.item or not a.item or not b.item)
+
+
+# --- Normalized Amounts ---
+# Stored next to the free-text amount at ingest (pantry rows, extracted and saved
+# recipes, Spoonacular details) so shopping diffs and "do I have enough" are
+# plain arithmetic instead of a model call.
+
+BASE_UNITS = {"mass": "g", "volume": "ml", "count": "count"}
+
+
+@lru_cache(maxsize=10000)
+def normalize_amount(text: Optional[str]) -> Optional[Tuple[float, str]]:
+    """
+    Converts a free-text amount to (value, base unit):
+    '1 Gallon' -> (3785.41, 'ml'), '12 count' -> (12.0, 'count'), 'to taste' -> None.
+    A merged '1 kg + 500 g' is summed; a sum across dimensions ('1 kg + 2 cups')
+    returns None rather than a value that leaves part of the text out. So does a
+    count with a measure word ('1 head', '2 cans'): it isn't a number of pieces.
+    """
+    if text and MIXED_SEPARATOR in text:
+        parts = [normalize_amount(part) for part in text.split(MIXED_SEPARATOR)]
+        if any(p is None for p in parts) or len({unit for _, unit in parts}) > 1:
+            return None
+        return round(sum(value for value, _ in parts), 4), parts[0][1]
+    quantity = parse_quantity(text)
+    if quantity is None or quantity.measure:
+        return None
+    dimension, factor = UNITS[quantity.unit]
+    return round(quantity.value * factor, 4), BASE_UNITS[dimension]
+
+
+def stored_amount(value: Optional[float], unit: Optional[str], text: Optional[str]) -> Optional[Tuple[float, str]]:
+    """
+    The amount_value/amount_unit stored at ingest, or 'text' normalized now for
+    older payloads. Counts stored before measure words were told apart ('2 cloves'
+    as 2 count) are normalized again.
+    """
+    if value is not None and unit and (unit != "count" or not text):
+        return value, unit
+    return normalize_amount(text)
+
+
+def normalize_amounts(texts: Iterable[Optional[str]]) -> List[Optional[Tuple[float, str]]]:
+    """Batch form of normalize_amount, used at ingest."""
+    return [normalize_amount(t) for t in texts]
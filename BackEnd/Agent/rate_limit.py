@@ -0,0 +1,281 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from enum import IntEnum
+from typing import Dict, List, Optional
+
+from deadline import cap_wait
+
+# --- Upstream Scheduler ---
+# Spoonacular and SerpAPI calls go through a per-provider scheduler instead of
+# firing immediately with a single key:
+#   - a token bucket per API key, sized to the plan's rate limit
+#   - a daily point budget per key (configured, and synced from Spoonacular's
+#     X-API-Quota-* headers); 402 marks a key spent until the UTC day rolls over,
+#     429 cools it down
+#   - several keys per provider ("key1,key2" in the usual env var), picked by
+#     most budget left
+#   - priority classes: interactive calls wait longest and can spend the whole
+#     budget; background enrichment and prefetch give way to them, wait less and
+#     leave a reserve of the daily budget untouched
+# When nothing is available in time, acquire() raises RateLimited. It isn't an
+# upstream error: tools hand the model a typed "busy" result (as_result()) and
+# data paths skip the call without caching anything.
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0 # Chat, endpoints the user is waiting on
+    BACKGROUND = 1 # Extraction enrichment (images)
+    PREFETCH = 2 # Prefetch, warm-up, cache refresh
+
+# Max seconds a call waits for a token
+MAX_WAIT = {
+    Priority.INTERACTIVE: float(os.getenv("UPSTREAM_MAX_WAIT", 5)),
+    Priority.BACKGROUND: 2.0,
+    Priority.PREFETCH: 0.0,
+}
+# Share of a key's daily budget that lower priorities must leave for interactive calls
+BUDGET_RESERVE = {
+    Priority.INTERACTIVE: 0.0,
+    Priority.BACKGROUND: 0.1,
+    Priority.PREFETCH: 0.25,
+}
+# Cool-down after a 429 without Retry-After
+RATE_LIMITED_COOLDOWN = 30.0
+
+# provider -> (key env var, default requests/second, default burst)
+PROVIDERS = {
+    "spoonacular": ("SPOONACULAR_API_KEY", 5.0, 10),
+    "serpapi": ("SERP_API_KEY", 2.0, 5),
+}
+
+_priority: ContextVar[Priority] = ContextVar("upstream_priority", default=Priority.INTERACTIVE)
+
+
+class RateLimited(RuntimeError):
+    """No key could serve the call within its priority's wait/budget limits."""
+
+    def __init__(self, message: str, provider: Optional[str] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.provider = provider
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_result(cls, data: dict) -> "RateLimited":
+        """Rebuilds the exception from a busy result (see tools._spoonacular_get)."""
+        return cls(data.get("error", "rate limited"), data.get("provider"), data.get("retry_after_seconds"))
+
+    def as_result(self) -> dict:
+        """Typed 'busy' result for tools: the lookup was skipped, nothing failed."""
+        return {
+            "status": "busy",
+            "provider": self.provider,
+            "retry_after_seconds": round(self.retry_after) if self.retry_after is not None else None,
+            "message": f"{self.provider} lookups are paused by our rate limits; continue without this result.",
+        }
+
+
+def _seconds_to_utc_midnight() -> float:
+    now = datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+
+@contextmanager
+def request_priority(priority: Priority):
+    """Upstream calls made inside the block are scheduled at 'priority'."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+def with_priority(priority: Priority):
+    """Decorator form of request_priority (e.g. for graph nodes)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with request_priority(priority):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+class _KeyState:
+    def __init__(self, key: str, burst: int, daily_budget: Optional[float]):
+        self.key = key
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.daily_budget = daily_budget
+        self.day = _today()
+        self.spent = 0.0
+        self.upstream_left: Optional[float] = None # From quota headers, authoritative when known
+        self.cooldown_until = 0.0
+        self.calls = 0
+
+    def roll_day(self) -> None:
+        today = _today()
+        if today != self.day:
+            self.day, self.spent, self.upstream_left = today, 0.0, None
+
+    def remaining(self) -> Optional[float]:
+        limits = [v for v in (
+            self.daily_budget - self.spent if self.daily_budget is not None else None,
+            self.upstream_left,
+        ) if v is not None]
+        return min(limits) if limits else None
+
+
+class ProviderScheduler:
+    def __init__(self, name: str, keys: List[str], rate: float, burst: int, daily_budget: Optional[float]):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._keys = [_KeyState(k, burst, daily_budget) for k in keys]
+        self._waiting = {p: 0 for p in Priority}
+        self._cond = threading.Condition()
+        self._stats = {"granted": 0, "rate_limited": 0, "budget_exhausted": 0}
+
+    @property
+    def key_count(self) -> int:
+        return len(self._keys)
+
+    def _pick(self, now: float, cost: float, priority: Priority):
+        """(key, 0) if one can serve now, (None, seconds) to wait, (None, None) if no budget left."""
+        best, best_left, wait = None, None, None
+        for state in self._keys:
+            state.roll_day()
+            state.tokens = min(self.burst, state.tokens + (now - state.refilled_at) * self.rate)
+            state.refilled_at = now
+
+            left = state.remaining()
+            if left is not None:
+                budget = state.daily_budget or (state.upstream_left + state.spent if state.upstream_left is not None else 0)
+                if left - cost < BUDGET_RESERVE[priority] * budget or left < cost:
+                    continue
+
+            ready_in = max(state.cooldown_until - now, (1 - state.tokens) / self.rate if state.tokens < 1 else 0.0)
+            if ready_in > 0:
+                wait = ready_in if wait is None else min(wait, ready_in)
+                continue
+            left_rank = float("inf") if left is None else left
+            if best is None or left_rank > best_left:
+                best, best_left = state, left_rank
+        return (best, 0.0) if best is not None else (None, wait)
+
+    def acquire(self, cost: float = 1.0, priority: Optional[Priority] = None) -> str:
+        """Blocks until a key can make the call and returns it. Raises RateLimited."""
+        priority = _priority.get() if priority is None else priority
+        deadline = time.monotonic() + cap_wait(MAX_WAIT[priority]) # Never past the request's deadline
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    state, wait = self._pick(now, cost, priority)
+                    outranked = any(self._waiting[p] for p in Priority if p < priority)
+                    if state is not None and not outranked:
+                        state.tokens -= 1
+                        state.spent += cost
+                        state.calls += 1
+                        self._stats["granted"] += 1
+                        return state.key
+                    if state is None and wait is None:
+                        self._stats["budget_exhausted"] += 1
+                        raise RateLimited(
+                            f"{self.name} daily quota reached, try again later", self.name, _seconds_to_utc_midnight()
+                        )
+                    if outranked:
+                        wait = 0.05
+                    if now + wait > deadline:
+                        self._stats["rate_limited"] += 1
+                        raise RateLimited(f"{self.name} is busy, try again shortly", self.name, wait)
+                    self._cond.wait(min(wait, deadline - now))
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def report(self, key: str, status_code: Optional[int] = None, headers=None) -> None:
+        """Feeds back an upstream response: quota headers, 402 (out of points), 429 (slow down)."""
+        headers = headers or {}
+        with self._cond:
+            state = next((s for s in self._keys if s.key == key), None)
+            if state is None:
+                return
+            used = headers.get("X-API-Quota-Request")
+            left = headers.get("X-API-Quota-Left")
+            try:
+                if used is not None:
+                    state.spent += float(used) - 1 # 1 was charged up front
+                if left is not None:
+                    state.upstream_left = float(left)
+            except ValueError:
+                pass
+            if status_code == 402:
+                state.upstream_left = 0.0
+                print(f"{self.name} key ...{key[-4:]} is out of quota for today")
+            elif status_code == 429:
+                try:
+                    retry_after = float(headers.get("Retry-After", RATE_LIMITED_COOLDOWN))
+                except ValueError:
+                    retry_after = RATE_LIMITED_COOLDOWN
+                state.cooldown_until = time.monotonic() + retry_after
+            self._cond.notify_all()
+
+    def quota_left(self) -> Optional[float]:
+        """Budget left across keys, or None if no key's budget is known."""
+        with self._cond:
+            known = [r for r in (s.remaining() for s in self._keys) if r is not None]
+            unknown = len(known) < len(self._keys)
+        return None if unknown or not known else sum(known)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                **self._stats,
+                "keys": [{
+                    "key": f"...{s.key[-4:]}",
+                    "calls": s.calls,
+                    "spent_today": round(s.spent, 2),
+                    "remaining": s.remaining(),
+                    "cooling_down": s.cooldown_until > time.monotonic(),
+                } for s in self._keys],
+            }
+
+
+_schedulers: Dict[str, ProviderScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def scheduler(provider: str) -> ProviderScheduler:
+    """The provider's scheduler, configured from the environment on first use."""
+    with _schedulers_lock:
+        if provider not in _schedulers:
+            env, rate, burst = PROVIDERS[provider]
+            prefix = provider.upper()
+            budget = os.getenv(f"{prefix}_DAILY_BUDGET")
+            _schedulers[provider] = ProviderScheduler(
+                provider,
+                [k.strip() for k in os.getenv(env, "").split(",") if k.strip()],
+                rate=float(os.getenv(f"{prefix}_RATE_PER_SEC", rate)),
+                burst=int(os.getenv(f"{prefix}_BURST", burst)),
+                daily_budget=float(budget) if budget else None,
+            )
+        return _schedulers[provider]
+
+
+def rate_limit_stats() -> dict:
+    return {name: s.stats() for name, s in _schedulers.items()}
@@ -0,0 +1,192 @@
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+from cache import TTLCache
+from pantry_matcher import index_spoonacular_details
+from quantities import normalize_amount
+from rate_limit import Priority, RateLimited, request_priority, scheduler
+from tools import _spoonacular_get
+
+# --- Spoonacular Recipe Details ---
+# Raw /recipes/{id}/information payloads are cached per recipe id and shared by
+# the /recipes/{id}/full endpoint and the get_recipe_information tool, and
+# indexed by the pantry matcher. Lists of recipes are fetched with one
+# /recipes/informationBulk call for whatever isn't cached yet.
+
+RECIPE_DETAILS_TTL = int(os.getenv("RECIPE_DETAILS_TTL", 24 * 3600))
+# Max ids per informationBulk request
+BULK_CHUNK_SIZE = int(os.getenv("RECIPE_BULK_CHUNK_SIZE", 50))
+
+_details = TTLCache(maxsize=2000, ttl=RECIPE_DETAILS_TTL)
+
+
+def is_cached(recipe_id: int) -> bool:
+    return recipe_id in _details
+
+
+def get_recipe_information(recipe_id: int) -> dict:
+    """
+    Returns Spoonacular's recipe information. Raises RateLimited if the call was
+    skipped by the rate limiter, RuntimeError if the lookup fails.
+    """
+    data = _details.get(recipe_id)
+    if data is not None:
+        return data
+
+    data = _spoonacular_get(f"/recipes/{recipe_id}/information", {"includeNutrition": False})
+    if data.get("status") == "busy":
+        raise RateLimited.from_result(data)
+    if "error" in data:
+        raise RuntimeError(data["error"])
+    _details.set(recipe_id, data)
+    index_spoonacular_details(data)
+    return data
+
+
+def get_recipes_information(recipe_ids: Iterable[int]) -> Dict[int, dict]:
+    """
+    Recipe information for many ids: cached ones are served locally, the rest are
+    fetched with /recipes/informationBulk (one call per BULK_CHUNK_SIZE ids).
+    Ids that couldn't be fetched are left out of the result.
+    """
+    found = {}
+    misses = []
+    for recipe_id in dict.fromkeys(recipe_ids): # Dedupe, keep order
+        data = _details.get(recipe_id)
+        if data is not None:
+            found[recipe_id] = data
+        else:
+            misses.append(recipe_id)
+
+    for start in range(0, len(misses), BULK_CHUNK_SIZE):
+        chunk = misses[start:start + BULK_CHUNK_SIZE]
+        data = _spoonacular_get("/recipes/informationBulk", {
+            "ids": ",".join(map(str, chunk)),
+            "includeNutrition": False
+        })
+        if isinstance(data, dict) and "error" in data:
+            print(f"Spoonacular informationBulk failed for {len(chunk)} recipes: {data['error']}")
+            continue
+        print(f"Spoonacular informationBulk returned {len(data)} of {len(chunk)} recipes")
+        for item in data:
+            if item.get("id") in chunk:
+                _details.set(item["id"], item)
+                index_spoonacular_details(item)
+                found[item["id"]] = item
+
+    return found
+
+
+# --- Speculative Prefetch ---
+# Users open the top results of a search almost every time, so once a search
+# response is sent the top RECIPE_PREFETCH_TOP_K uncached recipes are fetched in
+# one informationBulk call and the tap becomes a cache read. Skipped when the
+# Spoonacular quota is nearly spent; a newer search by the same user cancels a
+# prefetch that hasn't run yet.
+
+RECIPE_PREFETCH_TOP_K = int(os.getenv("RECIPE_PREFETCH_TOP_K", 3))
+# Quota points that must be left for a prefetch to run
+RECIPE_PREFETCH_MIN_QUOTA = float(os.getenv("RECIPE_PREFETCH_MIN_QUOTA", 20))
+
+_prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="recipe-prefetch")
+_pending: Dict[str, Future] = {}
+_pending_lock = threading.Lock()
+
+
+def _quota_allows_prefetch() -> bool:
+    left = scheduler("spoonacular").quota_left()
+    return left is None or left >= RECIPE_PREFETCH_MIN_QUOTA
+
+
+def _run_prefetch(recipe_ids: list) -> None:
+    # Re-checked at run time: the user may have opened a recipe in the meantime
+    recipe_ids = [r for r in recipe_ids if r not in _details]
+    if not recipe_ids or not _quota_allows_prefetch():
+        return
+    print(f"--- Prefetching recipe details: {recipe_ids} ---")
+    with request_priority(Priority.PREFETCH):
+        get_recipes_information(recipe_ids)
+
+
+def _forget_pending(key: str, future: Future) -> None:
+    with _pending_lock:
+        if _pending.get(key) is future:
+            del _pending[key]
+
+
+def cancel_prefetch(key: str) -> bool:
+    """Cancels a scheduled prefetch that hasn't started. Returns True if one was cancelled."""
+    with _pending_lock:
+        future = _pending.pop(key, None)
+    return future.cancel() if future is not None else False
+
+
+def prefetch_recipes(recipe_ids: Iterable[int], key: Optional[str] = None) -> Optional[Future]:
+    """
+    Schedules a background fetch of the first RECIPE_PREFETCH_TOP_K ids that aren't
+    cached. 'key' (e.g. the user id) replaces that user's previous pending prefetch.
+    """
+    if RECIPE_PREFETCH_TOP_K <= 0:
+        return None
+    top = [r for r in list(dict.fromkeys(recipe_ids))[:RECIPE_PREFETCH_TOP_K] if r and r not in _details]
+    if not top:
+        return None
+    if not _quota_allows_prefetch():
+        print(f"Skipping recipe prefetch, Spoonacular quota left: {scheduler('spoonacular').quota_left()}")
+        return None
+
+    if key is not None:
+        cancel_prefetch(key)
+    future = _prefetch_executor.submit(_run_prefetch, top)
+    if key is not None:
+        with _pending_lock:
+            _pending[key] = future
+        future.add_done_callback(lambda f: _forget_pending(key, f))
+    return future
+
+
+def to_app_recipe(data: dict) -> dict:
+    """Maps a Spoonacular information payload to the App's RecipeResponse format."""
+    # 1. Ingredients
+    ingredients = []
+    for ing in data.get("extendedIngredients", []):
+        amount = f"{ing.get('amount', '')} {ing.get('unit', '')}".strip()
+        parsed = normalize_amount(amount)
+        ingredients.append({
+            "name": ing.get("original", ing.get("name")),
+            "amount": amount,
+            "amount_value": parsed[0] if parsed else None,
+            "amount_unit": parsed[1] if parsed else None,
+            "imageUrl": f"https://img.spoonacular.com/ingredients_100x100/{ing.get('image', '')}"
+        })
+
+    # 2. Steps
+    steps = []
+    if data.get("analyzedInstructions"):
+        for step in data["analyzedInstructions"][0].get("steps", []):
+            steps.append({
+                "instruction": step.get("step"),
+                "visual_query": None,
+                "imageUrl": None
+            })
+    else:
+        # Fallback to splitting instructions string
+        instr = data.get("instructions", "")
+        if instr:
+            # Remove HTML tags if any
+            clean_instr = re.sub('<[^<]+?>', '', instr)
+            steps = [{
+                "instruction": s.strip(),
+                "visual_query": None,
+                "imageUrl": None
+            } for s in clean_instr.split('.') if s.strip()]
+
+    return {
+        "name": data.get("title"),
+        "total_time": str(data.get("readyInMinutes", 0)) + " mins",
+        "ingredients": ingredients,
+        "steps": steps
+    }
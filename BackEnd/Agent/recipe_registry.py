@@ -0,0 +1,88 @@
+import hashlib
+import json
+from typing import Any, Dict, Optional, Tuple
+from pydantic import ValidationError
+from sqlmodel import Session
+
+from better_agent import Recipe
+from cache import TTLCache
+from database import engine
+from models import Recipe as SavedRecipe
+
+# --- Recipe Registry ---
+# Cooking sessions send the same recipe on every chat turn. Recipes are registered
+# once and referenced afterwards, so /chat skips re-sending and re-validating them.
+#   "<content hash>"   -> recipe registered through /chat/recipes (in-memory)
+#   "saved:<id>"       -> recipe from the 'recipe' table (loaded once, then cached),
+#                         only for the user who saved it
+
+SAVED_PREFIX = "saved:"
+
+_recipes = TTLCache(maxsize=500, ttl=6 * 3600)
+_saved = TTLCache(maxsize=500, ttl=6 * 3600) # "saved:<id>" -> (owner id, Recipe)
+
+
+class InvalidSavedRecipe(ValueError):
+    """A saved row whose content isn't a valid Recipe (e.g. saved by an older app version)."""
+
+
+def recipe_hash(data: Dict[str, Any]) -> str:
+    """Stable content hash of a recipe payload."""
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def register_recipe(data: Dict[str, Any]) -> Tuple[str, Recipe]:
+    """
+    Parses a recipe payload once and stores it under its content hash.
+    Raises pydantic.ValidationError if the payload isn't a valid Recipe.
+    """
+    ref = recipe_hash(data)
+    recipe = _recipes.get(ref)
+    if recipe is None:
+        recipe = Recipe(**data)
+        _recipes.set(ref, recipe)
+    return ref, recipe
+
+
+def is_registered(ref: str) -> bool:
+    """True while a (non-saved) ref is still in the registry, without refreshing it."""
+    return ref in _recipes
+
+
+def get_recipe(ref: str, user_id=None) -> Optional[Recipe]:
+    """
+    Looks up a registered recipe. 'saved:<id>' refs are loaded from the database
+    and only resolve for their owner ('user_id'); None otherwise.
+    Raises InvalidSavedRecipe if the saved content isn't a valid Recipe.
+    """
+    if not ref.startswith(SAVED_PREFIX):
+        return _recipes.get(ref)
+    if user_id is None:
+        return None
+
+    cached = _saved.get(ref)
+    if cached is None:
+        try:
+            recipe_id = int(ref[len(SAVED_PREFIX):])
+        except ValueError:
+            return None
+
+        with Session(engine) as session:
+            row = session.get(SavedRecipe, recipe_id)
+        if not row or not row.content_json:
+            return None
+        try:
+            recipe = Recipe(**row.content_json)
+        except ValidationError as e:
+            raise InvalidSavedRecipe(f"Saved recipe {recipe_id} can't be used: {e}")
+        cached = (str(row.user_id), recipe)
+        _saved.set(ref, cached)
+
+    owner, recipe = cached
+    return recipe if owner == str(user_id) else None
+
+
+def forget_saved_recipe(recipe_id: int) -> None:
+    """Drops a cached 'saved:<id>' recipe after it was updated or deleted."""
+    _saved.pop(f"{SAVED_PREFIX}{recipe_id}")
@@ -0,0 +1,106 @@
+import re
+import uuid
+from typing import Annotated, List, Optional
+from langchain_core.tools import tool
+from langgraph.prebuilt import InjectedState
+from sqlalchemy import bindparam
+from sqlmodel import Session, text
+
+from database import engine
+from models import Recipe as SavedRecipe
+
+# --- Saved Recipe Search ---
+# Local full-text search over a user's saved recipes (title, ingredient names, step text).
+#   Postgres: 'search_vector' generated tsvector column + GIN index (migration 0007);
+#             title/ingredients/steps are weighted A/B/C and ingredient filters match weight B.
+#   SQLite:   'recipe_fts' FTS5 table kept in sync by triggers (migration 0007).
+# Every search term is prefix-matched ("chick" finds "chicken").
+
+DEFAULT_LIMIT = 10
+
+_POSTGRES_SEARCH = """
+    SELECT id, title, image_url, source_url, created_at, ts_rank_cd(search_vector, query) AS rank
+    FROM recipe, to_tsquery('english', :query) query
+    WHERE user_id = :user_id AND search_vector @@ query
+    ORDER BY rank DESC, created_at DESC
+    LIMIT :limit
+"""
+
+_SQLITE_SEARCH = """
+    SELECT r.id, r.title, r.image_url, r.source_url, r.created_at, -bm25(recipe_fts, 10.0, 5.0, 1.0) AS rank
+    FROM recipe_fts JOIN recipe r ON r.id = recipe_fts.rowid
+    WHERE recipe_fts MATCH :query AND r.user_id = :user_id
+    ORDER BY rank DESC, r.created_at DESC
+    LIMIT :limit
+"""
+
+
+def _terms(value: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", (value or "").lower())
+
+
+def _postgres_query(query: str, ingredients: List[str]) -> str:
+    parts = [f"{t}:*" for t in _terms(query)]
+    parts += [f"{t}:*B" for i in ingredients for t in _terms(i)]
+    return " & ".join(parts)
+
+
+def _sqlite_query(query: str, ingredients: List[str]) -> str:
+    parts = [f'"{t}"*' for t in _terms(query)]
+    parts += [f'ingredients : ("{t}"*)' for i in ingredients for t in _terms(i)]
+    return " AND ".join(parts)
+
+
+def search_saved_recipes(
+    session: Session,
+    user_id: uuid.UUID,
+    query: str = "",
+    ingredients: Optional[List[str]] = None,
+    limit: int = DEFAULT_LIMIT,
+) -> List[dict]:
+    """Ranked matches from the user's saved recipes; each ingredient filter must match an ingredient name."""
+    ingredients = ingredients or []
+    if session.bind.dialect.name == "postgresql":
+        statement, match = _POSTGRES_SEARCH, _postgres_query(query, ingredients)
+    else:
+        statement, match = _SQLITE_SEARCH, _sqlite_query(query, ingredients)
+    if not match:
+        return []
+
+    statement = text(statement).bindparams(bindparam("user_id", type_=SavedRecipe.__table__.c.user_id.type))
+    rows = session.exec(statement, params={"query": match, "user_id": user_id, "limit": limit}).all()
+    return [
+        {
+            "id": row.id,
+            "title": row.title,
+            "image_url": row.image_url,
+            "source_url": row.source_url,
+            "created_at": row.created_at,
+            "rank": float(row.rank),
+        }
+        for row in rows
+    ]
+
+
+@tool
+def search_my_recipes(
+    query: str,
+    ingredients: Optional[str] = None,
+    user_id: Annotated[Optional[str], InjectedState("user_id")] = None,
+):
+    """
+    Search the user's own saved recipe library (e.g. "that chicken curry from last week").
+    'query' matches titles, ingredients and steps; 'ingredients' is an optional comma-separated
+    list the recipe must contain. Use this before searching the web for a recipe the user saved.
+    """
+    if not user_id:
+        return "No user is signed in, so there is no saved recipe library to search."
+
+    with Session(engine) as session:
+        results = search_saved_recipes(
+            session, uuid.UUID(str(user_id)), query,
+            [i for i in (ingredients or "").split(",") if i.strip()]
+        )
+    if not results:
+        return "No saved recipes matched."
+    return "\n".join(f"Saved ID: {r['id']} | Title: {r['title']} | Source: {r['source_url']}" for r in results)
@@ -0,0 +1,309 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+import requests
+
+from deadline import cap_wait, check_deadline, time_left
+
+# --- Upstream Resilience ---
+# Every outbound call (Spoonacular, SerpAPI, scraped pages, downloads, Gemini)
+# goes through a per-host circuit breaker:
+#   - closed: calls go through; BREAKER_FAILURES consecutive failures open it
+#   - open: calls fail fast with CircuitOpen for BREAKER_RESET seconds
+#   - half-open: one probe call decides between closed and open again
+# HTTP GETs also get timeouts, bounded retries with exponential backoff and full
+# jitter (connection errors, timeouts and 5xx only), and, for hosts listed in
+# UPSTREAM_HEDGE_HOSTS, a hedged duplicate request once the first one is slower
+# than the host's recent p95 latency (first response wins). Inside a request with
+# a deadline (deadline.py), timeouts and backoff are capped to the time left.
+# Only an unhealthy host counts as a breaker failure: transport errors, timeouts,
+# 429 and 5xx. A healthy host's unusable answer (a structured-output validation or
+# parse error, a 4xx) is re-raised without counting.
+
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", 15)) # Read timeout, seconds
+UPSTREAM_CONNECT_TIMEOUT = 5.0
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", 2))
+RETRY_BASE_DELAY = 0.25
+RETRY_MAX_DELAY = 4.0
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", 30))
+# SerpAPI serves repeated searches from its own cache, so a duplicate is cheap there;
+# Spoonacular charges points per request, so it isn't hedged by default.
+UPSTREAM_HEDGE_HOSTS = {h.strip() for h in os.getenv("UPSTREAM_HEDGE_HOSTS", "serpapi.com").split(",") if h.strip()}
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.3
+
+# Gemini clients get a bounded time and retry budget too (langchain through
+# GEMINI_CLIENT_OPTIONS, genai generate_content through gemini_request_options)
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 60))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 2))
+GEMINI_CLIENT_OPTIONS = {"timeout": GEMINI_TIMEOUT, "max_retries": GEMINI_MAX_RETRIES}
+
+_RETRYABLE_STATUS = {500, 502, 503, 504}
+_TRANSPORT_ERRORS = (TimeoutError, ConnectionError, requests.ConnectionError, requests.Timeout, httpx.TransportError)
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """HTTP status carried by a client exception (google.api_core, google.genai, requests, httpx)."""
+    for value in (getattr(error, "status_code", None), getattr(error, "code", None),
+                  getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    return None
+
+
+def _is_upstream_failure(error: BaseException) -> bool:
+    """True if 'error' (or an exception it wraps) says the upstream is unhealthy."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, _TRANSPORT_ERRORS):
+            return True
+        status = _status_code(error)
+        if status is not None and (status == 429 or status >= 500):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class CircuitOpen(RuntimeError):
+    """The host failed repeatedly; calls fail fast until the breaker resets."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=200)
+        self._stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0, "retries": 0, "hedges": 0, "hedge_wins": 0}
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def record_success(self, latency: Optional[float] = None) -> None:
+        with self._lock:
+            self._stats["calls"] += 1
+            self._failures = 0
+            self._probing = False
+            self.state = "closed"
+            if latency is not None:
+                self._latencies.append(latency)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["failures"] += 1
+            self._failures += 1
+            self._probing = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    self._stats["opened"] += 1
+                    print(f"--- Circuit breaker OPEN for {self.name} ({self._failures} failures) ---")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Ends a call that says nothing about the host's health (lets the next half-open probe through)."""
+        with self._lock:
+            self._probing = False
+
+    def count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs fn through the breaker: raises CircuitOpen while open; upstream failures (_is_upstream_failure) are counted."""
+        if not self.allow():
+            raise CircuitOpen(f"{self.name} is unavailable (circuit open), try again shortly")
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if _is_upstream_failure(e):
+                self.record_failure()
+            else:
+                self.release()
+            raise
+        self.record_success(time.monotonic() - started)
+        return result
+
+    def stats(self) -> dict:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                **self._stats,
+                "p50_ms": round(p50 * 1000) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="upstream-hedge")
+
+
+def breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def guarded(name: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Calls fn(*args, **kwargs) through the named breaker (for non-HTTP clients like Gemini)."""
+    check_deadline(f"calling {name}")
+    return breaker(name).call(fn, *args, **kwargs)
+
+
+def _deadline_timeout(timeout):
+    """Per-attempt timeout, shortened to the current request's time left."""
+    left = time_left()
+    if left is None:
+        return timeout
+    if isinstance(timeout, tuple):
+        return tuple(min(t, left) for t in timeout)
+    return min(timeout, left)
+
+
+def gemini_request_options() -> dict:
+    """request_options for genai.GenerativeModel.generate_content, which has no timeout by default."""
+    return {"timeout": _deadline_timeout(GEMINI_TIMEOUT)}
+
+
+def _close_response(future) -> None:
+    """Done-callback for a losing hedge: releases its pooled connection."""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _attempt(host_breaker: CircuitBreaker, url: str, kwargs: dict) -> requests.Response:
+    started = time.monotonic()
+    try:
+        response = requests.get(url, **kwargs)
+    except requests.RequestException:
+        host_breaker.record_failure()
+        raise
+    if response.status_code in _RETRYABLE_STATUS:
+        host_breaker.record_failure()
+    else:
+        host_breaker.record_success(time.monotonic() - started)
+    return response
+
+
+def _hedged_attempt(
+    host_breaker: CircuitBreaker, url: str, kwargs: dict, before_attempt: Optional[Callable[[], dict]] = None
+) -> requests.Response:
+    """Sends a duplicate request if the first is slower than the host's p95; the first response wins."""
+    p95 = host_breaker.percentile(0.95)
+    if p95 is None:
+        return _attempt(host_breaker, url, kwargs)
+
+    first = _hedge_executor.submit(_attempt, host_breaker, url, kwargs)
+    done, _ = wait([first], timeout=max(p95, HEDGE_MIN_DELAY))
+    if done:
+        return first.result()
+
+    hedge_kwargs = kwargs
+    if before_attempt is not None:
+        try:
+            hedge_kwargs = {**kwargs, **before_attempt()}
+        except Exception:
+            return first.result() # No capacity for a duplicate (e.g. rate limited): wait for the first
+    host_breaker.count("hedges")
+    second = _hedge_executor.submit(_attempt, host_breaker, url, hedge_kwargs)
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                response = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if future is second:
+                host_breaker.count("hedge_wins")
+            for loser in pending:
+                if not loser.cancel():
+                    loser.add_done_callback(_close_response)
+            return response
+    raise error
+
+
+def resilient_get(
+    url: str, retries: Optional[int] = None, hedge: Optional[bool] = None,
+    before_attempt: Optional[Callable[[], dict]] = None, **kwargs
+) -> requests.Response:
+    """
+    requests.get with a per-host circuit breaker, timeouts, retries with jittered
+    exponential backoff, and optional hedging. Returns the last response (the
+    caller still checks its status); raises CircuitOpen or the last network error.
+    'before_attempt' runs before every request sent, retries and hedges included,
+    and returns kwargs overrides (e.g. a rate-limit token and its API key); what
+    it raises propagates.
+    """
+    host = urlparse(url).netloc.lower()
+    host_breaker = breaker(host)
+    retries = UPSTREAM_RETRIES if retries is None else retries
+    hedge = (host in UPSTREAM_HEDGE_HOSTS) if hedge is None else hedge
+    kwargs.setdefault("timeout", (UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_TIMEOUT))
+
+    for attempt in range(retries + 1):
+        check_deadline(f"calling {host}")
+        if not host_breaker.allow():
+            raise CircuitOpen(f"{host} is unavailable (circuit open), try again shortly")
+        attempt_kwargs = {**kwargs, "timeout": _deadline_timeout(kwargs["timeout"])}
+        if before_attempt is not None:
+            attempt_kwargs.update(before_attempt())
+        try:
+            if hedge:
+                response = _hedged_attempt(host_breaker, url, attempt_kwargs, before_attempt)
+            else:
+                response = _attempt(host_breaker, url, attempt_kwargs)
+            if response.status_code not in _RETRYABLE_STATUS or attempt == retries:
+                return response
+            response.close()
+        except requests.RequestException:
+            if attempt == retries:
+                raise
+        host_breaker.count("retries")
+        # Full jitter: spreads retries from many clients over the backoff window
+        time.sleep(cap_wait(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))))
+
+
+def resilience_stats() -> dict:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: b.stats() for name, b in breakers.items()}
@@ -34,12 +34,16 @@ class IngredientListPayload(BaseModel):
 class VideoListPayload(BaseModel):
     items: List[VideoItem]
 
+class TimerPayload(BaseModel):
+    seconds: int = Field(description="Timer duration in seconds")
+    label: Optional[str] = Field(None, description="What the timer is for (e.g. 'pasta')")
+
 # --- The Master Response ---
 
 class AgentResponse(BaseModel):
     chat_bubble: str = Field(description="The friendly text response to the user. Use emojis where appropriate!")
     
-    ui_type: Literal["recipe_list", "ingredient_list", "video_list", "none"] = Field(
+    ui_type: Literal["recipe_list", "ingredient_list", "video_list", "timer", "none"] = Field(
         "none", 
         description="The type of UI widget to display below the text."
     )
@@ -48,3 +52,4 @@ class AgentResponse(BaseModel):
     recipe_data: Optional[RecipeListPayload] = None
     ingredient_data: Optional[IngredientListPayload] = None
     video_data: Optional[VideoListPayload] = None
+    timer_data: Optional[TimerPayload] = None
@@ -1,9 +1,12 @@
+import uuid
 from pydantic import BaseModel
 from typing import List, Optional
 
 class IngredientSearchRequest(BaseModel):
     ingredients: List[str]
     number: int = 10
+    user_id: Optional[uuid.UUID] = None # Also match this user's saved recipes (with include_local)
+    include_local: bool = False # Also return saved/extracted recipes; open those by recipe_ref, not id
 
 class RecipeSummary(BaseModel):
     id: int
@@ -12,3 +15,6 @@ class RecipeSummary(BaseModel):
     usedIngredientCount: int
     missedIngredientCount: int
     likes: int
+    source: str = "spoonacular" # spoonacular | saved | extracted
+    recipe_ref: Optional[str] = None # For saved/extracted recipes (use with /chat)
+    source_url: Optional[str] = None
@@ -0,0 +1,154 @@
+from typing import Iterable, Optional, Tuple
+
+from ingredients import canonical_ingredient
+from quantities import convert, format_quantity, parse_quantity, stored_amount
+from tools import cached_ingredient_image_url
+
+# --- Shopping List Diff ---
+# "What do I still need to buy?" computed locally: recipe ingredients and pantry
+# items are matched by canonical name, amounts compared in base units (g/ml/count,
+# converting mass <-> volume by density where known). No model call, no API call.
+
+# Ignore rounding leftovers ("0.0001 cups short")
+_TOLERANCE = 0.01
+
+
+def _field(ingredient, name: str):
+    if isinstance(ingredient, dict):
+        return ingredient.get(name)
+    return getattr(ingredient, name, None)
+
+
+def _parsed(ingredient) -> Optional[Tuple[float, str]]:
+    """Structured amount stored at ingest, or parsed now for older payloads."""
+    return stored_amount(_field(ingredient, "amount_value"), _field(ingredient, "amount_unit"), _field(ingredient, "amount"))
+
+
+def _add(total: Optional[Tuple[float, str]], amount: Tuple[float, str], name: str):
+    """Sums two base-unit amounts. Returns None if they can't be combined."""
+    if total is None:
+        return amount
+    value = convert(amount[0], amount[1], total[1], name)
+    if value is None:
+        return None
+    return total[0] + value, total[1]
+
+
+def _display(value: float, base_unit: str, display_unit: Optional[str], name: str) -> str:
+    if display_unit and display_unit != base_unit:
+        converted = convert(value, base_unit, display_unit, name)
+        if converted is not None:
+            return format_quantity(converted, display_unit)
+    return format_quantity(value, base_unit)
+
+
+def build_shopping_list(recipes: Iterable[Tuple[str, list]], pantry_rows: Iterable) -> dict:
+    """
+    recipes: (title, ingredients) pairs; ingredients are dicts or Ingredient models.
+    pantry_rows: objects with name, amount, amount_value, amount_unit.
+    Needs are summed across recipes (batch mode for meal planning).
+    """
+    # 1. Pantry totals per canonical ingredient
+    pantry = {}
+    for row in pantry_rows:
+        key = canonical_ingredient(row.name)
+        if not key:
+            continue
+        parsed = stored_amount(row.amount_value, row.amount_unit, row.amount)
+        entry = pantry.setdefault(key, {"total": None, "known": True})
+        if parsed is None:
+            entry["known"] = False
+        elif entry["known"]:
+            entry["total"] = _add(entry["total"], parsed, key)
+            entry["known"] = entry["total"] is not None
+
+    # 2. Needs per canonical ingredient, across all recipes
+    needs = {}
+    for title, ingredients in recipes:
+        for ing in ingredients:
+            name = _field(ing, "name") or ""
+            key = canonical_ingredient(name)
+            if not key:
+                continue
+            need = needs.setdefault(key, {
+                "name": name, "total": None, "display_unit": None,
+                "image_url": _field(ing, "imageUrl"), "recipes": [], "unmerged": [],
+            })
+            if title not in need["recipes"]:
+                need["recipes"].append(title)
+            parsed = _parsed(ing)
+            quantity = parse_quantity(_field(ing, "amount"))
+            if parsed is None:
+                if quantity is not None and quantity.measure:
+                    # "1 head", "2 cans": measured, but not in units we can add up
+                    reason = f"measured by the {quantity.measure}, which can't be compared with other amounts"
+                    need["unmerged"].append((_field(ing, "amount").strip(), title, reason))
+                continue
+            display_unit = quantity.unit if quantity else None
+            if need["display_unit"] is None:
+                need["display_unit"] = display_unit
+            combined = _add(need["total"], parsed, key)
+            if combined is None:
+                # e.g. "2 cups" on top of "300 g" without a known density: listed on its own
+                need["unmerged"].append((
+                    _display(parsed[0], parsed[1], display_unit, key), title,
+                    "can't be added to the other amounts of this ingredient"
+                ))
+            else:
+                need["total"] = combined
+
+    # 3. Diff
+    missing, covered, uncertain = [], [], []
+    for key, need in needs.items():
+        item = {
+            "name": need["name"],
+            "key": key,
+            "recipes": need["recipes"],
+            "image_url": cached_ingredient_image_url(key) or need["image_url"],
+        }
+        for needed, title, reason in need["unmerged"]:
+            uncertain.append({**item, "recipes": [title], "needed": needed, "reason": reason})
+        total = need["total"]
+        if total is None and need["unmerged"]:
+            continue # Every amount is listed under uncertain
+        if total is not None:
+            item["needed"] = _display(total[0], total[1], need["display_unit"], key)
+
+        have = pantry.get(key)
+        if have is None:
+            if total is not None:
+                item.update(shortfall=item["needed"], shortfall_value=round(total[0], 2), unit=total[1])
+            missing.append(item)
+            continue
+
+        # In the pantry but unmeasured on either side ("salt to taste", "some flour")
+        if total is None:
+            covered.append(item)
+            continue
+        if not have["known"] or have["total"] is None:
+            uncertain.append(item)
+            continue
+
+        have_value = convert(have["total"][0], have["total"][1], total[1], key)
+        if have_value is None:
+            uncertain.append(item)
+            continue
+        item["have"] = _display(have_value, total[1], need["display_unit"], key)
+
+        short = total[0] - have_value
+        if short <= _TOLERANCE * total[0]:
+            covered.append(item)
+        else:
+            item.update(
+                shortfall=_display(short, total[1], need["display_unit"], key),
+                shortfall_value=round(short, 2),
+                unit=total[1]
+            )
+            missing.append(item)
+
+    return {
+        "missing": missing,
+        "covered": covered,
+        # In the pantry but the amounts can't be compared, or amounts that can't be summed
+        "uncertain": uncertain,
+    }
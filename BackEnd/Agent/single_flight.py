@@ -0,0 +1,124 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+from deadline import DeadlineExceeded, time_left
+from rate_limit import Priority, current_priority
+
+# --- Single-Flight ---
+# Identical upstream calls that overlap in time (a trending video extracted by
+# many users at once, the same recipe opened on many phones) share one in-flight
+# computation: the first caller runs it, the others wait for its result or its
+# exception. Nothing is kept once the call returns; caching stays with the callers.
+# Shared results are the same object for every caller, so treat them as read-only.
+# A follower doesn't take an outcome it could do better than on its own: a failure
+# of a lower-priority leader (e.g. a prefetch that wasn't allowed to wait for a
+# rate-limit token), or an outcome cut short by the leader's deadline (a timeout,
+# or a result the caller's 'shareable' check calls partial) when the follower has
+# more time left than the leader's whole budget. It retries once instead; followers
+# retrying together elect a new leader among themselves. Followers wait no longer
+# than their own deadline (deadline.py).
+
+# Never part of a request's identity
+SECRET_PARAMS = ("apiKey", "api_key", "key")
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "priority", "partial", "budget")
+
+    def __init__(self, priority: Priority, budget: Optional[float]):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.priority = priority
+        self.partial = False
+        self.budget = budget # Leader's seconds to its deadline at the start, None if unbounded
+
+    def _can_do_better(self, time_left_now: Optional[float]) -> bool:
+        """A re-run only gets further than the leader with more time than the leader had."""
+        if self.budget is None:
+            return False
+        return time_left_now is None or time_left_now > self.budget
+
+    def shareable_with(self, priority: Priority, time_left_now: Optional[float]) -> bool:
+        if self.partial or isinstance(self.error, TimeoutError):
+            return not self._can_do_better(time_left_now)
+        if self.error is not None:
+            return self.priority <= priority
+        return True
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "shared": 0, "retried": 0}
+
+    def do(
+        self, key: Hashable, fn: Callable[..., Any], *args,
+        shareable: Optional[Callable[[Any], bool]] = None, **kwargs
+    ) -> Any:
+        """
+        Runs fn(*args, **kwargs), or waits for the identical call already running under 'key'.
+        'shareable(result)' returns False for results followers shouldn't take (partial ones).
+        """
+        return self._do(key, fn, args, kwargs, shareable, retry=True)
+
+    def _do(self, key, fn, args, kwargs, shareable, retry: bool) -> Any:
+        priority = current_priority()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call(priority, time_left())
+                self._stats["calls"] += 1
+            else:
+                self._stats["shared"] += 1
+
+        if not leader:
+            wait = time_left()
+            if not call.done.wait(None if wait is None else max(wait, 0.0)):
+                raise DeadlineExceeded(f"Request deadline exceeded waiting for {self.name}")
+            if retry and not call.shareable_with(priority, time_left()):
+                with self._lock:
+                    self._stats["retried"] += 1
+                return self._do(key, fn, args, kwargs, shareable, retry=False)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            call.partial = shareable is not None and not shareable(call.result)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls)}
+
+
+_groups: Dict[str, SingleFlight] = {}
+
+
+def single_flight(name: str) -> SingleFlight:
+    """Returns the named group, creating it on first use."""
+    group = _groups.get(name)
+    if group is None:
+        group = _groups.setdefault(name, SingleFlight(name))
+    return group
+
+
+def params_key(params: dict, exclude: Iterable[str] = SECRET_PARAMS) -> tuple:
+    """Order-independent identity of a query-parameter dict, without credentials."""
+    return tuple(sorted((k, str(v)) for k, v in params.items() if k not in exclude))
+
+
+def single_flight_stats() -> dict:
+    return {name: group.stats() for name, group in _groups.items()}
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Modules live flat in BackEnd/Agent and read their settings at import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+os.environ.setdefault("WARMUP_ENABLED", "false")
@@ -0,0 +1,71 @@
+import logging
+
+import pytest
+from google.generativeai.types import content_types
+
+import context_cache
+from chef_agent import tools as chef_tools
+from context_cache import _clean_schema, _function_declaration, get_chef_context, set_context_provider
+
+
+class LocalCacheProvider:
+    """Stand-in for Gemini cached content: validates the request the way the SDK does, then stores it."""
+
+    def __init__(self, fail_with=None):
+        self.created = {}
+        self.fail_with = fail_with
+
+    def create(self, display_name, system_instruction, tools, ttl_seconds):
+        if self.fail_with:
+            raise self.fail_with
+        # Same conversion CachedContent.create runs before calling the API
+        content_types._make_tools([{"function_declarations": [_function_declaration(t) for t in tools]}])
+        name = f"cachedContents/{display_name}"
+        self.created[name] = (system_instruction, ttl_seconds)
+        return name
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    context_cache._contexts.clear()
+    yield
+    set_context_provider(None)
+    context_cache._contexts.clear()
+
+
+def test_optional_arguments_become_nullable():
+    schema = {"type": "object", "properties": {"q": {"anyOf": [{"type": "string"}, {"type": "null"}], "default": None}}}
+    assert _clean_schema(schema) == {"type": "object", "properties": {"q": {"type": "string", "nullable": True}}}
+
+
+def test_union_arguments_are_rejected():
+    with pytest.raises(ValueError):
+        _clean_schema({"anyOf": [{"type": "string"}, {"type": "integer"}]})
+
+
+def test_every_chef_tool_converts_to_a_gemini_schema():
+    content_types._make_tools([{"function_declarations": [_function_declaration(t) for t in chef_tools]}])
+
+
+def test_provider_cache_is_created_once_per_recipe():
+    provider = LocalCacheProvider()
+    set_context_provider(provider)
+
+    first = get_chef_context("You are a chef.", None, chef_tools)
+    second = get_chef_context("You are a chef.", None, chef_tools)
+
+    assert first.cached_content is not None
+    assert first.cached_content in provider.created
+    assert second is first
+    assert len(provider.created) == 1
+
+
+def test_provider_failure_keeps_local_prefix_and_warns(caplog):
+    set_context_provider(LocalCacheProvider(fail_with=RuntimeError("below minimum size")))
+
+    with caplog.at_level(logging.WARNING, logger="context_cache"):
+        context = get_chef_context("You are a chef.", None, chef_tools)
+
+    assert context.cached_content is None
+    assert "You are a chef." in context.system_message.content
+    assert "below minimum size" in caplog.text
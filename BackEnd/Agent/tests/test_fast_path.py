@@ -0,0 +1,33 @@
+import pytest
+
+from fast_path import try_fast_path
+
+
+@pytest.mark.parametrize("message, bubble", [
+    ("how many grams is 2 cups of flour", "⚖️ 2 cups of flour is about 241 g."),
+    ("convert 1 cup of granulated sugar to grams", "⚖️ 1 cup of granulated sugar is about 201 g."),
+    ("how many ml is 2 cups", "⚖️ 2 cups is 473 ml."),
+])
+def test_conversions_are_answered_locally(message, bubble):
+    assert try_fast_path(message).chat_bubble == bubble
+
+
+@pytest.mark.parametrize("message", [
+    "how many grams is 1 cup of sugar snap peas",
+    "how many grams is 1 cup of rice vinegar",
+    "how many grams is 2 tbsp of peanut butter",
+])
+def test_conversions_without_a_known_density_go_to_the_model(message):
+    assert try_fast_path(message) is None
+
+
+@pytest.mark.parametrize("message, seconds, label, bubble", [
+    ("set a 10 minute timer for the pasta", 600, "pasta", "⏱️ Timer set for 10 minutes for the pasta."),
+    ("set a timer for 3 minutes for my eggs", 180, "eggs", "⏱️ Timer set for 3 minutes for the eggs."),
+    ("remind me in 5 minutes to flip the steak", 300, "steak", "⏱️ Timer set for 5 minutes for the steak."),
+    ("remind me in 2 minutes to stir", 120, None, "⏱️ Timer set for 2 minutes."),
+    ("timer 1 hour and 30 minutes", 5400, None, "⏱️ Timer set for 1 hour and 30 minutes."),
+])
+def test_timers(message, seconds, label, bubble):
+    response = try_fast_path(message)
+    assert (response.timer_data.seconds, response.timer_data.label, response.chat_bubble) == (seconds, label, bubble)
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+from sqlmodel import SQLModel, create_engine, text
+
+import migrations
+import models  # noqa: F401 (registers the tables)
+from migrations import MIGRATIONS, explain_hot_queries, run_migrations
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh SQLite database with the app's tables, used by the migration runner."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    monkeypatch.setattr(migrations, "engine", engine)
+    return engine
+
+
+def test_applies_every_migration_once(db):
+    assert run_migrations() == [m["version"] for m in MIGRATIONS]
+    assert run_migrations() == []
+    with db.connect() as connection:
+        versions = [row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))]
+    assert sorted(versions) == [m["version"] for m in MIGRATIONS]
+
+
+def test_concurrent_runs_apply_each_migration_once(db, monkeypatch):
+    # A slow data migration keeps the race window open while the others boot
+    slow = {"version": "9998", "description": "slow backfill", "sqlite": [lambda connection: time.sleep(0.3)]}
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS + [slow])
+    results, errors = [], []
+    start = threading.Barrier(4)
+
+    def boot():
+        start.wait()
+        try:
+            results.append(run_migrations())
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=boot) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert errors == []
+    applied = [version for result in results for version in result]
+    assert sorted(applied) == [m["version"] for m in MIGRATIONS + [slow]]
+
+
+def test_failed_migration_is_rolled_back(db, monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS + [
+        {"version": "9999", "description": "broken", "sqlite": ["CREATE INDEX ix_broken ON no_such_table (id)"]},
+    ])
+    with pytest.raises(Exception):
+        run_migrations()
+    assert migrations.applied_versions() == set()
+
+
+@pytest.mark.parametrize("query, index", [
+    ("pantry list", "ix_pantry_items_v2_user_created"),
+    ("recipe list", "ix_recipe_user_created"),
+    ("saved recipe by source", "ux_recipe_user_source"),
+])
+def test_hot_queries_use_their_index(db, query, index):
+    run_migrations()
+    plan = explain_hot_queries()[query]
+    assert index in plan
+    assert "TEMP B-TREE" not in plan # No sort step: the index already gives the order
+
+
+def test_concurrent_statements_run_outside_the_transaction(db):
+    # The Postgres path, on SQLite: Concurrent statements split the migration's transaction
+    migrations.applied_versions()
+    migration = {"version": "9997", "description": "mixed"}
+    migrations._apply(migration, [
+        "CREATE TABLE mixed (x INTEGER)",
+        migrations.Concurrent("CREATE INDEX ix_mixed ON mixed (x)"),
+        "INSERT INTO mixed VALUES (1)",
+    ])
+    assert "9997" in migrations.applied_versions()
+    with db.connect() as connection:
+        assert connection.execute(text("SELECT name FROM sqlite_master WHERE name = 'ix_mixed'")).first()
+        assert connection.execute(text("SELECT x FROM mixed")).scalar() == 1
+
+
+def test_duplicate_saved_recipes_are_kept(db):
+    user_id = "11111111111111111111111111111111"
+    with db.begin() as connection:
+        for title in ("first", "second", "third"):
+            connection.execute(text(
+                "INSERT INTO recipe (user_id, title, content_json, source_url, created_at) "
+                "VALUES (:user_id, :title, '{}', 'https://youtu.be/x', CURRENT_TIMESTAMP)"
+            ), {"user_id": user_id, "title": title})
+
+    run_migrations()
+
+    with db.connect() as connection:
+        rows = connection.execute(text("SELECT id, title, source_url FROM recipe ORDER BY id")).fetchall()
+    assert [row.title for row in rows] == ["first", "second", "third"]
+    assert rows[0].source_url == "https://youtu.be/x"
+    assert [row.source_url for row in rows[1:]] == [f"https://youtu.be/x#saved-{row.id}" for row in rows[1:]]
+
+
+def test_measure_word_counts_are_cleared(db):
+    user_id = "11111111111111111111111111111111"
+    with db.begin() as connection:
+        for name, amount, value, unit in (
+            ("lettuce", "1 head", 1.0, "count"), # Stored as a plain count before 0009
+            ("eggs", "12 count", 12.0, "count"),
+            ("tomatoes", "2 cans", None, None),
+        ):
+            connection.execute(text(
+                "INSERT INTO pantry_items_v2 (user_id, name, amount, amount_value, amount_unit, created_at, updated_at) "
+                "VALUES (:user_id, :name, :amount, :value, :unit, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+            ), {"user_id": user_id, "name": name, "amount": amount, "value": value, "unit": unit})
+
+    run_migrations()
+
+    with db.connect() as connection:
+        rows = connection.execute(text("SELECT name, amount_value, amount_unit FROM pantry_items_v2")).fetchall()
+    assert {row.name: (row.amount_value, row.amount_unit) for row in rows} == {
+        "lettuce": (None, None),
+        "eggs": (12.0, "count"),
+        "tomatoes": (None, None),
+    }
@@ -0,0 +1,30 @@
+from better_agent import Ingredient
+from nutrition import compute_nutrition
+
+
+def test_modifiers_match_the_base_food():
+    result = compute_nutrition([Ingredient(name=name, amount="100 g") for name in ("cherry tomatoes", "cheddar cheese")])
+    assert [item["key"] for item in result["counted"]] == ["cherry tomato", "cheddar cheese"]
+    assert result["coverage"] == 1.0
+
+
+def test_compound_names_are_not_counted_as_another_food():
+    names = ("almond milk", "coconut water", "rice vinegar")
+    result = compute_nutrition([Ingredient(name=name, amount="1 cup") for name in names])
+    assert result["counted"] == []
+    assert [item["reason"] for item in result["skipped"]] == [
+        "approximate match (milk)", "approximate match (water)", "approximate match (vinegar)"
+    ]
+    assert result["coverage"] == 0.0
+    assert result["total"]["calories"] == 0.0
+
+
+def test_measure_words_are_skipped_with_a_reason():
+    result = compute_nutrition([Ingredient(name="garlic", amount="1 head")])
+    assert result["skipped"] == [{"name": "garlic", "reason": "can't convert head to grams"}]
+
+
+def test_per_serving_totals():
+    result = compute_nutrition([Ingredient(name="egg", amount="2")], servings=2)
+    assert result["total"]["calories"] == 143.0
+    assert result["per_serving"]["calories"] == 71.5
@@ -0,0 +1,101 @@
+import pytest
+
+from quantities import (
+    density_for, merge_amounts, normalize_amount, parse_quantity, scale_amount, stored_amount
+)
+
+
+@pytest.mark.parametrize("text, value, unit", [
+    ("1 1/2 cups flour", 1.5, "cup"),
+    ("½ tsp salt", 0.5, "tsp"),
+    ("1½ tbsp", 1.5, "tbsp"),
+    ("2-3 tbsp", 2.5, "tbsp"),
+    ("1 to 2 lbs", 1.5, "lb"),
+    ("2 fl oz", 2.0, "fl oz"),
+    ("3 eggs", 3.0, "count"),
+])
+def test_parse_quantity(text, value, unit):
+    quantity = parse_quantity(text)
+    assert (quantity.value, quantity.unit) == (value, unit)
+
+
+def test_parse_quantity_without_a_number():
+    assert parse_quantity("to taste") is None
+
+
+@pytest.mark.parametrize("text, measure, item", [
+    ("2 cloves garlic", "clove", "garlic"),
+    ("1 head garlic", "head", "garlic"),
+    ("1 (14 oz) can tomatoes", "can", "tomatoes"),
+    ("2 jars", "jar", ""),
+    ("3 eggs", "", "eggs"),
+    ("12 count", "", ""),
+])
+def test_measure_words_are_kept_apart_from_counts(text, measure, item):
+    quantity = parse_quantity(text)
+    assert quantity.unit == "count"
+    assert (quantity.measure, quantity.item) == (measure, item)
+
+
+@pytest.mark.parametrize("current, added, expected", [
+    ("1 kg", "500 g", "1.5 kg"),
+    ("1 cup", "250 ml", "2 cups"),
+    ("2 cans", "1 can", "3 cans"),
+    ("12 count", "2", "14"),
+    ("2 cloves garlic", "1 head garlic", "2 cloves garlic + 1 head garlic"),
+    ("1 can", "2 jars", "1 can + 2 jars"),
+    ("2 large eggs", "3 eggs", "2 large eggs + 3 eggs"),
+    ("1 kg", "2 cups", "1 kg + 2 cups"),
+    (None, "2 cups", "2 cups"),
+])
+def test_merge_amounts(current, added, expected):
+    assert merge_amounts(current, added, "gravel") == expected
+
+
+def test_merge_amounts_converts_by_density():
+    assert merge_amounts("100 g", "1 cup", "sugar") == "301 g"
+
+
+def test_merged_text_is_not_summed_again():
+    assert merge_amounts("1 kg + 2 cups", "500 g", "gravel") == "1 kg + 2 cups + 500 g"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1 Gallon", (3785.41, "ml")),
+    ("12 count", (12.0, "count")),
+    ("1 kg + 500 g", (1500.0, "g")),
+    ("1 kg + 2 cups", None),
+    ("1 head", None),
+    ("2 cans", None),
+    ("2 cloves garlic + 1 head garlic", None),
+    ("to taste", None),
+])
+def test_normalize_amount(text, expected):
+    assert normalize_amount(text) == expected
+
+
+def test_stored_counts_for_measure_words_are_parsed_again():
+    assert stored_amount(1.0, "count", "1 head") is None
+    assert stored_amount(12.0, "count", "12 count") == (12.0, "count")
+    assert stored_amount(500.0, "g", "1 lb") == (500.0, "g")
+    assert stored_amount(None, None, "2 cups") == (473.176, "ml")
+
+
+@pytest.mark.parametrize("ingredient, density", [
+    ("sugar", 0.85),
+    ("granulated sugar", 0.85),
+    ("unsalted butter", 0.96),
+    ("All-Purpose Flour", 0.51),
+    ("sugar snap peas", None),
+    ("rice vinegar", None),
+    ("peanut butter", None),
+    ("coconut milk", None),
+    ("", None),
+])
+def test_density_for_matches_whole_ingredients_only(ingredient, density):
+    assert density_for(ingredient) == density
+
+
+def test_scale_amount_keeps_the_measure_word():
+    assert scale_amount("2 cloves garlic", 2) == "4 cloves garlic"
+    assert scale_amount("a pinch of salt", 2) is None
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+from pydantic import BaseModel, ValidationError
+
+from resilience import CircuitBreaker
+
+
+class Answer(BaseModel):
+    value: int
+
+
+def validation_error():
+    try:
+        Answer(value="not a number")
+    except ValidationError as e:
+        return e
+
+
+def wrapped_unavailable():
+    try:
+        try:
+            raise api_exceptions.ServiceUnavailable("overloaded")
+        except Exception as e:
+            raise RuntimeError("model call failed") from e
+    except RuntimeError as e:
+        return e
+
+
+def call_failing(breaker, error, times):
+    def fail():
+        raise error
+    for _ in range(times):
+        with pytest.raises(type(error)):
+            breaker.call(fail)
+
+
+@pytest.mark.parametrize("error", [
+    validation_error(),
+    json.JSONDecodeError("Expecting value", "", 0),
+    api_exceptions.InvalidArgument("bad request"),
+])
+def test_unusable_answers_do_not_open_the_breaker(error):
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    call_failing(breaker, error, 5)
+    assert breaker.state == "closed"
+    assert breaker.stats()["failures"] == 0
+
+
+@pytest.mark.parametrize("error", [
+    api_exceptions.ServiceUnavailable("overloaded"),
+    api_exceptions.ResourceExhausted("quota"),
+    TimeoutError("read timed out"),
+    wrapped_unavailable(),
+])
+def test_upstream_failures_open_the_breaker(error):
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    call_failing(breaker, error, 2)
+    assert breaker.state == "open"
+
+
+def test_unusable_answer_releases_a_half_open_probe():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    call_failing(breaker, TimeoutError(), 1)
+    call_failing(breaker, validation_error(), 1)
+    assert breaker.allow()
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+from shopping_list import build_shopping_list
+
+
+def pantry_row(name, amount, amount_value=None, amount_unit=None):
+    return SimpleNamespace(name=name, amount=amount, amount_value=amount_value, amount_unit=amount_unit)
+
+
+def by_name(items):
+    return {(item["name"], tuple(item["recipes"])): item for item in items}
+
+
+def test_shortfall_is_computed_in_base_units():
+    result = build_shopping_list(
+        [("Cake", [{"name": "flour", "amount": "2 cups"}]), ("Bread", [{"name": "flour", "amount": "500 g"}])],
+        [pantry_row("flour", "300 g", 300.0, "g")],
+    )
+    [flour] = result["missing"]
+    assert flour["recipes"] == ["Cake", "Bread"]
+    # 2 cups + 500 g (at 0.51 g/ml) - 300 g, in the first amount's base unit
+    assert (flour["shortfall_value"], flour["unit"]) == (865.33, "ml")
+    assert result["uncertain"] == []
+
+
+def test_amounts_that_cannot_be_added_are_listed_as_uncertain():
+    result = build_shopping_list(
+        [("A", [{"name": "gravel", "amount": "300 g"}]), ("B", [{"name": "gravel", "amount": "2 cups"}])], []
+    )
+    assert result["missing"][0]["needed"] == "300 g"
+    [extra] = result["uncertain"]
+    assert (extra["recipes"], extra["needed"]) == (["B"], "2 cups")
+
+
+def test_measure_words_are_not_added_up_as_pieces():
+    result = build_shopping_list(
+        [
+            ("A", [{"name": "garlic", "amount": "2 cloves"}]),
+            # Stored as a plain count by an older ingest
+            ("B", [{"name": "garlic", "amount": "1 head", "amount_value": 1.0, "amount_unit": "count"}]),
+        ],
+        [pantry_row("garlic", "3 cloves")],
+    )
+    uncertain = by_name(result["uncertain"])
+    assert uncertain[("garlic", ("A",))]["needed"] == "2 cloves"
+    assert uncertain[("garlic", ("B",))]["needed"] == "1 head"
+    assert result["missing"] == [] and result["covered"] == []
+
+
+def test_pantry_counts_cover_needs():
+    result = build_shopping_list(
+        [("Omelette", [{"name": "Large Eggs", "amount": "3"}])], [pantry_row("eggs", "12 count", 12.0, "count")]
+    )
+    [eggs] = result["covered"]
+    assert eggs["key"] == "egg"
@@ -0,0 +1,156 @@
+import threading
+import time
+
+import pytest
+
+import tools
+from deadline import DeadlineExceeded, deadline_scope
+from rate_limit import Priority, RateLimited, request_priority
+from single_flight import SingleFlight
+
+
+class Leader:
+    """fn for the first caller: blocks until released, so followers can join while it runs."""
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.release = threading.Event()
+        self.runs = []
+
+    def __call__(self, tag):
+        self.runs.append(tag)
+        if len(self.runs) == 1:
+            self.release.wait(5)
+            if isinstance(self.outcome, BaseException):
+                raise self.outcome
+            return self.outcome
+        return {"tag": tag, "partial": False}
+
+
+def run_in_thread(fn, *args, priority=Priority.INTERACTIVE, budget=None):
+    """Runs fn in a thread at 'priority' with a 'budget' deadline; returns (thread, outcome dict)."""
+    outcome = {}
+
+    def target():
+        with request_priority(priority), deadline_scope(time.time() + budget if budget else None):
+            try:
+                outcome["result"] = fn(*args)
+            except Exception as e:
+                outcome["error"] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread, outcome
+
+
+def wait_until_running(leader):
+    for _ in range(500):
+        if leader.runs:
+            return
+        time.sleep(0.01)
+    raise AssertionError("leader never started")
+
+
+def wait_for_followers(group, count):
+    for _ in range(500):
+        if group.stats()["shared"] >= count:
+            return
+        time.sleep(0.01)
+    raise AssertionError("followers never joined")
+
+
+def test_concurrent_calls_share_one_run():
+    group = SingleFlight("test")
+    leader = Leader({"tag": "leader", "partial": False})
+    threads = [run_in_thread(group.do, "k", leader, f"caller-{i}") for i in range(3)]
+    wait_for_followers(group, 2)
+    leader.release.set()
+    for thread, _ in threads:
+        thread.join()
+
+    assert len(leader.runs) == 1
+    assert {outcome["result"]["tag"] for _, outcome in threads} == {"leader"}
+
+
+def test_lower_priority_failure_is_not_shared():
+    group = SingleFlight("test")
+    leader = Leader(RateLimited("no tokens", "spoonacular", 5))
+    first = run_in_thread(group.do, "k", leader, "prefetch", priority=Priority.PREFETCH)
+    wait_until_running(leader)
+    second = run_in_thread(group.do, "k", leader, "interactive")
+    wait_for_followers(group, 1)
+    leader.release.set()
+    for thread, _ in (first, second):
+        thread.join()
+
+    assert isinstance(first[1]["error"], RateLimited)
+    assert second[1]["result"]["tag"] == "interactive"
+    assert group.stats()["retried"] == 1
+
+
+def test_same_priority_failure_is_shared():
+    group = SingleFlight("test")
+    leader = Leader(RuntimeError("upstream down"))
+    first = run_in_thread(group.do, "k", leader, "a")
+    wait_until_running(leader)
+    second = run_in_thread(group.do, "k", leader, "b")
+    wait_for_followers(group, 1)
+    leader.release.set()
+    for thread, _ in (first, second):
+        thread.join()
+
+    assert isinstance(second[1]["error"], RuntimeError)
+    assert leader.runs == ["a"]
+
+
+@pytest.mark.parametrize("follower_budget, rerun", [(1.0, False), (30.0, True)])
+def test_partial_result_goes_to_followers_without_more_budget(follower_budget, rerun):
+    group = SingleFlight("test")
+    leader = Leader({"tag": "leader", "partial": True})
+
+    def call(tag):
+        return group.do("k", leader, tag, shareable=lambda r: not r["partial"])
+
+    first = run_in_thread(call, "leader", budget=2.0)
+    wait_until_running(leader)
+    second = run_in_thread(call, "follower", budget=follower_budget)
+    wait_for_followers(group, 1)
+    leader.release.set()
+    for thread, _ in (first, second):
+        thread.join()
+
+    assert second[1]["result"]["tag"] == ("follower" if rerun else "leader")
+
+
+def test_follower_waits_no_longer_than_its_deadline():
+    group = SingleFlight("test")
+    leader = Leader({"tag": "leader", "partial": False})
+    first = run_in_thread(group.do, "k", leader, "leader")
+    wait_until_running(leader)
+    second = run_in_thread(group.do, "k", leader, "follower", budget=0.2)
+    second[0].join(2)
+    leader.release.set()
+    first[0].join()
+
+    assert isinstance(second[1]["error"], DeadlineExceeded)
+    assert first[1]["result"]["tag"] == "leader"
+
+
+def test_rate_limited_spoonacular_prefetch_is_not_shared(monkeypatch):
+    monkeypatch.setenv("SPOONACULAR_API_KEY", "test")
+    leader = Leader(RateLimited("no tokens", "spoonacular", 5))
+    monkeypatch.setattr(tools, "_spoonacular_request", lambda endpoint, params: leader(params["tag"]))
+
+    group = tools.single_flight("spoonacular")
+    joined = group.stats()["shared"]
+
+    first = run_in_thread(tools._spoonacular_get, "/recipes/1/information", {"tag": "prefetch"}, priority=Priority.PREFETCH)
+    wait_until_running(leader)
+    second = run_in_thread(tools._spoonacular_get, "/recipes/1/information", {"tag": "prefetch"})
+    wait_for_followers(group, joined + 1)
+    leader.release.set()
+    for thread, _ in (first, second):
+        thread.join()
+
+    assert first[1]["result"]["status"] == "busy"
+    assert second[1]["result"] == {"tag": "prefetch", "partial": False}
@@ -0,0 +1,136 @@
+import hashlib
+import json
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import tool
+
+from cache import TTLCache
+
+# --- Tool Output Shaping ---
+# Tool results stay in the chat history for the rest of the thread, so they are
+# compacted before the chef sees them. Anything cut is kept here under a short
+# reference that the chef can expand with `expand_tool_output`.
+
+# Max characters per tool result (~4 chars per token)
+TOOL_OUTPUT_CAPS = {
+    "get_recipe_information": 1500,
+    "get_recipes_information_bulk": 4000,
+    "extract_recipe_from_url": 1500,
+    "google_search": 1000,
+    "search_recipes": 1200,
+    "search_youtube": 1200,
+}
+DEFAULT_OUTPUT_CAP = 1500
+EXPAND_CHUNK_SIZE = 2000
+
+# Results returned by google_search after compaction, and max snippet length
+GOOGLE_SEARCH_RESULTS = 3
+GOOGLE_SNIPPET_CHARS = 200
+
+_payload_cache = TTLCache(maxsize=256, ttl=3600)
+
+
+def _store_payload(content: str) -> str:
+    """Caches the full tool output and returns its reference."""
+    ref = hashlib.sha1(content.encode("utf-8")).hexdigest()[:10]
+    _payload_cache.set(ref, content)
+    return ref
+
+
+def _compact_extracted_recipe(content: str) -> str:
+    """Keeps only the fields the chef needs from a raw Spoonacular /recipes/extract dict."""
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return content
+    if not isinstance(data, dict):
+        return content
+
+    ingredients = [f"- {i.get('original') or i.get('name')}" for i in data.get("extendedIngredients", [])]
+    steps = []
+    if data.get("analyzedInstructions"):
+        for step in data["analyzedInstructions"][0].get("steps", []):
+            steps.append(f"{step.get('number')}. {step.get('step')}")
+
+    return f"""Title: {data.get('title')}
+Servings: {data.get('servings')} | Time: {data.get('readyInMinutes')}m
+Source: {data.get('sourceUrl')}
+Image: {data.get('image')}
+Ingredients:
+{chr(10).join(ingredients)}
+Instructions:
+{chr(10).join(steps) if steps else data.get('instructions')}"""
+
+
+def _compact_google_search(content: str) -> str:
+    """Keeps the top results with short snippets and no thumbnails."""
+    results = []
+    for block in content.split("\n\n")[:GOOGLE_SEARCH_RESULTS]:
+        lines = []
+        for line in block.splitlines():
+            if line.startswith("Image: "):
+                continue
+            if line.startswith("Snippet: ") and len(line) > GOOGLE_SNIPPET_CHARS:
+                line = line[:GOOGLE_SNIPPET_CHARS].rsplit(" ", 1)[0] + "..."
+            lines.append(line)
+        results.append("\n".join(lines))
+    return "\n\n".join(results)
+
+
+TOOL_COMPACTORS = {
+    "extract_recipe_from_url": _compact_extracted_recipe,
+    "google_search": _compact_google_search,
+}
+
+
+def shape_tool_output(tool_name: str, content: str) -> str:
+    """
+    Compacts a tool result: per-tool field selection, then a per-tool size cap.
+    If anything was dropped, the full output is cached and a reference is appended.
+    """
+    if not isinstance(content, str) or tool_name == "expand_tool_output":
+        return content
+
+    compactor = TOOL_COMPACTORS.get(tool_name)
+    shaped = compactor(content) if compactor else content
+
+    cap = TOOL_OUTPUT_CAPS.get(tool_name, DEFAULT_OUTPUT_CAP)
+    if len(shaped) > cap:
+        cut = shaped.rfind("\n", 0, cap)
+        shaped = shaped[:cut if cut > cap // 2 else cap]
+
+    if shaped == content:
+        return content
+
+    ref = _store_payload(content)
+    return (
+        f"{shaped}\n[Output shortened from {len(content)} chars. "
+        f"Call expand_tool_output(ref=\"{ref}\") for the full result.]"
+    )
+
+
+def shape_tool_message(message):
+    """Applies shape_tool_output to a ToolMessage produced by the ToolNode."""
+    if not isinstance(message, ToolMessage):
+        return message
+    shaped = shape_tool_output(message.name, message.content)
+    if shaped is message.content:
+        return message
+    return message.model_copy(update={"content": shaped})
+
+
+@tool
+def expand_tool_output(ref: str, offset: int = 0):
+    """
+    Returns the full text of an earlier tool result that was shortened.
+    ref: The reference from the '[Output shortened ...]' note.
+    offset: Character offset to continue reading from.
+    """
+    content = _payload_cache.get(ref)
+    if content is None:
+        return "That result has expired. Call the original tool again."
+
+    chunk = content[offset:offset + EXPAND_CHUNK_SIZE]
+    end = offset + len(chunk)
+    if end < len(content):
+        chunk += f"\n[{len(content) - end} chars remaining. Call expand_tool_output(ref=\"{ref}\", offset={end}) to continue.]"
+    return chunk
@@ -1,3 +1,4 @@
+import json
 import os
 import requests
 from langchain_core.tools import tool
@@ -7,6 +8,12 @@ import time
 import google.generativeai as genai
 from dotenv import load_dotenv
 
+from cache import TTLCache
+from ingredients import canonical_ingredient
+from rate_limit import RateLimited, scheduler
+from resilience import resilient_get
+from single_flight import params_key, single_flight
+
 load_dotenv()
 
 # --- HARDCODED GEMINI KEY ---
@@ -15,6 +22,51 @@ load_dotenv()
 
 # --- Google / SerpAPI Tools ---
 
+SERPAPI_URL = "https://serpapi.com/search"
+
+def _scheduled_get(provider: str, key_param: str, url: str, params: dict):
+    """
+    GET through the provider's scheduler: every request sent (retries and hedges
+    included) takes a token and its key, and a 402/429 moves on to the next key.
+    Raises RateLimited when no key has capacity.
+    """
+    pool = scheduler(provider)
+    keys = []
+
+    def take_token() -> dict:
+        keys.append(pool.acquire())
+        return {"params": {**params, key_param: keys[-1]}}
+
+    for _ in range(max(pool.key_count, 1)):
+        response = resilient_get(url, params=params, before_attempt=take_token)
+        pool.report(keys[-1], response.status_code, response.headers)
+        if response.status_code not in (402, 429):
+            break # Out of points / throttled: try the next key
+    return response
+
+def busy_result(e: RateLimited) -> str:
+    """What a tool returns to the model when a lookup was skipped by the rate limiter."""
+    return json.dumps(e.as_result())
+
+def _tool_error(data: dict) -> str:
+    """A failed Spoonacular result as tool output: the typed busy result, or the error."""
+    if data.get("status") == "busy":
+        return json.dumps({k: v for k, v in data.items() if k != "error"})
+    return data["error"]
+
+def _serpapi_request(params: dict) -> dict:
+    response = _scheduled_get("serpapi", "api_key", SERPAPI_URL, params)
+    response.raise_for_status()
+    return response.json()
+
+def _serpapi_get(params: dict) -> dict:
+    """
+    Calls SerpAPI and returns the JSON response. Raises on HTTP errors, and
+    RateLimited when no key has capacity (tools return busy_result() for it).
+    Identical concurrent searches share one request (single_flight).
+    """
+    return single_flight("serpapi").do(params_key(params), _serpapi_request, params)
+
 @tool
 def google_search(query: str):
     """
@@ -25,7 +77,6 @@ def google_search(query: str):
     if not api_key:
         return "Error: SERP_API_KEY not configured."
     
-    url = "https://serpapi.com/search"
     params = {
         "engine": "google",
         "q": query,
@@ -34,9 +85,7 @@ def google_search(query: str):
     }
     
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = _serpapi_get(params)
         
         results = []
         if "organic_results" in data:
@@ -54,6 +103,8 @@ def google_search(query: str):
             return "No good search results found."
             
         return "\n\n".join(results)
+    except RateLimited as e:
+        return busy_result(e)
     except Exception as e:
         return f"Error performing search: {e}"
 
@@ -66,7 +117,6 @@ def google_image_search(query: str):
     if not api_key:
         return "Error: SERP_API_KEY not configured."
 
-    url = "https://serpapi.com/search"
     params = {
         "engine": "google_images",
         "q": query,
@@ -75,37 +125,48 @@ def google_image_search(query: str):
     }
     
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = _serpapi_get(params)
         
         if "images_results" in data and len(data["images_results"]) > 0:
             # Return the original image URL
             return data["images_results"][0].get("original")
         else:
             return "No image found."
+    except RateLimited as e:
+        return busy_result(e)
     except Exception as e:
         # Graceful failure
         return f"Error searching images: {e}"
 
 # --- Spoonacular Tools ---
 
-def _spoonacular_get(endpoint: str, params: dict):
-    """Helper to call Spoonacular API"""
-    api_key = os.getenv("SPOONACULAR_API_KEY")
-    if not api_key:
-        return {"error": "SPOONACULAR_API_KEY not configured."}
-    
+def _spoonacular_request(endpoint: str, params: dict):
     base_url = "https://api.spoonacular.com"
-    params["apiKey"] = api_key
-    
     try:
-        response = requests.get(f"{base_url}{endpoint}", params=params)
+        response = _scheduled_get("spoonacular", "apiKey", f"{base_url}{endpoint}", params)
         response.raise_for_status()
         return response.json()
+    except RateLimited:
+        raise # Leaves single_flight as an exception, so higher-priority followers run their own call
     except Exception as e:
         return {"error": str(e)}
 
+def _spoonacular_get(endpoint: str, params: dict):
+    """
+    Helper to call Spoonacular API. Identical concurrent calls (same endpoint and
+    params) share one request; the result is shared, so don't mutate it.
+    """
+    api_key = os.getenv("SPOONACULAR_API_KEY")
+    if not api_key:
+        return {"error": "SPOONACULAR_API_KEY not configured."}
+    
+    try:
+        return single_flight("spoonacular").do((endpoint, params_key(params)), _spoonacular_request, endpoint, params)
+    except RateLimited as e:
+        # Still an "error" for data paths (nothing to cache), but typed as busy for tools
+        print(f"Spoonacular call skipped ({endpoint}): {e}")
+        return {"error": str(e), **e.as_result()}
+
 @tool
 def search_recipes(query: str, cuisine: str = None, diet: str = None, number: int = 5):
     """
@@ -124,7 +185,7 @@ def search_recipes(query: str, cuisine: str = None, diet: str = None, number: in
         params["diet"] = diet
         
     data = _spoonacular_get("/recipes/complexSearch", params)
-    if "error" in data: return data["error"]
+    if "error" in data: return _tool_error(data)
     
     results = []
     for r in data.get("results", []):
@@ -144,7 +205,7 @@ def search_by_nutrients(min_protein: int = 0, max_calories: int = 1000, number:
         "random": True 
     }
     data = _spoonacular_get("/recipes/findByNutrients", params)
-    if "error" in data: return data["error"]
+    if "error" in data: return _tool_error(data)
     
     results = []
     for r in data:
@@ -157,29 +218,22 @@ def find_by_ingredients(ingredients: str, number: int = 5):
     Find recipes that use the given ingredients.
     ingredients: Comma-separated list (e.g. "apples, flour, sugar")
     """
-    params = {
-        "ingredients": ingredients,
-        "number": number,
-        "ranking": 2, # Minimize missing ingredients
-        "ignorePantry": True
-    }
-    data = _spoonacular_get("/recipes/findByIngredients", params)
-    if "error" in data: return data["error"]
+    from pantry_matcher import find_recipes
+    try:
+        # Only recipes get_recipe_information can open (saved/extracted ones have no id)
+        data = find_recipes([i.strip() for i in ingredients.split(",") if i.strip()], number, sources=("spoonacular",))
+    except RateLimited as e:
+        return busy_result(e)
+    except RuntimeError as e:
+        return str(e)
     
     results = []
     for r in data:
-        missing = [i["name"] for i in r.get("missedIngredients", [])]
+        missing = r.get("missedIngredients", [])
         results.append(f"ID: {r['id']} | Title: {r['title']} | Image: {r.get('image')} | Missing: {', '.join(missing)}")
     return "\n".join(results) if results else "No recipes found."
 
-@tool
-def get_recipe_information(recipe_id: int):
-    """
-    Get full details for a specific recipe ID (instructions, ingredients).
-    """
-    data = _spoonacular_get(f"/recipes/{recipe_id}/information", {"includeNutrition": False})
-    if "error" in data: return data["error"]
-    
+def _format_recipe_information(data: dict) -> str:
     title = data.get("title")
     servings = data.get("servings")
     ready_in = data.get("readyInMinutes")
@@ -202,11 +256,40 @@ Ingredients:
 Instructions:
 {instructions}"""
 
+@tool
+def get_recipe_information(recipe_id: int):
+    """
+    Get full details for a specific recipe ID (instructions, ingredients).
+    """
+    from recipe_details import get_recipe_information as fetch_information
+    try:
+        data = fetch_information(recipe_id)
+    except RateLimited as e:
+        return busy_result(e)
+    except RuntimeError as e:
+        return str(e)
+    return _format_recipe_information(data)
+
+@tool
+def get_recipes_information_bulk(recipe_ids: list[int]):
+    """
+    Get full details for several recipe IDs at once (one request).
+    Use this instead of calling get_recipe_information repeatedly.
+    """
+    from recipe_details import get_recipes_information
+    data = get_recipes_information(recipe_ids)
+    
+    results = [f"ID: {recipe_id}\n{_format_recipe_information(data[recipe_id])}" for recipe_id in recipe_ids if recipe_id in data]
+    missing = [str(recipe_id) for recipe_id in recipe_ids if recipe_id not in data]
+    if missing:
+        results.append(f"Could not fetch: {', '.join(missing)}")
+    return "\n\n".join(results) if results else "No recipes found."
+
 @tool
 def find_similar_recipes(recipe_id: int, number: int = 3):
     """Find recipes similar to the given ID."""
     data = _spoonacular_get(f"/recipes/{recipe_id}/similar", {"number": number})
-    if "error" in data: return data["error"]
+    if "error" in data: return _tool_error(data)
     
     results = []
     for r in data:
@@ -223,7 +306,7 @@ def get_random_recipes(tags: str = None, number: int = 3):
     if tags: params["tags"] = tags
     
     data = _spoonacular_get("/recipes/random", params)
-    if "error" in data: return data["error"]
+    if "error" in data: return _tool_error(data)
     
     results = []
     for r in data.get("recipes", []):
@@ -234,7 +317,7 @@ def get_random_recipes(tags: str = None, number: int = 3):
 def extract_recipe_from_url(url: str):
     """Extract recipe data from a website URL."""
     data = _spoonacular_get("/recipes/extract", {"url": url})
-    if "error" in data: return data["error"]
+    if "error" in data: return _tool_error(data)
     
     return data
 
@@ -242,7 +325,7 @@ def extract_recipe_from_url(url: str):
 def search_ingredients(query: str, number: int = 5):
     """Search for an ingredient to get its ID."""
     data = _spoonacular_get("/food/ingredients/search", {"query": query, "number": number})
-    if "error" in data: return data["error"]
+    if "error" in data: return _tool_error(data)
     
     results = []
     for r in data.get("results", []):
@@ -253,7 +336,7 @@ def search_ingredients(query: str, number: int = 5):
 def get_ingredient_information(ingredient_id: int):
     """Get nutritional info for an ingredient ID."""
     data = _spoonacular_get(f"/food/ingredients/{ingredient_id}/information", {"amount": 100, "unit": "grams"})
-    if "error" in data: return data["error"]
+    if "error" in data: return _tool_error(data)
     
     name = data.get("name")
     nutrition = data.get("nutrition", {}).get("nutrients", [])
@@ -272,7 +355,7 @@ def create_recipe_card(recipe_id: int):
     Do NOT call this unless the user specifically asks for a visual card.
     """
     data = _spoonacular_get(f"/recipes/{recipe_id}/card", {})
-    if "error" in data: return data["error"]
+    if "error" in data: return _tool_error(data)
     
     return data.get("url", "No card URL returned.")
 
@@ -288,7 +371,7 @@ def scrape_website_text(url: str):
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        response = requests.get(url, headers=headers)
+        response = resilient_get(url, headers=headers, retries=1)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -339,7 +422,7 @@ def download_video_file(url: str, filename: str = "temp_video_recipe.mp4"):
         
     # 2. Fallback to direct request (for simple file servers)
     try:
-        with requests.get(url, stream=True) as r:
+        with resilient_get(url, stream=True, retries=1) as r:
             r.raise_for_status()
             with open(filename, 'wb') as f:
                 for chunk in r.iter_content(chunk_size=8192): 
@@ -376,21 +459,20 @@ def get_youtube_transcript(video_id: str):
     if not api_key:
         return "Error: SERP_API_KEY not set."
         
-    url = "https://serpapi.com/search"
     params = {
         "engine": "youtube_video_transcript",
         "v": video_id,
         "api_key": api_key,
     }
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = _serpapi_get(params)
         if "transcript" in data:
             transcripts = [t["snippet"] for t in data["transcript"]]
             return "\n".join(transcripts)
         else:
             return "No transcript found."
+    except RateLimited as e:
+        return busy_result(e)
     except Exception as e:
         return f"Error fetching transcript: {e}"
 
@@ -403,86 +485,110 @@ def get_youtube_description(video_id: str):
     if not api_key:
         return "Error: SERP_API_KEY not set."
 
-    url = "https://serpapi.com/search"
     params = {
         "engine": "youtube_video",
         "v": video_id,
         "api_key": api_key,
     }
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = _serpapi_get(params)
         return data.get("description", {}).get("content", "No description found.")
+    except RateLimited as e:
+        return busy_result(e)
     except Exception as e:
         return f"Error fetching description: {e}"
 
 # --- Helper Tools ---
 
+# Canonical ingredient -> Spoonacular image file; shared by the extraction graph and the app
+_ingredient_images = TTLCache(maxsize=5000, ttl=7 * 24 * 3600)
+# Names Spoonacular has no image for are retried after an hour
+_NO_IMAGE_TTL = 3600
+
+def lookup_ingredient_image(ingredient_name: str):
+    """
+    Returns the Spoonacular image file name for an ingredient, or None.
+    Looked up by canonical name, so "2 large eggs" and "Egg" share one entry.
+    """
+    key = canonical_ingredient(ingredient_name)
+    if not key:
+        return None
+    cached = _ingredient_images.get(key)
+    if cached is not None:
+        return cached or None
+
+    if not os.getenv("SPOONACULAR_API_KEY"):
+        return None
+
+    data = _spoonacular_get("/food/ingredients/search", {"query": key, "number": 1})
+    if "error" in data:
+        print(f"Spoonacular image fetch error: {data['error']}")
+        return None
+
+    image = data["results"][0]["image"] if data.get("results") else ""
+    _ingredient_images.set(key, image, ttl=None if image else _NO_IMAGE_TTL)
+    return image or None
+
+def is_ingredient_image_cached(ingredient_name: str) -> bool:
+    return canonical_ingredient(ingredient_name) in _ingredient_images
+
+def cached_ingredient_image_url(ingredient_name: str, size: str = "100x100"):
+    """Image URL from the local cache only (never calls Spoonacular)."""
+    image = _ingredient_images.get(canonical_ingredient(ingredient_name))
+    return f"https://img.spoonacular.com/ingredients_{size}/{image}" if image else None
+
+def ingredient_image_url(ingredient_name: str, size: str = "100x100"):
+    image = lookup_ingredient_image(ingredient_name)
+    if not image:
+        return None
+    # Spoonacular base URL for ingredients
+    return f"https://img.spoonacular.com/ingredients_{size}/{image}"
+
 @tool
 def get_ingredient_image_url(ingredient_name: str):
     """
     Fetches the image URL for a given ingredient name using Spoonacular.
     """
-    api_key = os.getenv("SPOONACULAR_API_KEY")
-    if not api_key:
-        return None
-    
-    url = "https://api.spoonacular.com/food/ingredients/search"
-    params = {
-        "query": ingredient_name,
-        "apiKey": api_key,
-        "number": 1
-    }
-    
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        if data.get("results"):
-            # Spoonacular base URL for ingredients
-            image_server_base = "https://img.spoonacular.com/ingredients_100x100/"
-            return f"{image_server_base}{data['results'][0]['image']}"
-    except Exception:
-        pass
-    
-    return None
+    return ingredient_image_url(ingredient_name)
 
-def search_youtube_videos(query: str, limit: int = 5):
+def fetch_youtube_videos(query: str, limit: int = 5):
     """
     Searches YouTube via SerpAPI and returns a list of video objects.
-    Reuses the SERP_API_KEY from environment variables.
+    Raises on failures (RateLimited included), so callers that cache can tell
+    "no videos" from "couldn't look".
     """
     api_key = os.getenv("SERP_API_KEY")
     if not api_key:
-        print("Error: SERP_API_KEY not configured.")
-        return []
+        raise RuntimeError("SERP_API_KEY not configured.")
 
-    url = "https://serpapi.com/search"
     params = {
         "engine": "youtube",
         "search_query": query,
         "api_key": api_key,
         "num": limit 
     }
+    data = _serpapi_get(params)
     
+    videos = []
+    if "video_results" in data:
+        for item in data["video_results"]:
+            videos.append({
+                "title": item.get("title"),
+                "link": item.get("link"),
+                "thumbnail": item.get("thumbnail", {}).get("static"),
+                "channel": item.get("channel", {}).get("name"),
+                "views": item.get("views"),
+                "length": item.get("length")
+            })
+    return videos
+
+def search_youtube_videos(query: str, limit: int = 5):
+    """
+    Searches YouTube via SerpAPI and returns a list of video objects ([] on errors).
+    Reuses the SERP_API_KEY from environment variables.
+    """
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        videos = []
-        if "video_results" in data:
-            for item in data["video_results"]:
-                videos.append({
-                    "title": item.get("title"),
-                    "link": item.get("link"),
-                    "thumbnail": item.get("thumbnail", {}).get("static"),
-                    "channel": item.get("channel", {}).get("name"),
-                    "views": item.get("views"),
-                    "length": item.get("length")
-                })
-        return videos
+        return fetch_youtube_videos(query, limit)
     except Exception as e:
         print(f"Error searching YouTube for '{query}': {e}")
         return []
@@ -511,7 +617,6 @@ def search_google_blogs(query: str, limit: int = 5):
         print("Error: SERP_API_KEY not configured.")
         return []
 
-    url = "https://serpapi.com/search"
     params = {
         "engine": "google",
         "q": query,
@@ -520,9 +625,7 @@ def search_google_blogs(query: str, limit: int = 5):
     }
     
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = _serpapi_get(params)
         
         blogs = []
         
@@ -0,0 +1,121 @@
+import os
+import select as select_module
+import threading
+import time
+import uuid
+from typing import List, NamedTuple, Optional
+from sqlmodel import select, text
+
+from cache import TTLCache
+from database import DATABASE_URL
+from models import User
+
+# --- User Profile Cache ---
+# The home feed and preferences endpoints only need (id, username, preferences).
+# That projection is cached per worker and kept fresh by:
+#   - write-through from update_preferences on the worker that handled it
+#   - Postgres NOTIFY on 'user_cache_invalidate' so every other worker drops its copy
+#   - a TTL as the safety net if a notification is missed
+# LISTEN needs a session-mode connection (Supabase pooler port 5432, not 6543).
+
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+INVALIDATION_CHANNEL = "user_cache_invalidate"
+
+# Lets a worker ignore the notifications it sent itself
+WORKER_ID = uuid.uuid4().hex[:8]
+
+_profiles = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_listener_started = False
+
+
+class UserProfile(NamedTuple):
+    id: uuid.UUID
+    username: str
+    preferences: List[str]
+
+
+async def get_user_profile(session, user_id: uuid.UUID) -> Optional[UserProfile]:
+    """Returns the cached profile projection, loading it (without the password) on a miss."""
+    profile = _profiles.get(user_id)
+    if profile is not None:
+        return profile
+
+    result = await session.exec(
+        select(User.id, User.username, User.preferences).where(User.id == user_id)
+    )
+    row = result.first()
+    if row is None:
+        return None
+
+    profile = UserProfile(id=row[0], username=row[1], preferences=row[2] or [])
+    _profiles.set(user_id, profile)
+    return profile
+
+
+def put_user_profile(profile: UserProfile) -> None:
+    """Write-through after an update on this worker."""
+    _profiles.set(profile.id, profile)
+
+
+def invalidate_user(user_id: uuid.UUID) -> None:
+    _profiles.pop(user_id)
+
+
+async def publish_user_invalidation(session, user_id: uuid.UUID) -> None:
+    """
+    Queues a NOTIFY for the other workers. Call inside the updating transaction:
+    Postgres delivers it only if the transaction commits.
+    """
+    if session.bind.dialect.name != "postgresql":
+        return
+    await session.exec(
+        text("SELECT pg_notify(:channel, :payload)"),
+        params={"channel": INVALIDATION_CHANNEL, "payload": f"{WORKER_ID}:{user_id}"}
+    )
+
+
+def _handle_notification(payload: str) -> None:
+    sender, _, user_id = payload.partition(":")
+    if sender == WORKER_ID:
+        return
+    try:
+        invalidate_user(uuid.UUID(user_id))
+    except ValueError:
+        print(f"Ignoring malformed cache invalidation: {payload}")
+
+
+def _listen_forever() -> None:
+    import psycopg2
+    import psycopg2.extensions
+
+    backoff = 1
+    while True:
+        try:
+            conn = psycopg2.connect(DATABASE_URL)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {INVALIDATION_CHANNEL};")
+            print(f"--- User cache listening on '{INVALIDATION_CHANNEL}' ---")
+            backoff = 1
+            while True:
+                if select_module.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    _handle_notification(conn.notifies.pop(0).payload)
+        except Exception as e:
+            # Entries we may have missed while disconnected could be stale
+            _profiles.clear()
+            print(f"User cache listener error, reconnecting in {backoff}s: {e}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+
+def start_invalidation_listener() -> None:
+    """Starts the background LISTEN thread (Postgres only, once per worker)."""
+    global _listener_started
+    if _listener_started or not DATABASE_URL or not DATABASE_URL.startswith("postgresql"):
+        return
+    _listener_started = True
+    threading.Thread(target=_listen_forever, name="user-cache-listener", daemon=True).start()
@@ -0,0 +1,116 @@
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Dict, List
+
+from cache import TTLCache
+from rate_limit import Priority, request_priority
+from tools import fetch_youtube_videos
+
+# --- Recommendation Topic Cache ---
+# Topics like "italian recipes" are shared by many users, so their SerpAPI
+# results are cached per topic (not per user). Entries older than
+# VIDEO_TOPIC_REFRESH_AFTER are still served but refreshed in the background,
+# so popular topics never expire on a request. Misses are fetched in parallel.
+# Background refreshes run on their own small pool, so a burst of them never
+# queues the misses a user is waiting on.
+
+VIDEO_TOPIC_TTL = int(os.getenv("VIDEO_TOPIC_TTL", 6 * 3600))
+VIDEO_TOPIC_REFRESH_AFTER = int(os.getenv("VIDEO_TOPIC_REFRESH_AFTER", 5 * 3600))
+# Topics with no videos are retried sooner; failed lookups aren't cached at all
+VIDEO_TOPIC_EMPTY_TTL = 120
+VIDEOS_PER_TOPIC = 5
+MAX_TOPICS = 3
+DEFAULT_TOPIC = "chicken recipes"
+
+_topics = TTLCache(maxsize=1000, ttl=VIDEO_TOPIC_TTL)
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="video-topics")
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="video-topics-refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def topic_key(preference: str) -> str:
+    return f"{preference.strip().lower()} recipes"
+
+
+def _fetch_topic(topic: str) -> list:
+    try:
+        videos = fetch_youtube_videos(topic, limit=VIDEOS_PER_TOPIC)
+    except Exception as e:
+        # Rate limited or upstream error: serve nothing now, ask again next time
+        print(f"Error fetching videos for '{topic}': {e}")
+        return []
+    _topics.set(topic, videos, ttl=None if videos else VIDEO_TOPIC_EMPTY_TTL)
+    return videos
+
+
+def _refresh_in_background(topic: str) -> None:
+    with _refreshing_lock:
+        if topic in _refreshing:
+            return
+        _refreshing.add(topic)
+
+    def run():
+        try:
+            with request_priority(Priority.PREFETCH):
+                _fetch_topic(topic)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(topic)
+
+    _refresh_executor.submit(run)
+
+
+def get_topic_videos(topics: List[str]) -> Dict[str, list]:
+    """Returns videos per topic: cached topics immediately, misses fetched concurrently."""
+    results = {}
+    misses = []
+    for topic in topics:
+        videos = _topics.get(topic)
+        if videos is None:
+            misses.append(topic)
+            continue
+        results[topic] = videos
+        age = _topics.age(topic)
+        if age is not None and age > VIDEO_TOPIC_REFRESH_AFTER:
+            _refresh_in_background(topic)
+
+    if misses:
+        print(f"Fetching videos for topics: {misses}")
+        for topic, videos in zip(misses, _executor.map(_fetch_topic, misses)):
+            results[topic] = videos
+    return results
+
+
+def user_feed_rng(user_id) -> random.Random:
+    """Same user + same day -> same topic sample and order, so the feed is cacheable."""
+    return random.Random(f"{user_id}:{date.today().isoformat()}")
+
+
+def build_video_feed(user_id, preferences: List[str]) -> list:
+    rng = user_feed_rng(user_id)
+
+    # Strategy: diverse sampling
+    # If user has > 3 preferences, pick 3 of them to mix.
+    if len(preferences) > MAX_TOPICS:
+        target_prefs = rng.sample(sorted(preferences), MAX_TOPICS)
+    else:
+        target_prefs = preferences
+
+    topics = [topic_key(p) for p in target_prefs] or [DEFAULT_TOPIC]
+    by_topic = get_topic_videos(topics)
+
+    all_videos = []
+    seen_links = set()
+    for topic in topics:
+        for v in by_topic.get(topic, []):
+            if v.get('link') and v['link'] not in seen_links:
+                all_videos.append(v)
+                seen_links.add(v['link'])
+
+    # Mix "Italian" and "Dessert" videos together
+    rng.shuffle(all_videos)
+    return all_videos
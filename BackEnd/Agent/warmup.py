@@ -0,0 +1,205 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from itertools import zip_longest
+from typing import List
+
+# --- Cache Warm-up ---
+# New instances start with cold caches, so the first users after a deploy pay
+# for SerpAPI/Spoonacular round trips. On startup (and on POST /warmup) a
+# background thread preloads, most popular first:
+#   - recommendation topics (user preferences, WARMUP_TOPICS)
+#   - ingredient images (most common pantry items, WARMUP_INGREDIENTS)
+#   - recipe details (WARMUP_RECIPE_IDS)
+# It stops at WARMUP_TIME_BUDGET seconds or WARMUP_REQUEST_BUDGET upstream calls.
+#
+#   python warmup.py [base_url]   -> trigger warm-up on a running server and wait for it
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+WARMUP_TIME_BUDGET = float(os.getenv("WARMUP_TIME_BUDGET", 30))
+WARMUP_REQUEST_BUDGET = int(os.getenv("WARMUP_REQUEST_BUDGET", 60))
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", 20))
+
+DEFAULT_TOPICS = ["chicken", "pasta", "italian", "dessert", "vegetarian", "healthy"]
+DEFAULT_INGREDIENTS = [
+    "egg", "milk", "butter", "flour", "sugar", "salt", "onion", "garlic",
+    "tomato", "chicken breast", "rice", "olive oil", "cheese", "potato",
+]
+
+_status = {
+    "state": "idle",  # idle | running | done | failed | disabled
+    "started_at": None,
+    "finished_at": None,
+    "requests": 0,
+    "warmed": {"topics": 0, "ingredient_images": 0, "recipe_details": 0},
+    "stopped_by": None,
+}
+_lock = threading.Lock()
+
+
+def _env_list(name: str) -> List[str]:
+    return [v.strip() for v in os.getenv(name, "").split(",") if v.strip()]
+
+
+def _merge(*lists, limit: int) -> list:
+    """Keeps first-seen order across lists, drops duplicates, caps the length."""
+    seen = set()
+    merged = []
+    for values in lists:
+        for value in values:
+            key = str(value).lower()
+            if key not in seen:
+                seen.add(key)
+                merged.append(value)
+    return merged[:limit]
+
+
+def popular_topics() -> List[str]:
+    from sqlmodel import Session, select
+    from database import engine
+    from models import User
+
+    counts = Counter()
+    try:
+        with Session(engine) as session:
+            rows = session.exec(
+                select(User.preferences).order_by(User.updated_at.desc()).limit(2000)
+            ).all()
+        for preferences in rows:
+            counts.update(p.strip().lower() for p in (preferences or []) if p.strip())
+    except Exception as e:
+        print(f"Warm-up: could not load popular topics: {e}")
+    return _merge(_env_list("WARMUP_TOPICS"), [t for t, _ in counts.most_common()], DEFAULT_TOPICS, limit=WARMUP_TOP_N)
+
+
+def popular_ingredients() -> List[str]:
+    from sqlmodel import Session, select, func
+    from database import engine
+    from ingredients import canonical_ingredient
+    from models import PantryItem
+
+    counts = Counter()
+    try:
+        name = func.lower(PantryItem.name)
+        with Session(engine) as session:
+            rows = session.exec(
+                select(name, func.count()).group_by(name).order_by(func.count().desc()).limit(WARMUP_TOP_N * 5)
+            ).all()
+        # "Eggs" and "large eggs" are one image lookup
+        for raw, count in rows:
+            key = canonical_ingredient(raw)
+            if key:
+                counts[key] += count
+    except Exception as e:
+        print(f"Warm-up: could not load popular ingredients: {e}")
+    return _merge(
+        _env_list("WARMUP_INGREDIENTS"), [k for k, _ in counts.most_common()], DEFAULT_INGREDIENTS, limit=WARMUP_TOP_N
+    )
+
+
+def popular_recipe_ids() -> List[int]:
+    return [int(v) for v in _env_list("WARMUP_RECIPE_IDS") if v.isdigit()][:WARMUP_TOP_N]
+
+
+def _jobs():
+    """(kind, is_warm, load) per item, interleaved so every cache gets part of the budget."""
+    import recipe_details
+    import tools
+    import video_feed
+
+    topics = [
+        ("topics", lambda t=t: t in video_feed._topics, lambda t=t: video_feed._fetch_topic(t))
+        for t in map(video_feed.topic_key, popular_topics())
+    ]
+    images = [
+        ("ingredient_images", lambda n=n: tools.is_ingredient_image_cached(n),
+         lambda n=n: tools.lookup_ingredient_image(n))
+        for n in popular_ingredients()
+    ]
+    recipes = [
+        ("recipe_details", lambda r=r: recipe_details.is_cached(r),
+         lambda r=r: recipe_details.get_recipe_information(r))
+        for r in popular_recipe_ids()
+    ]
+    for group in zip_longest(topics, images, recipes):
+        for job in group:
+            if job is not None:
+                yield job
+
+
+def run_warmup(time_budget: float = WARMUP_TIME_BUDGET, request_budget: int = WARMUP_REQUEST_BUDGET) -> dict:
+    from rate_limit import Priority, request_priority
+
+    with request_priority(Priority.PREFETCH):
+        return _run_warmup(time_budget, request_budget)
+
+
+def _run_warmup(time_budget: float, request_budget: int) -> dict:
+    deadline = time.monotonic() + time_budget
+    print(f"--- Cache warm-up started (budget: {time_budget}s, {request_budget} requests) ---")
+    try:
+        for kind, is_warm, load in _jobs():
+            if time.monotonic() >= deadline:
+                _status["stopped_by"] = "time_budget"
+                break
+            if _status["requests"] >= request_budget:
+                _status["stopped_by"] = "request_budget"
+                break
+            if is_warm():
+                continue
+            _status["requests"] += 1
+            try:
+                load()
+                _status["warmed"][kind] += 1
+            except Exception as e:
+                print(f"Warm-up: {kind} load failed: {e}")
+        _status["state"] = "done"
+    except Exception as e:
+        print(f"Cache warm-up failed: {e}")
+        _status["state"] = "failed"
+    _status["finished_at"] = datetime.utcnow().isoformat()
+    print(f"--- Cache warm-up finished: {_status} ---")
+    return _status
+
+
+def start_warmup() -> dict:
+    """Starts the warm-up in a background thread unless one is already running."""
+    with _lock:
+        if not WARMUP_ENABLED:
+            _status["state"] = "disabled"
+            return _status
+        if _status["state"] == "running":
+            return _status
+        _status.update({
+            "state": "running",
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "requests": 0,
+            "warmed": {"topics": 0, "ingredient_images": 0, "recipe_details": 0},
+            "stopped_by": None,
+        })
+    threading.Thread(target=run_warmup, name="cache-warmup", daemon=True).start()
+    return _status
+
+
+def warmup_status() -> dict:
+    return {**_status, "ready": _status["state"] != "running"}
+
+
+if __name__ == "__main__":
+    import requests
+
+    base_url = (sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8080").rstrip("/")
+    print(requests.post(f"{base_url}/warmup").json())
+    deadline = time.monotonic() + WARMUP_TIME_BUDGET + 30
+    while time.monotonic() < deadline:
+        health = requests.get(f"{base_url}/health").json()
+        if health["warmup"]["ready"]:
+            print(health)
+            break
+        time.sleep(2)
+    else:
+        print("Warm-up still running.")